@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+
+Measure the time spent reading settings from the configuration.
+
+The settings are read many times during the execution of a command, the script times 10,000
+calls to `C.get()` for a few typical settings and exits with a non-zero status when any of
+them exceeds the budget. Reading a section returns a copy of it, so the time grows with the
+size of the section.
+
+    python extra/config_benchmark.py
+    python extra/config_benchmark.py --budget 20 --calls 50000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mdk.config import Conf  # noqa: E402
+
+SETTINGS = [
+    'git',
+    'php',
+    'dirs.storage',
+    'db.pgsql.user',
+    'dirs',
+]
+
+DEFAULT_BUDGET = 50
+DEFAULT_CALLS = 10000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the time spent reading settings')
+    parser.add_argument('-b', '--budget', type=float, default=DEFAULT_BUDGET, metavar='MS',
+                        help='the maximum time of the calls for one setting, in milliseconds')
+    parser.add_argument('-c', '--calls', type=int, default=DEFAULT_CALLS, metavar='N',
+                        help='the number of calls per setting')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    C = Conf()
+    print('%-20s %9.1f ms' % ('Conf()', (time.perf_counter() - start) * 1000))
+
+    failed = False
+    for name in SETTINGS:
+        start = time.perf_counter()
+        for i in range(args.calls):
+            C.get(name)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        status = 'OK' if elapsed <= args.budget else 'OVER BUDGET'
+        failed = failed or elapsed > args.budget
+        print('%-20s %9.1f ms (%d calls, budget %.0f) %s' % (name, elapsed, args.calls, args.budget, status))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
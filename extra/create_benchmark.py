@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+
+Compare the creation of an instance by cloning the cached repository, and from the pool.
+
+Temporary instances are created in the storage directory and removed afterwards, they are not
+installed. The time to the instance and the disk space it uses are reported, the latter being
+split between the files only used by the instance and those shared with the cached repository
+through hard links.
+
+    python extra/create_benchmark.py
+    python extra/create_benchmark.py --version 405 --runs 3
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mdk.config import Conf  # noqa: E402
+from mdk.workplace import Workplace  # noqa: E402
+
+
+def disk_usage(path):
+    """Return the bytes used by the files only linked once, and by those linked more than once"""
+    own = 0
+    shared = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            stat = os.lstat(os.path.join(root, name))
+            if stat.st_nlink > 1:
+                shared += stat.st_blocks * 512
+            else:
+                own += stat.st_blocks * 512
+    return (own, shared)
+
+
+def create(Wp, name, version, usePool):
+    """Create an instance, and return the time it took and its disk usage"""
+    start = time.perf_counter()
+    Wp.create(name=name, version=version, usePool=usePool)
+    elapsed = time.perf_counter() - start
+    usage = disk_usage(Wp.getPath(name))
+    Wp.delete(name)
+    return (elapsed, usage)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the creation of an instance with and without the pool')
+    parser.add_argument('-v', '--version', default='main', help='the version of the instances')
+    parser.add_argument('-r', '--runs', type=int, default=1, metavar='N', help='the number of instances created per mode')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(message)s', level=logging.WARNING)
+    C = Conf()
+    Wp = Workplace()
+    pool = Wp.getPool()
+
+    # The pool is filled between the runs rather than in the background. The settings are
+    # changed in memory only, they are not saved.
+    C.data.set('pool.refillInBackground', False)
+    C.data.set('pool.stable', {args.version: 1})
+
+    results = {'clone': [], 'pool': []}
+    for i in range(max(1, args.runs)):
+        results['clone'].append(create(Wp, 'mdkbench_clone%d' % i, args.version, False))
+        pool.fill()
+        results['pool'].append(create(Wp, 'mdkbench_pool%d' % i, args.version, True))
+
+    for mode, runs in results.items():
+        elapsed = statistics.median([r[0] for r in runs])
+        own = statistics.median([r[1][0] for r in runs])
+        shared = statistics.median([r[1][1] for r in runs])
+        print('%-6s %8.2f s  %8.1f MB own  %8.1f MB shared with the cache' % (mode, elapsed, own / 1048576,
+                                                                                  shared / 1048576))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+
+Measure the throughput of dumping, and restoring, the database of an instance.
+
+The database is dumped once per compression, the time, the size of the dump and the rate at
+which it was written are reported. With --restore, each dump is also restored in a scratch
+database which is dropped afterwards.
+
+    python extra/dump_benchmark.py stable_main
+    python extra/dump_benchmark.py stable_main --compression none zst --prefix mdl_ --restore
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mdk.db import dump_database, restore_database  # noqa: E402
+from mdk.workplace import Workplace  # noqa: E402
+
+EXTENSIONS = {
+    'none': '.dump',
+    'gz': '.dump.gz',
+    'zst': '.dump.zst',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the throughput of dumping the database of an instance')
+    parser.add_argument('name', help='the name of the instance')
+    parser.add_argument('-c', '--compression', nargs='+', choices=list(EXTENSIONS.keys()), default=['none', 'gz', 'zst'],
+                        help='the compressions to measure')
+    parser.add_argument('-p', '--prefix', help='only dump the tables starting with this prefix')
+    parser.add_argument('-r', '--restore', action='store_true', help='also measure the restoration of the dumps')
+    args = parser.parse_args()
+
+    M = Workplace().get(args.name)
+    dbname = M.get('dbname')
+    dbo = M.dbo()
+
+    with tempfile.TemporaryDirectory(prefix='mdkdump') as tmpdir:
+        for compression in args.compression:
+            path = os.path.join(tmpdir, dbname + EXTENSIONS[compression])
+
+            start = time.perf_counter()
+            dump_database(dbo, dbname, path, prefix=args.prefix)
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(path) / 1048576
+            print('%-5s dump    %8.2f s  %10.1f MB  %8.1f MB/s' % (compression, elapsed, size, size / elapsed))
+
+            if args.restore:
+                scratch = dbname + '_mdkbench'
+                if dbo.dbexists(scratch):
+                    dbo.dropdb(scratch)
+                dbo.createdb(scratch)
+                try:
+                    start = time.perf_counter()
+                    restore_database(dbo, scratch, path)
+                    elapsed = time.perf_counter() - start
+                    print('%-5s restore %8.2f s  %10.1f MB  %8.1f MB/s' % (compression, elapsed, size, size / elapsed))
+                finally:
+                    dbo.dropdb(scratch)
+
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,7 @@ complete -c mdk -n __fish_use_subcommand -a path -d "Resolve paths in an instanc
 complete -c mdk -n __fish_use_subcommand -a php -d "Invoke PHP commands"
 complete -c mdk -n __fish_use_subcommand -a phpunit -d "Run PHPUnit tests"
 complete -c mdk -n __fish_use_subcommand -a plugin -d "Plugin related commands"
+complete -c mdk -n __fish_use_subcommand -a pool -d "Manage the pool of repositories"
 complete -c mdk -n __fish_use_subcommand -a precheck -d "Run pre-checks on code"
 complete -c mdk -n __fish_use_subcommand -a pull -d "Pull a branch from the tracker"
 complete -c mdk -n __fish_use_subcommand -a purge -d "Purge the caches"
@@ -26,6 +27,8 @@ complete -c mdk -n __fish_use_subcommand -a push -d "Push the branch"
 complete -c mdk -n __fish_use_subcommand -a rebase -d "Rebase branches"
 complete -c mdk -n __fish_use_subcommand -a remove -d "Delete an instance"
 complete -c mdk -n __fish_use_subcommand -a run -d "Run scripts"
+complete -c mdk -n __fish_use_subcommand -a snapshot -d "Save and restore the state of an instance"
+complete -c mdk -n __fish_use_subcommand -a status -d "Display the status of the instances"
 complete -c mdk -n __fish_use_subcommand -a tracker -d "Tracker related commands"
 complete -c mdk -n __fish_use_subcommand -a uninstall -d "Uninstall an instance"
 complete -c mdk -n __fish_use_subcommand -a update -d "Update the codebase"
@@ -46,10 +49,12 @@ complete -c mdk -n "__fish_seen_subcommand_from behat" -s n -l testname -d "Only
 complete -c mdk -n "__fish_seen_subcommand_from behat" -s t -l tags -d "Only execute features with tags matching filter expression"
 complete -c mdk -n "__fish_seen_subcommand_from behat" -s j -l no-javascript -d "Do not start Selenium and ignore Javascript"
 complete -c mdk -n "__fish_seen_subcommand_from behat" -s D -l no-dump -d "Use standard command without screenshots or output to directory"
-complete -c mdk -n "__fish_seen_subcommand_from behat" -s k -l skip-init -d "Start tests quicker when instance is already initialised"
+complete -c mdk -n "__fish_seen_subcommand_from behat" -s k -l skip-init -d "Skip checking whether the environment must be initialised again"
+complete -c mdk -n "__fish_seen_subcommand_from behat" -l parallel -x -d "Number of parallel runs, features distributed by duration"
 complete -c mdk -n "__fish_seen_subcommand_from behat" -s S -l no-selenium -d "Do not attempt to start Selenium"
 complete -c mdk -n "__fish_seen_subcommand_from behat" -l selenium -d "Path to the selenium standalone server to use"
 complete -c mdk -n "__fish_seen_subcommand_from behat" -l selenium-download -d "Force download of latest Selenium to cache"
+complete -c mdk -n "__fish_seen_subcommand_from behat" -l selenium-stop -d "Stop the Selenium server kept running"
 complete -c mdk -n "__fish_seen_subcommand_from behat" -l selenium-verbose -d "Output from selenium in the same window"
 
 # Doctor command options
@@ -65,6 +70,7 @@ complete -c mdk -n "__fish_seen_subcommand_from doctor" -l symlink -d "Check the
 complete -c mdk -n "__fish_seen_subcommand_from doctor" -l wwwroot -d "Check the $CFG->wwwroot of your instances"
 
 # Info command options
+complete -c mdk -n "__fish_seen_subcommand_from info" -s d -l databases -d "Used with --list, display the size of the databases"
 complete -c mdk -n "__fish_seen_subcommand_from info" -s e -l edit -d "Edit a configuration value"
 complete -c mdk -n "__fish_seen_subcommand_from info" -s i -l integration -d "Used with --list, only display integration instances"
 complete -c mdk -n "__fish_seen_subcommand_from info" -s l -l list -d "List the instances"
@@ -102,6 +108,24 @@ complete -c mdk -n "__fish_seen_subcommand_from plugin" -a download -d "Download
 complete -c mdk -n "__fish_seen_subcommand_from plugin" -a install -d "Install a plugin"
 complete -c mdk -n "__fish_seen_subcommand_from plugin" -a uninstall -d "Uninstall a plugin"
 
+# Pool command subcommands
+complete -c mdk -n "__fish_seen_subcommand_from pool" -a clear -d "Remove all the repositories from the pool"
+complete -c mdk -n "__fish_seen_subcommand_from pool" -a fill -d "Prepare the repositories missing from the pool"
+complete -c mdk -n "__fish_seen_subcommand_from pool" -a list -d "List the repositories in the pool"
+complete -c mdk -n "__fish_seen_subcommand_from pool; and __fish_seen_subcommand_from fill" -l no-update -d "Do not update the cached repositories first"
+complete -c mdk -n "__fish_seen_subcommand_from snapshot" -a list -d "List the snapshots of an instance"
+complete -c mdk -n "__fish_seen_subcommand_from snapshot" -a prune -d "Delete snapshots and the files no longer used"
+complete -c mdk -n "__fish_seen_subcommand_from snapshot" -a restore -d "Restore an instance to the state of a snapshot"
+complete -c mdk -n "__fish_seen_subcommand_from snapshot" -a save -d "Save the state of an instance"
+complete -c mdk -n "__fish_seen_subcommand_from snapshot; and __fish_seen_subcommand_from save" -s f -l force -d "Replace the snapshot if it exists"
+complete -c mdk -n "__fish_seen_subcommand_from snapshot; and __fish_seen_subcommand_from restore" -l no-git -d "Do not check out the commit of the snapshot"
+complete -c mdk -n "__fish_seen_subcommand_from snapshot; and __fish_seen_subcommand_from prune" -s k -l keep -d "Delete all but the N most recent snapshots"
+
+# Status command options
+complete -c mdk -n "__fish_seen_subcommand_from status" -s j -l jobs -x -d "Number of instances to probe at the same time"
+complete -c mdk -n "__fish_seen_subcommand_from status" -l json -d "Output the status in JSON"
+complete -c mdk -n "__fish_seen_subcommand_from status" -s u -l upgrade -d "Check whether the instances need upgrading"
+
 # Plugin download options
 complete -c mdk -n "__fish_seen_subcommand_from plugin; and __fish_seen_subcommand_from download" -s s -l strict -d "Prevent download of parent version if file not found"
 complete -c mdk -n "__fish_seen_subcommand_from plugin; and __fish_seen_subcommand_from download" -s f -l force -d "Override plugin directory if it exists"
@@ -139,11 +163,15 @@ complete -c mdk -n "__fish_seen_subcommand_from create" -s r -l run -d "Scripts
 complete -c mdk -n "__fish_seen_subcommand_from create" -s n -l identifier -d "Use this identifier instead of generating one"
 complete -c mdk -n "__fish_seen_subcommand_from create" -s s -l suffix -d "Suffixes for the instance names"
 complete -c mdk -n "__fish_seen_subcommand_from create" -s v -l version -d "Version of Moodle"
+complete -c mdk -n "__fish_seen_subcommand_from create" -s j -l jobs -x -d "Number of instances to create at the same time"
+complete -c mdk -n "__fish_seen_subcommand_from create" -l install-jobs -x -d "Number of instances to install at the same time"
+complete -c mdk -n "__fish_seen_subcommand_from create" -l no-template -d "Do not make the instance from an install template"
 
 # Install command options
 complete -c mdk -n "__fish_seen_subcommand_from install" -s e -o engine -l dbprofile -d "Database profile to use"
 complete -c mdk -n "__fish_seen_subcommand_from install" -s f -l fullname -d "Full name of the instance"
 complete -c mdk -n "__fish_seen_subcommand_from install" -s r -l run -d "Scripts to run after installation"
+complete -c mdk -n "__fish_seen_subcommand_from install" -l no-template -d "Do not make the instance from an install template"
 
 # Cron command options
 complete -c mdk -n "__fish_seen_subcommand_from cron" -s k -l keep-alive -d "Keep alive the cron task"
@@ -155,11 +183,12 @@ complete -c mdk -n "__fish_seen_subcommand_from phpunit" -s r -l run -d "Also ru
 complete -c mdk -n "__fish_seen_subcommand_from phpunit" -s t -l testcase -d "Testcase class to run"
 complete -c mdk -n "__fish_seen_subcommand_from phpunit" -s s -l testsuite -d "Testsuite to run"
 complete -c mdk -n "__fish_seen_subcommand_from phpunit" -s u -l unittest -d "Test file to run"
-complete -c mdk -n "__fish_seen_subcommand_from phpunit" -s k -l skip-init -d "Allows tests to start quicker when the instance is already initialised"
+complete -c mdk -n "__fish_seen_subcommand_from phpunit" -s k -l skip-init -d "Skip checking whether the environment must be initialised again"
 complete -c mdk -n "__fish_seen_subcommand_from phpunit" -s q -l stop-on-failure -d "Stop execution upon first failure or error"
 complete -c mdk -n "__fish_seen_subcommand_from phpunit" -s c -l coverage -d "Creates the HTML code coverage report"
 complete -c mdk -n "__fish_seen_subcommand_from phpunit" -l filter -d "Filter to pass through to PHPUnit"
 complete -c mdk -n "__fish_seen_subcommand_from phpunit" -l repeat -d "Run tests repeatedly for the given number of times"
+complete -c mdk -n "__fish_seen_subcommand_from phpunit" -l parallel -x -d "Number of parallel workers, testsuites distributed by duration"
 
 # Fix command options
 complete -c mdk -n "__fish_seen_subcommand_from fix" -l autofix -d "Auto fix the bug related to the issue number"
@@ -186,33 +215,20 @@ complete -c mdk -n "__fish_seen_subcommand_from purge" -s m -l manual -d "Perfor
 complete -c mdk -n "__fish_seen_subcommand_from tracker" -l open -d "Open issue in browser"
 complete -c mdk -n "__fish_seen_subcommand_from tracker" -s t -l testing -d "Testing mode"
 
-# Function to list Moodle instances for completion with caching
-function __mdk_list_instances
-    # Cache file path
-    set -l cache_file /tmp/mdk_instances_cache
-    set -l cache_timeout 300 # 5 minutes in seconds
-
-    # Check if cache exists and is recent enough
-    if test -f $cache_file
-        set -l current_time (date +%s)
-        set -l file_time (stat -c %Y $cache_file)
-        set -l time_diff (math $current_time - $file_time)
-
-        # If cache is fresh (less than 5 minutes old), use it
-        if test $time_diff -lt $cache_timeout
-            cat $cache_file
-            return
-        end
-    end
+# Function to list Moodle instances for completion
+# The cache maintained by MDK, it saves us from invoking MDK on each key stroke.
+function __mdk_cache_file
+    set -q MDK_COMPLETION_DIR; and set -l cache_dir $MDK_COMPLETION_DIR; or set -l cache_dir ~/.moodle-sdk/completion
+    set -l cache_file $cache_dir/$argv[1]
+    test -f $cache_file; and echo $cache_file
+end
 
-    # Cache is stale or doesn't exist, regenerate it
-    if command -q mdk
-        # Get instances and save to cache
-        set -l instances (command mdk info -ln 2>/dev/null)
-        if test $status -eq 0
-            printf "%s\n" $instances >$cache_file
-            printf "%s\n" $instances
-        end
+function __mdk_list_instances
+    set -l cache_file (__mdk_cache_file instances)
+    if test -n "$cache_file"
+        cat $cache_file
+    else if command -q mdk
+        command mdk info -ln 2>/dev/null
     end
 end
 
@@ -233,14 +249,20 @@ end
 
 # Function to list database profiles
 function __mdk_list_db_profiles
-    if command -q mdk
+    set -l cache_file (__mdk_cache_file dbprofiles)
+    if test -n "$cache_file"
+        cat $cache_file
+    else if command -q mdk
         command mdk config show db 2>/dev/null | grep ".engine" | cut -d '.' -f 2
     end
 end
 
 # Function to list available scripts
 function __mdk_list_scripts
-    if command -q mdk
+    set -l cache_file (__mdk_cache_file scripts)
+    if test -n "$cache_file"
+        cat $cache_file
+    else if command -q mdk
         command mdk run -l 2>/dev/null | cut -d ' ' -f 1
     end
 end
@@ -266,7 +288,22 @@ function __mdk_list_path_components
         end
     end
 
-    if test -n "$instance"
+    # Find the instance of the working directory.
+    set -l cached_instance $instance
+    set -l storage_file (__mdk_cache_file storage)
+    if test -z "$cached_instance"; and test -n "$storage_file"
+        set -l storage (cat $storage_file)
+        set -l cwd (pwd -P)/
+        if string match -q -- "$storage/*" $cwd
+            set cached_instance (string split -m 1 / (string replace -- "$storage/" '' $cwd))[1]
+        end
+    end
+
+    set -l cache_file
+    test -n "$cached_instance"; and set cache_file (__mdk_cache_file components/$cached_instance)
+    if test -n "$cache_file"
+        cat $cache_file
+    else if test -n "$instance"
         command mdk path --list-components "$instance" 2>/dev/null | string replace -r ' .*' ''
     else
         command mdk path --list-components 2>/dev/null | string replace -r ' .*' ''
@@ -280,7 +317,7 @@ function __mdk_path_wants_instance
 end
 
 # Add instance name completion where appropriate
-complete -c mdk -n "__fish_seen_subcommand_from backport behat cron info install phpunit plugin purge remove uninstall update upgrade" -a "(__mdk_list_instances)" -d "Moodle instance"
+complete -c mdk -n "__fish_seen_subcommand_from backport behat cron info install phpunit plugin purge remove status uninstall update upgrade" -a "(__mdk_list_instances)" -d "Moodle instance"
 complete -c mdk -n "__fish_seen_subcommand_from path; and __mdk_path_wants_instance" -a "(__mdk_list_instances)" -d "Moodle instance"
 
 # Add feature file completion for behat command
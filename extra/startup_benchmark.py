@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+
+Measure the time spent importing modules when starting MDK.
+
+The commands below are invoked from shell prompts and editor integrations, their startup
+must remain fast. Each command is run in a new interpreter with `python -X importtime`, the
+import time of the modules loaded after the interpreter has started is summed up, and the
+median of the runs is compared to the budget. The script exits with a non-zero status when
+a command exceeds its budget.
+
+    python extra/startup_benchmark.py
+    python extra/startup_benchmark.py --budget 80 --runs 10
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+COMMANDS = [
+    ['path'],
+    ['info', '-l'],
+]
+
+DEFAULT_BUDGET = 100
+DEFAULT_RUNS = 5
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def measure(args):
+    """Run MDK once and return the total import time in ms, and the self time of each module"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'mdk'] + args,
+                          env=env,
+                          stdin=subprocess.DEVNULL,
+                          stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE,
+                          universal_newlines=True)
+
+    total = 0
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        selftime, cumulative, indent, name = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+
+        # The lines are printed when the import completes, so the modules imported by the site
+        # module precede it. They are part of the interpreter startup, not of MDK.
+        if not indent and name == 'site':
+            total = 0
+            modules = {}
+            continue
+
+        modules[name] = selftime
+        if not indent:
+            total += cumulative
+
+    return total / 1000, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of MDK commands')
+    parser.add_argument('-b', '--budget', type=float, default=DEFAULT_BUDGET, metavar='MS',
+                        help='the maximum import time of a command, in milliseconds')
+    parser.add_argument('-r', '--runs', type=int, default=DEFAULT_RUNS, metavar='N',
+                        help='the number of runs per command')
+    parser.add_argument('-t', '--top', type=int, default=10, metavar='N',
+                        help='the number of slowest modules to report when the budget is exceeded')
+    args = parser.parse_args()
+
+    failed = False
+    for command in COMMANDS:
+        totals = []
+        slowest = {}
+        for i in range(max(1, args.runs)):
+            total, modules = measure(command)
+            totals.append(total)
+            for name, selftime in modules.items():
+                slowest[name] = max(slowest.get(name, 0), selftime)
+
+        median = statistics.median(totals)
+        status = 'OK' if median <= args.budget else 'OVER BUDGET'
+        print('mdk %-15s %7.1f ms (min %.1f, max %.1f, budget %.0f) %s' % (' '.join(command), median, min(totals),
+                                                                          max(totals), args.budget, status))
+
+        if median > args.budget:
+            failed = True
+            for name, selftime in sorted(slowest.items(), key=lambda x: x[1], reverse=True)[:args.top]:
+                print('    %7.1f ms  %s' % (selftime / 1000, name))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -32,6 +32,7 @@ def main():
     import base64
     from .command import CommandRunner
     from .commands import getCommand, commandsList
+    from .completion import refresh_completion_cache
     from .config import Conf
     from .tools import process
     from .version import __version__
@@ -119,6 +120,9 @@ def main():
         logging.error('%s: %s', e.__class__.__name__, e)
         logging.debug(''.join(traceback.format_tb(info[2])))
         sys.exit(1)
+    finally:
+        # Commands may have changed the instances, the scripts or the config.
+        refresh_completion_cache(C)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import statistics
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .tools import distribute_by_duration
+
+# The duration given to the features which have never been timed.
+DEFAULT_DURATION = 60.0
+
+# The file, in behat_dataroot, holding the fingerprint of the last initialisation.
+FINGERPRINT_FILE = 'mdk_fingerprint.json'
+
+# The parts of the fingerprint which require the environment to be initialised again when they change,
+# the others only require behat.yml to be rebuilt.
+FINGERPRINT_INSTALL_KEYS = ['versions', 'database', 'prefix', 'parallel']
+
+# Behat's pretty formatter follows the title of each scenario with its location.
+LOCATION_REGEX = re.compile(r'#\s+(\S+\.feature):\d+\s*$')
+SUMMARY_REGEX = re.compile(r'^\d+ (scenarios?|steps?) \(')
+
+
+def get_fingerprint(M, parallel=None) -> Dict[str, str]:
+    """Return the fingerprint of what the Behat environment of an instance is initialised from
+
+    The versions of the components, the database and the dependencies determine the tables and
+    data of the environment, whereas the commit checked out and config.php only affect behat.yml.
+    """
+    versions = hashlib.sha1(json.dumps(M.getComponentHashes(['version.php']), sort_keys=True).encode('utf-8'))
+
+    head = ''
+    try:
+        result = M.git().execute('rev-parse HEAD')
+        head = result[1].strip() if result[0] == 0 else ''
+    except Exception:
+        pass
+
+    config = hashlib.sha1()
+    try:
+        with open(os.path.join(M.get('path'), 'config.php'), 'rb') as f:
+            config.update(f.read())
+    except OSError:
+        pass
+
+    return {
+        'versions': versions.hexdigest(),
+        'database': '%s@%s' % (M.get('dbname'), M.get('dbhost')),
+        'prefix': M.get('behat_prefix') or '',
+        'parallel': str(parallel if parallel and parallel > 1 else 1),
+        'head': head,
+        'config': config.hexdigest(),
+    }
+
+
+def read_suite_paths(content: str) -> Dict[str, List[str]]:
+    """Return the paths of the features of each suite, from a behat.yml generated by Moodle
+
+    Moodle dumps its configuration with the YAML dumper of Symfony, which writes each key and
+    each item on its own line. This relies on it, and is not a YAML parser.
+    """
+    lines = content.splitlines()
+    suites = {}
+    for (suite, start, end) in _find_suite_paths(lines):
+        paths = suites.setdefault(suite, [])
+        for line in lines[start + 1:end]:
+            paths.append(_unquote(line.strip()[2:].strip()))
+    return suites
+
+
+def replace_suite_paths(content: str, suites: Dict[str, List[str]]) -> str:
+    """Replace the paths of the features of each suite in a behat.yml generated by Moodle"""
+    lines = content.splitlines()
+    for (suite, start, end) in reversed(list(_find_suite_paths(lines))):
+        indent = ' ' * (len(lines[start]) - len(lines[start].lstrip(' ')))
+        paths = suites.get(suite, [])
+        if not paths:
+            replacement = [indent + 'paths: {  }']
+        else:
+            replacement = [indent + 'paths:'] + [indent + '  - ' + _quote(path) for path in paths]
+        lines[start:end] = replacement
+    return '\n'.join(lines) + '\n'
+
+
+def _find_suite_paths(lines: List[str]):
+    """Yield the suite, the index of its paths key, and the index following its last path"""
+    suitesIndent = None
+    suite = None
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        indent = len(line) - len(line.lstrip(' '))
+
+        if suitesIndent is not None and indent <= suitesIndent:
+            suitesIndent = None
+        if suitesIndent is None:
+            if stripped == 'suites:':
+                suitesIndent = indent
+            continue
+
+        if indent == suitesIndent + 2 and stripped.endswith(':'):
+            suite = _unquote(stripped[:-1])
+        elif indent == suitesIndent + 4 and stripped.startswith('paths:'):
+            end = i + 1
+            if stripped == 'paths:':
+                while end < len(lines) and lines[end].strip().startswith('- ') \
+                        and len(lines[end]) - len(lines[end].lstrip(' ')) > indent:
+                    end += 1
+            yield (suite, i, end)
+
+
+def _quote(value: str) -> str:
+    return "'%s'" % value.replace("'", "''")
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1].replace("''", "'")
+    elif len(value) >= 2 and value[0] == value[-1] == '"':
+        return json.loads(value)
+    return value
+
+
+class BehatParallelRuns(object):
+    """Run the Behat features over parallel runs
+
+    Moodle prepares the runs and splits the features between them, but without considering how
+    long they take. The features are distributed again using the durations recorded during the
+    previous runs, so that the runs complete at about the same time. The configuration of each
+    run is copied to mdk.yml with the features it was given, the one of Moodle is left untouched.
+    """
+
+    _M = None
+    _completed = 0
+    _runs = 1
+    _timings = None
+    _total = 0
+    _timingsFile = None
+    _lock = None
+
+    def __init__(self, M, runs: int, timingsFile: str):
+        self._M = M
+        self._runs = runs
+        self._timingsFile = timingsFile
+        self._lock = threading.Lock()
+
+    def getConfigPath(self, run: int, mdk=False) -> Path:
+        """Return the path to the configuration file of a run"""
+        filename = 'mdk.yml' if mdk else 'behat.yml'
+        return self._M.container.behat_dataroot / ('behatrun%d' % run) / 'behat' / filename
+
+    def getTimings(self) -> Dict[str, float]:
+        """Return the durations of the features, keyed by their path relative to the root of Moodle"""
+        if self._timings is None:
+            self._timings = {}
+            try:
+                with open(self._timingsFile, 'r') as f:
+                    self._timings = json.load(f)
+            except (OSError, ValueError):
+                pass
+        return self._timings
+
+    def isInitialised(self) -> bool:
+        """Whether Behat was initialised for this number of runs"""
+        container = self._M.container
+        return container.exists(self.getConfigPath(self._runs)) and not container.exists(self.getConfigPath(self._runs + 1))
+
+    def run(self, cmd: List[str], outputDir: Optional[str] = None) -> bool:
+        """Run the runs concurrently, and return whether they all passed
+
+        The command must not set the configuration file, nor the output formats. The output of
+        the runs is followed to report the features as they complete, and to time them.
+        """
+        runs = []
+        for run in range(1, self._runs + 1):
+            runcmd = [*cmd, '--config=%s' % self.getConfigPath(run, mdk=True).as_posix(), '--format=pretty', '--out=std']
+            if outputDir:
+                runDir = Path(outputDir) / ('run%d' % run)
+                self._M.container.mkdir(runDir, 0o777)
+                runcmd += ['--format=progress', '--out=%s' % (runDir / 'progress.txt').as_posix()]
+
+            logging.debug(' '.join(runcmd))
+            proc = self._M.container.popen(runcmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding='utf-8',
+                                           errors='replace')
+            result = {'run': run, 'proc': proc, 'output': [], 'failed': [], 'summary': []}
+            thread = threading.Thread(target=self._follow, args=(result, ))
+            thread.start()
+            runs.append((thread, result))
+
+        try:
+            for thread, result in runs:
+                thread.join()
+        except KeyboardInterrupt:
+            for thread, result in runs:
+                if result['proc'].poll() is None:
+                    result['proc'].terminate()
+            for thread, result in runs:
+                thread.join()
+
+        self._saveTimings()
+
+        success = True
+        for thread, result in runs:
+            if outputDir:
+                self._M.container.writefile(Path(outputDir) / ('run%d' % result['run']) / 'pretty.txt', ''.join(result['output']))
+            logging.info('Run %d: %s', result['run'], ', '.join(result['summary']) or 'no scenarios')
+            for failed in result['failed']:
+                logging.info('  Failed: %s', failed)
+            success = success and result['proc'].returncode == 0
+
+        return success
+
+    def shard(self, feature: Optional[str] = None) -> List[Dict[str, List[str]]]:
+        """Distribute the features between the runs, and write the configuration of each run
+
+        The features can be restricted to those within a path.
+        """
+        configs = [self._M.container.readfile(self.getConfigPath(run)) for run in range(1, self._runs + 1)]
+
+        suites = set()
+        features = set()
+        for config in configs:
+            for suite, paths in read_suite_paths(config).items():
+                suites.add(suite)
+                features.update((suite, path) for path in paths)
+
+        if feature:
+            feature = feature.rstrip('/')
+            features = [(suite, path) for (suite, path) in features if path == feature or path.startswith(feature + '/')]
+
+        timings = self.getTimings()
+        default = statistics.median(timings.values()) if timings else DEFAULT_DURATION
+        durations = {(suite, path): timings.get(self._relpath(path), default) for (suite, path) in features}
+
+        (buckets, loads) = distribute_by_duration(durations, self._runs)
+        shards = [{} for i in range(self._runs)]
+        for i, bucket in enumerate(buckets):
+            for (suite, path) in bucket:
+                shards[i].setdefault(suite, []).append(path)
+        self._total = len(features)
+
+        for i, config in enumerate(configs):
+            paths = {suite: shards[i].get(suite, []) for suite in suites}
+            self._M.container.writefile(self.getConfigPath(i + 1, mdk=True), replace_suite_paths(config, paths))
+            logging.debug('Run %d: %d features, estimated to %d seconds', i + 1, sum(len(p) for p in paths.values()), loads[i])
+
+        return shards
+
+    def _follow(self, result):
+        """Follow the output of a run, report the features it completes and time them"""
+        proc = result['proc']
+        current = None
+        started = None
+        inFailed = False
+
+        for line in proc.stdout:
+            result['output'].append(line)
+            stripped = line.strip()
+
+            if SUMMARY_REGEX.match(stripped):
+                result['summary'].append(stripped)
+            elif stripped.startswith('--- Failed scenarios'):
+                inFailed = True
+
+            # The feature completes when the next one starts, or when the summary is printed.
+            if current and (inFailed or result['summary']):
+                self._complete(result['run'], current, time.monotonic() - started)
+                current = None
+
+            match = LOCATION_REGEX.search(stripped)
+            if not match:
+                match = re.match(r'^(\S+\.feature:\d+)$', stripped) if inFailed else None
+                if match:
+                    result['failed'].append(self._relpath(match.group(1)))
+                continue
+
+            feature = self._relpath(match.group(1))
+            if inFailed or feature == current:
+                continue
+            if current:
+                self._complete(result['run'], current, time.monotonic() - started)
+            current = feature
+            started = time.monotonic()
+
+        proc.wait()
+        if current:
+            self._complete(result['run'], current, time.monotonic() - started)
+
+    def _complete(self, run, feature, duration):
+        with self._lock:
+            self.getTimings()[feature] = round(duration, 1)
+            self._completed += 1
+            logging.info('[run %d] %d/%d %s (%.1fs)', run, self._completed, self._total, feature, duration)
+
+    def _relpath(self, path: str) -> str:
+        root = self._M.container.path.as_posix().rstrip('/') + '/'
+        return path[len(root):] if path.startswith(root) else path
+
+    def _saveTimings(self):
+        try:
+            with open(self._timingsFile, 'w') as f:
+                json.dump(self.getTimings(), f, indent=2, sort_keys=True)
+        except OSError as e:
+            logging.warning('Could not save the durations of the features: %s', e)
@@ -23,9 +23,6 @@ http://github.com/FMCorz/mdk
 """
 
 import logging
-from jenkinsapi import jenkins
-from jenkinsapi.custom_exceptions import JenkinsAPIException, TimeOut
-from jenkinsapi.utils.crumb_requester import CrumbRequester
 from .config import Conf
 
 C = Conf()
@@ -64,6 +61,8 @@ class CI(object):
         logger.setLevel(logging.WARNING)
 
         # Loads the jenkins object.
+        from jenkinsapi import jenkins
+        from jenkinsapi.utils.crumb_requester import CrumbRequester
         self._jenkins = jenkins.Jenkins(self.url, requester=CrumbRequester(baseurl=self.url))
 
     def precheckRemoteBranch(self, remote, branch, integrateto, issue=None):
@@ -76,6 +75,8 @@ class CI(object):
         if issue:
             params['issue'] = issue
 
+        from jenkinsapi.custom_exceptions import JenkinsAPIException, TimeOut
+
         job = self.jenkins.get_job('Precheck remote branch')
 
         try:
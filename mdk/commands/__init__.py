@@ -46,6 +46,7 @@ commandsList = [
     'php',
     'phpunit',
     'plugin',
+    'pool',
     'precheck',
     'pull',
     'purge',
@@ -53,6 +54,8 @@ commandsList = [
     'rebase',
     'remove',
     'run',
+    'snapshot',
+    'status',
     'tracker',
     'uninstall',
     'update',
@@ -29,12 +29,18 @@ import logging
 import gzip
 import json
 from tempfile import gettempdir
-from time import sleep
 from ..command import Command
-from ..tools import get_absolute_path, process, ProcessInThread, downloadProcessHook, question, natural_sort_key
+from ..container import DockerContainer
+from ..selenium import DEFAULT_PORT, find_docker_selenium, is_docker_selenium_ready, is_selenium_ready, \
+    start_kept_selenium, stop_kept_selenium, wait_until
+from ..supervisor import Supervisor
+from ..tools import get_absolute_path, process, downloadProcessHook, question, natural_sort_key
 
 
 class BehatCommand(Command):
+
+    _supervisor = None
+
     _arguments = [
         (
             ['-r', '--run'],
@@ -119,7 +125,19 @@ class BehatCommand(Command):
             {
                 'action': 'store_true',
                 'dest': 'skipinit',
-                'help': 'allows tests to start quicker when the instance is already initialised'
+                'help': 'skip checking whether the environment must be initialised again'
+            },
+        ),
+        (
+            ['--parallel'],
+            {
+                'default': 0,
+                'dest': 'parallel',
+                'help':
+                    'the number of parallel runs. The features are distributed between the runs based on how long '
+                    'they took previously.',
+                'metavar': 'N',
+                'type': int
             },
         ),
         (
@@ -147,6 +165,14 @@ class BehatCommand(Command):
                 'help': 'force the download of the latest Selenium to the cache'
             },
         ),
+        (
+            ['--selenium-stop'],
+            {
+                'action': 'store_true',
+                'dest': 'seleniumstop',
+                'help': 'stop the Selenium server kept running by the setting behat.keepSelenium, and exit'
+            },
+        ),
         (
             ['--selenium-verbose'],
             {
@@ -171,6 +197,10 @@ class BehatCommand(Command):
         withselenium = not (args.noselenium or args.nojavascript)
         shouldrun = args.run or args.rerun
 
+        if args.seleniumstop:
+            logging.info('%d Selenium server(s) stopped', stop_kept_selenium())
+            return
+
         # Loading instance
         M = self.Wp.resolve(args.name)
         if not M:
@@ -184,14 +214,28 @@ class BehatCommand(Command):
         if not M.get('installed'):
             raise Exception('This instance needs to be installed first')
 
+        # Parallel runs
+        parallel = args.parallel if args.parallel > 1 else None
+        if parallel and M.branch_compare(33, '<'):
+            raise Exception('Parallel runs are only supported from Moodle 3.3')
+
         # Disable Behat
         if args.disable and not args.run:
             self.disable(M)
             return
 
+        # The instances running in Docker use the Selenium container started by `mdk docker selenium up`.
+        dockerSelenium = None
+        if withselenium and isinstance(M.container, DockerContainer):
+            dockerSelenium = find_docker_selenium()
+            if dockerSelenium:
+                logging.info('Using the Selenium container %s', dockerSelenium)
+                withselenium = False
+
         # No Javascript
         nojavascript = args.nojavascript
-        if not nojavascript and not self.C.get('java') or not os.path.isfile(os.path.abspath(self.C.get('java'))):
+        if not dockerSelenium and (not nojavascript and not self.C.get('java')
+                                   or not os.path.isfile(os.path.abspath(self.C.get('java')))):
             nojavascript = True
             logging.info('Disabling Javascript because Java is required to run Selenium and could not be found.')
 
@@ -231,10 +275,22 @@ class BehatCommand(Command):
             outputDir = (M.container.behat_faildumps or Path(self.Wp.getExtraDir(M.get('identifier'), 'behat'))).as_posix()
             outpurUrl = self.Wp.getUrl(M.get('identifier'), extra='behat')
 
-            if not args.skipinit:
-                logging.info('Initialising Behat, please be patient!')
-                M.initBehat(force=args.force, prefix=prefix, faildumppath=outputDir)
-                logging.info('Behat ready!')
+            parallelRuns = None
+            if parallel:
+                from ..behat import BehatParallelRuns
+                timingsFile = os.path.join(self.Wp.getExtraDir(M.get('identifier'), 'behat'), 'timings.json')
+                parallelRuns = BehatParallelRuns(M, parallel, timingsFile)
+
+            # The environment is only initialised again when something it depends on changed.
+            if not args.skipinit or (parallelRuns and not parallelRuns.isInitialised()):
+                snapshots = None
+                if self.C.get('testSnapshots') and not parallel:
+                    from ..testsnapshots import TestSnapshots
+                    snapshots = TestSnapshots(M, 'behat', prefix or M.get('behat_prefix') or 'zbehat_', M.container.behat_dataroot,
+                                              self.Wp.getExtraDir(M.get('identifier'), 'snapshots'),
+                                              keep=int(self.C.get('testSnapshots')))
+                if M.initBehat(force=args.force, prefix=prefix, faildumppath=outputDir, parallel=parallel, snapshots=snapshots):
+                    logging.info('Behat ready!')
 
             # Preparing Behat command
             cmd = ['vendor/bin/behat']
@@ -253,6 +309,9 @@ class BehatCommand(Command):
             if args.rerun:
                 cmd.append('--rerun')
 
+            # The parallel runs each have their configuration and outputs.
+            parallelCmd = list(cmd)
+
             if args.faildump:
                 if M.branch_compare(31, '<'):
                     cmd.append('--format="progress,progress,pretty,html,failed"')
@@ -265,67 +324,69 @@ class BehatCommand(Command):
                     cmd.append('--format=pretty')
                     cmd.append('--out={0}/pretty.txt'.format(outputDir))
 
-            # Since Moodle 3.2.2 behat directory is kept under $CFG->behat_dataroot for single and parallel runs.
-            configcandidates = ['%s/behatrun/behat/behat.yml' % M.container.behat_dataroot.as_posix()]
-            if M.branch_compare(32, '<'):
-                configcandidates.append('%s/behat/behat.yml' % M.container.behat_dataroot.as_posix())
-            cmd.append('--config=%s' % (list(filter(lambda x: M.container.exists(Path(x)), configcandidates))[0]))
+            if parallelRuns:
+                # The feature restricts the features distributed between the runs.
+                parallelRuns.shard(M.get_file_path(args.feature).as_posix() if args.feature else None)
+
+            else:
+                # Since Moodle 3.2.2 behat directory is kept under $CFG->behat_dataroot for single and parallel runs.
+                configcandidates = ['%s/behatrun/behat/behat.yml' % M.container.behat_dataroot.as_posix()]
+                if M.branch_compare(32, '<'):
+                    configcandidates.append('%s/behat/behat.yml' % M.container.behat_dataroot.as_posix())
+                cmd.append('--config=%s' % (list(filter(lambda x: M.container.exists(Path(x)), configcandidates))[0]))
 
-            # Checking feature argument. Assume either a path relative to the dirroot, or absolute within dirroot.
-            if args.feature:
-                cmd.append(M.get_file_path(args.feature).as_posix())
+                # Checking feature argument. Assume either a path relative to the dirroot, or absolute within dirroot.
+                if args.feature:
+                    cmd.append(M.get_file_path(args.feature).as_posix())
 
-            seleniumCommand = None
+            seleniumCommands = []
             if seleniumPath:
-                if self.C.get('behat.useSeleniumGrid'):
-                    seleniumCommand = '%s -jar %s standalone' % (self.C.get('java'), seleniumPath)
-                else:
-                    seleniumCommand = '%s -jar %s' % (self.C.get('java'), seleniumPath)
+                seleniumCommands = self.getSeleniumCommands(seleniumPath, parallel)
 
             if shouldrun:
                 logging.info('Preparing Behat testing')
 
-                # Launching Selenium
-                seleniumServer = None
-                if seleniumPath and withselenium:
-                    logging.info('Starting Selenium server')
-                    kwargs = {}
-                    if args.seleniumverbose:
-                        kwargs['stdout'] = None
-                        kwargs['stderr'] = None
-                    else:
-                        # Logging Selenium to a temporary file, this can be useful, and also it appears
-                        # that Selenium hangs when stderr is not buffered.
-                        fileOutPath = os.path.join(gettempdir(), 'selenium_%s_out.log' % (M.get('identifier')))
-                        fileErrPath = os.path.join(gettempdir(), 'selenium_%s_err.log' % (M.get('identifier')))
-                        tmpfileOut = open(fileOutPath, 'w')
-                        tmpfileErr = open(fileErrPath, 'w')
-                        logging.debug('Logging Selenium output to: %s' % (fileOutPath))
-                        logging.debug('Logging Selenium errors to: %s' % (fileErrPath))
-                        kwargs['stdout'] = tmpfileOut
-                        kwargs['stderr'] = tmpfileErr
-                    seleniumServer = ProcessInThread(seleniumCommand, **kwargs)
-                    seleniumServer.start()
+                # Launching Selenium, unless it is already running, and waiting for it to be ready.
+                seleniumServers = []
+                if dockerSelenium:
+                    self.waitForSelenium(lambda: is_docker_selenium_ready(dockerSelenium), dockerSelenium)
+
+                elif seleniumPath and withselenium:
+                    starting = []
+                    for i, (seleniumCommand, port) in enumerate(seleniumCommands):
+                        if is_selenium_ready(port):
+                            logging.info('Using the Selenium server already running on port %d', port)
+                            continue
+                        seleniumServer = self.startSelenium(seleniumCommand, M, port, i if parallel else None, args.seleniumverbose)
+                        if seleniumServer:
+                            seleniumServers.append(seleniumServer)
+                        starting.append((port, seleniumServer))
+
+                    try:
+                        for port, seleniumServer in starting:
+                            self.waitForSelenium(self.getSeleniumProbe(port, seleniumServer), 'port %d' % port)
+                    except Exception:
+                        for seleniumServer in seleniumServers:
+                            seleniumServer.stop()
+                        raise
 
                 logging.info('Running Behat tests')
 
-                # Sleep for a few seconds before starting Behat
-                if seleniumServer:
-                    launchSleep = int(self.C.get('behat.launchSleep'))
-                    logging.debug('Waiting for %d seconds to allow Selenium to start ' % (launchSleep))
-                    sleep(launchSleep)
-
                 # Running the tests
                 try:
                     if args.faildump:
                         logging.info('More output can be found at:\n %s\n %s', outputDir, outpurUrl)
-                    M.exec(cmd, stdout=None, stderr=None)
+                    if parallelRuns:
+                        if not parallelRuns.run(parallelCmd, outputDir if args.faildump else None):
+                            logging.warning('Some of the runs have failed')
+                    else:
+                        M.exec(cmd, stdout=None, stderr=None)
                 except KeyboardInterrupt:
                     pass
 
-                # Kill the remaining processes
-                if seleniumServer and seleniumServer.is_alive():
-                    seleniumServer.kill()
+                # Stop the remaining processes
+                for seleniumServer in seleniumServers:
+                    seleniumServer.stop()
 
                 # Disable Behat
                 if args.disable:
@@ -334,13 +395,86 @@ class BehatCommand(Command):
             else:
                 if args.faildump:
                     logging.info('More output will be accessible at:\n %s\n %s', outputDir, outpurUrl)
-                if seleniumCommand:
-                    logging.info('Launch Selenium (optional):\n %s' % (seleniumCommand))
-                logging.info('Launch Behat:\n %s' % (' '.join(cmd)))
+                if seleniumCommands:
+                    logging.info('Launch Selenium (optional):\n %s' % ('\n '.join(c for (c, port) in seleniumCommands)))
+                if parallelRuns:
+                    logging.info('Launch the Behat runs:')
+                    for run in range(1, parallel + 1):
+                        logging.info(' %s --config=%s', ' '.join(parallelCmd), parallelRuns.getConfigPath(run, mdk=True).as_posix())
+                else:
+                    logging.info('Launch Behat:\n %s' % (' '.join(cmd)))
 
         except Exception as e:
             raise e
 
+    def getSeleniumCommands(self, seleniumPath, parallel=None):
+        """Return the commands to start Selenium, and the port each listens on
+
+        The parallel runs share the same Selenium, unless $CFG->behat_parallel_run gives them
+        different ports through wd_host, in which case a Selenium is started on each port.
+        """
+        useSeleniumGrid = self.C.get('behat.useSeleniumGrid')
+        command = '%s -jar %s' % (self.C.get('java'), seleniumPath)
+        if useSeleniumGrid:
+            command += ' standalone'
+
+        ports = []
+        if parallel:
+            for run in (self.C.get('forceCfg.behat_parallel_run') or [])[:parallel]:
+                match = re.search(r':(\d+)', run.get('wd_host', '')) if isinstance(run, dict) else None
+                if match and int(match.group(1)) not in ports:
+                    ports.append(int(match.group(1)))
+
+        if ports:
+            portOption = '--port' if useSeleniumGrid else '-port'
+            return [('%s %s %d' % (command, portOption, port), port) for port in ports]
+        elif parallel and useSeleniumGrid:
+            return [('%s --max-sessions %d --override-max-sessions true' % (command, parallel), DEFAULT_PORT)]
+        return [(command, DEFAULT_PORT)]
+
+    def getSeleniumProbe(self, port, seleniumServer=None):
+        """Return a probe telling whether Selenium is ready, which fails when the server has exited"""
+
+        def probe():
+            if seleniumServer and not seleniumServer.isAlive():
+                log = seleniumServer.getStatus()['log']
+                raise Exception('Selenium exited with code %d%s' % (seleniumServer.returncode, ', see %s' % log if log else ''))
+            return is_selenium_ready(port)
+
+        return probe
+
+    def startSelenium(self, seleniumCommand, M, port, index=None, verbose=False):
+        """Start Selenium under supervision, and return its process
+
+        With the setting behat.keepSelenium, Selenium is started in the background to be used by the
+        following runs, and None is returned.
+        """
+        logging.info('Starting Selenium server')
+        if self.C.get('behat.keepSelenium') and not verbose:
+            logPath = os.path.join(gettempdir(), 'selenium_%d.log' % port)
+            logging.debug('Logging Selenium output to: %s' % (logPath))
+            start_kept_selenium(seleniumCommand, port, logPath)
+            logging.info('Selenium will keep running for the following runs, stop it with --selenium-stop')
+            return None
+
+        logPath = None
+        if not verbose:
+            # Logging Selenium to a file, this can be useful, and Selenium hangs when its output is not read.
+            suffix = '' if index is None else '_%d' % index
+            logPath = os.path.join(gettempdir(), 'selenium_%s%s.log' % (M.get('identifier'), suffix))
+            logging.debug('Logging Selenium output to: %s' % (logPath))
+
+        if not self._supervisor:
+            self._supervisor = Supervisor()
+        return self._supervisor.start(seleniumCommand, logPath=logPath, probe=lambda: is_selenium_ready(port))
+
+    def waitForSelenium(self, probe, description):
+        """Wait for Selenium to be ready, or raise an exception after the timeout"""
+        timeout = int(self.C.get('behat.seleniumTimeout'))
+        logging.debug('Waiting for Selenium (%s) to be ready, for up to %d seconds' % (description, timeout))
+        if not wait_until(probe, timeout):
+            raise Exception('Selenium (%s) was not ready after %d seconds' % (description, timeout))
+
     def disable(self, M):
         logging.info('Disabling Behat')
         M.cli('admin/tool/behat/cli/util.php', ['--disable'])
@@ -21,8 +21,12 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 http://github.com/FMCorz/mdk
 """
 
+import os
 import re
 import logging
+import subprocess
+import threading
+import time
 
 from mdk.config import Conf
 
@@ -62,6 +66,42 @@ class CreateCommand(Command):
                     'dest': 'dbprofile'
                 },
             ),
+            (
+                ['--force-refresh'],
+                {
+                    'action': 'store_true',
+                    'dest': 'forcerefresh',
+                    'help': 'fetch the cached repositories even when they were recently fetched',
+                },
+            ),
+            (
+                ['--no-template'],
+                {
+                    'action': 'store_false',
+                    'dest': 'usetemplate',
+                    'help': 'run the installation script rather than making the instance from an install template',
+                },
+            ),
+            (
+                ['-j', '--jobs'],
+                {
+                    'default': 1,
+                    'dest': 'jobs',
+                    'help': 'number of instances to create at the same time',
+                    'metavar': 'N',
+                    'type': int,
+                },
+            ),
+            (
+                ['--install-jobs'],
+                {
+                    'default': 1,
+                    'dest': 'installjobs',
+                    'help': 'with --jobs, number of instances to install at the same time',
+                    'metavar': 'N',
+                    'type': int,
+                },
+            ),
             (
                 ['-t', '--integration'],
                 {
@@ -126,36 +166,135 @@ class CreateCommand(Command):
         # if engine and not install:
         # self.argumentError('--engine can only be used with --install.')
 
+        items = []
         for version in versions:
             for suffix in suffixes:
-                arguments = {
+                items.append({
                     'version': version,
                     'suffix': suffix,
                     'dbprofile': dbprofile,
                     'integration': args.integration,
                     'identifier': args.identifier,
                     'install': install,
-                    'run': args.run
-                }
-                self.do(arguments)
-                logging.info('')
+                    'run': args.run,
+                    'usetemplate': args.usetemplate,
+                })
+
+        if args.jobs > 1 and len(items) > 1:
+            self.runPipelined(items, args.jobs, args.installjobs, args.forcerefresh)
+            return
+
+        # The cached repositories only need to be refreshed once.
+        forcerefresh = args.forcerefresh
+        for arguments in items:
+            arguments['forcerefresh'] = forcerefresh
+            self.do(arguments)
+            forcerefresh = False
+            logging.info('')
 
         logging.info('Process complete!')
 
-    def do(self, args):
-        """Proceeds to the creation of an instance"""
+    def runPipelined(self, items, jobs, installJobs, forceRefresh):
+        """Create the instances concurrently
+
+        The cached repositories are updated once, then the instances are cloned at the same time,
+        and installed as soon as they are ready, no more than installJobs at once. The log records
+        are prefixed with the name of their instance, and the output of the installation is written
+        to the file install.log in the extra directory of the instance. A failure only affects its instance.
+        """
+
+        integration = any(item['integration'] for item in items)
+        stable = not all(item['integration'] for item in items)
+        self.Wp.checkCachedClones(stable=stable, integration=integration)
+        logging.info('Updating cached repositories...')
+        self.Wp.updateCachedClones(stable=stable, integration=integration, verbose=False, force=forceRefresh)
+
+        # The questions are asked before starting as the jobs cannot prompt.
+        names = set()
+        for item in items:
+            item['name'] = self.Wp.generateInstanceName(item['version'], integration=item['integration'],
+                suffix=item['suffix'], identifier=item['identifier'])
+            if item['name'] in names:
+                raise Exception('The instance %s would be created more than once' % item['name'])
+            names.add(item['name'])
+            item['updatecache'] = False
+            item['dropdb'] = False
+            if item['install']:
+                dbname = self.getDbName(item['name'])
+                if get_dbo_from_profile(C.get('db.%s' % item['dbprofile'])).dbexists(dbname):
+                    logging.info('Database already exists (%s)' % dbname)
+                    item['dropdb'] = yesOrNo('Do you want to remove it?')
+
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        installLock = threading.BoundedSemaphore(max(1, installJobs))
+        prefixer = _InstanceLogFilter()
+        handlers = logging.getLogger().handlers
+        for handler in handlers:
+            handler.addFilter(prefixer)
+
+        def create(item):
+            prefixer.register(item['name'])
+            started = time.monotonic()
+            try:
+                return (self.do(item, installLock=installLock) is True, time.monotonic() - started)
+            except Exception as e:
+                logging.exception('Unexpected error: %s' % e)
+                return (False, time.monotonic() - started)
+            finally:
+                prefixer.unregister()
+
+        failed = []
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = {executor.submit(create, item): item['name'] for item in items}
+                for future in as_completed(futures):
+                    (success, duration) = future.result()
+                    if success:
+                        logging.info('%s: ready in %d seconds' % (futures[future], duration))
+                    else:
+                        failed.append(futures[future])
+                        logging.warning('%s: failed after %d seconds' % (futures[future], duration))
+        finally:
+            for handler in handlers:
+                handler.removeFilter(prefixer)
+
+        logging.info('Process complete!')
+        if failed:
+            logging.info('')
+            logging.warning('⚠️ Some errors occurred on the following instances:')
+            for name in sorted(failed):
+                logging.warning('- %s' % name)
+            raise Exception('%d of the %d instances could not be created' % (len(failed), len(items)))
+
+    def getDbName(self, name):
+        """Return the name of the database of an instance"""
+        dbname = re.sub(r'[^a-zA-Z0-9]', '', name).lower()
+        prefixDbname = self.C.get('db.namePrefix')
+        if prefixDbname:
+            dbname = prefixDbname + dbname
+        return dbname[:28]
+
+    def do(self, args, installLock=None):
+        """Proceeds to the creation of an instance
+
+        The installation waits for the installLock when one is given, and its output is then
+        written to a file. Returns True on success.
+        """
 
         # TODO Remove these ugly lines, but I'm lazy to rewrite the variables in this method...
         class Bunch:
             __init__ = lambda self, **kw: setattr(self, '__dict__', kw)
 
-        args = Bunch(**args)
+        args = Bunch(**{'forcerefresh': False, 'name': None, 'updatecache': True, 'dropdb': None, 'usetemplate': True,
+                       **args})
 
         dbprofilename = args.dbprofile
         dbprofile = C.get('db.%s' % args.dbprofile)
         engine = dbprofile['engine']
         version = args.version
-        name = self.Wp.generateInstanceName(version, integration=args.integration, suffix=args.suffix, identifier=args.identifier)
+        name = args.name or self.Wp.generateInstanceName(
+            version, integration=args.integration, suffix=args.suffix, identifier=args.identifier)
 
         # Wording version
         versionNice = version
@@ -174,7 +313,13 @@ class CreateCommand(Command):
 
         # Create the instance
         logging.info('Creating instance %s...' % name)
-        kwargs = {'name': name, 'version': version, 'integration': args.integration}
+        kwargs = {
+            'name': name,
+            'version': version,
+            'integration': args.integration,
+            'forceRefresh': args.forcerefresh,
+            'updateCache': args.updatecache,
+        }
         try:
             M = self.Wp.create(**kwargs)
         except CreateException as e:
@@ -187,14 +332,10 @@ class CreateCommand(Command):
         if args.install:
 
             # Checking database
-            dbname = re.sub(r'[^a-zA-Z0-9]', '', name).lower()
-            prefixDbname = self.C.get('db.namePrefix')
-            if prefixDbname:
-                dbname = prefixDbname + dbname
-            dbname = dbname[:28]
+            dbname = self.getDbName(name)
             dbo = get_dbo_from_profile(dbprofile)
-            dropDb = False
-            if dbo.dbexists(dbname):
+            dropDb = bool(args.dropdb)
+            if args.dropdb is None and dbo.dbexists(dbname):
                 logging.info('Database already exists (%s)' % dbname)
                 dropDb = yesOrNo('Do you want to remove it?')
 
@@ -205,21 +346,70 @@ class CreateCommand(Command):
                 'dropDb': dropDb,
                 'fullname': fullname,
                 'dataDir': self.Wp.getPath(name, 'data'),
+                'useTemplate': args.usetemplate,
             }
+            # The output of concurrent installations is written to a file.
+            stdio = {}
+            if installLock:
+                stdio['stdout'] = open(os.path.join(self.Wp.getExtraDir(name), 'install.log'), 'w')
+                stdio['stderr'] = subprocess.STDOUT
+
             try:
+                if not self.installInstance(M, kwargs, installLock, stdio):
+                    return False
+
+                # Running scripts
+                if M.isInstalled() and type(args.run) == list:
+                    for script in args.run:
+                        logging.info('Running script \'%s\'' % (script))
+                        try:
+                            M.runScript(script, **stdio)
+                        except Exception as e:
+                            logging.warning('Error while running the script \'%s\':s  %s' % (script, e))
+            finally:
+                if stdio:
+                    stdio['stdout'].close()
+
+        return True
+
+    def installInstance(self, M, kwargs, installLock, stdio):
+        """Install an instance, waiting for the installLock if any. Returns True on success"""
+        name = M.get('identifier')
+        try:
+            if installLock:
+                logging.info('Waiting to install...')
+                with installLock:
+                    M.install(**kwargs, **stdio)
+            else:
                 M.install(**kwargs)
-            except InstallException as e:
-                logging.warning('Error while installing %s:\n  %s' % (name, e))
-                return False
-            except Exception as e:
-                logging.exception('Error while installing %s:\n  %s' % (name, e))
-                return False
-
-            # Running scripts
-            if M.isInstalled() and type(args.run) == list:
-                for script in args.run:
-                    logging.info('Running script \'%s\'' % (script))
-                    try:
-                        M.runScript(script)
-                    except Exception as e:
-                        logging.warning('Error while running the script \'%s\':s  %s' % (script, e))
+        except InstallException as e:
+            logging.warning('Error while installing %s:\n  %s' % (name, e))
+            return False
+        except Exception as e:
+            logging.exception('Error while installing %s:\n  %s' % (name, e))
+            return False
+        finally:
+            self.Wp.getIndex().refresh(name)
+        return True
+
+
+class _InstanceLogFilter(logging.Filter):
+    """Prefixes the log records with the name of the instance the thread is working on"""
+
+    def __init__(self):
+        logging.Filter.__init__(self)
+        self._local = threading.local()
+
+    def filter(self, record):
+        name = getattr(self._local, 'name', None)
+        if name and not getattr(record, 'instance', None):
+            record.instance = name
+            record.msg = '[%s] %s' % (name, record.getMessage())
+            record.args = None
+        return True
+
+    def register(self, name):
+        self._local.name = name
+
+    def unregister(self):
+        self._local.name = None
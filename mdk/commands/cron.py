@@ -22,6 +22,7 @@ http://github.com/FMCorz/mdk
 """
 
 import logging
+import os
 from ..command import Command
 
 
@@ -93,4 +94,20 @@ class CronCommand(Command):
                 logging.warn('Option --keep-alive is not available for on older versions than 4.1')
             # Other versions keep-live by default, so no need for additional argument.
 
-        M.cli('admin/cli/cron.php', args=cliargs, stdout=None, stderr=None)
+        if not args.keepalive:
+            M.cli('admin/cli/cron.php', args=cliargs, stdout=None, stderr=None)
+            return
+
+        # The cron keeps running until interrupted, its output is also logged so that it can be reviewed.
+        from ..supervisor import Supervisor
+        logPath = os.path.join(self.Wp.getExtraDir(M.get('identifier')), 'cron.log')
+        logging.info('Logging the output to %s' % (logPath))
+        supervisor = Supervisor()
+        cron = supervisor.start(['php', str(M.get_file_path('admin/cli/cron.php')), *cliargs], logPath=logPath, echo=True,
+                                popen=M.container.popen)
+        try:
+            cron.wait()
+        except KeyboardInterrupt:
+            logging.info('Stopping cron')
+        finally:
+            supervisor.stopAll()
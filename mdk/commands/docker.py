@@ -24,12 +24,13 @@ import json
 import logging
 import re
 from pathlib import Path
-import subprocess
 from typing import Optional
 from urllib.parse import urlencode
 
 from mdk.command import Command
-from mdk.docker import (docker_container_exists, ensure_docker_network_exists, get_local_docker_port, is_docker_container_running)
+from mdk.docker import (docker_container_exists, ensure_docker_network_exists, get_local_docker_port, inspect_docker_container,
+                        invalidate_docker_state, is_docker_container_running, remove_docker_container, start_docker_container,
+                        stop_docker_container, stream_docker_logs)
 from mdk.moodle import Moodle
 from mdk.tools import get_major_version_from_release, open_in_browser, process
 
@@ -167,7 +168,7 @@ class DockerCommand(Command):
 
         elif docker_container_exists(dockername):
             logging.info(f'Starting existing container "{dockername}".')
-            process(['docker', 'start', dockername])
+            start_docker_container(dockername)
             open_instance_in_browser_if_needed()
             return
 
@@ -234,6 +235,7 @@ class DockerCommand(Command):
             stdout=None,
             stderr=None,
         )
+        invalidate_docker_state()
 
         if r != 0:
             raise Exception('Failed to start the container.')
@@ -255,12 +257,10 @@ class DockerCommand(Command):
         if not is_docker_container_running(dockername):
             raise Exception(f'The container "{dockername}" is not running.')
 
+        # The logs are followed in the foreground, writing straight to the terminal until interrupted,
+        # so unlike Selenium or cron they do not need to be supervised.
         try:
-            r, stdout, stderr = process(
-                ['docker', 'logs', dockername] + (['-f'] if args.follow else []),
-                stdout=subprocess.DEVNULL,
-                stderr=None,
-            )
+            stream_docker_logs(dockername, follow=args.follow, stdout=False)
         except KeyboardInterrupt:
             pass
 
@@ -295,7 +295,7 @@ class DockerCommand(Command):
 
         elif docker_container_exists(dockername):
             logging.info(f'Starting existing database container "{dockername}".')
-            process(['docker', 'start', dockername])
+            start_docker_container(dockername)
             return
 
         ensure_docker_network_exists(dockernet)
@@ -338,6 +338,7 @@ class DockerCommand(Command):
             stdout=None,
             stderr=None,
         )
+        invalidate_docker_state()
 
         if r != 0:
             raise Exception('Failed to start the database container.')
@@ -375,6 +376,7 @@ class DockerCommand(Command):
                 stdout=None,
                 stderr=None,
             )
+            invalidate_docker_state()
 
             if r != 0:
                 raise Exception('Failed to start the container.')
@@ -383,8 +385,7 @@ class DockerCommand(Command):
 
         elif not is_docker_container_running(dockername):
             logging.info(f'The container "{dockername}" already exists, starting...')
-            r, _, _ = process(['docker', 'start', dockername], stdout=None, stderr=None)
-            if r != 0:
+            if not start_docker_container(dockername):
                 raise Exception('Failed to start the container.')
 
         else:
@@ -442,6 +443,7 @@ class DockerCommand(Command):
             stdout=None,
             stderr=None,
         )
+        invalidate_docker_state()
 
         if r != 0:
             raise Exception('Failed to start the Selenium container.')
@@ -457,26 +459,24 @@ class DockerCommand(Command):
             raise Exception(f'The container "{name}" does not appear to be managed by MDK, not removing it.')
 
         logging.info(f'Removing the container "{name}".')
-        r, _, _ = process(['docker', 'rm', name], stdout=None, stderr=None)
-        return r == 0
+        return remove_docker_container(name)
 
     def _stop(self, name) -> bool:
         if not is_docker_container_running(name):
             logging.info(f'The container "{name}" is not running.')
             return False
 
-        r, _, _ = process(['docker', 'stop', name], stdout=None, stderr=None)
-        return r == 0
+        return stop_docker_container(name)
 
 
 def docker_get_container_env(name: str) -> dict:
     """Get the container env."""
-    r, out, _ = process(['docker', 'inspect', '--format', '{{join .Config.Env "\\n"}}', name])
-    if r != 0:
+    info = inspect_docker_container(name)
+    if info is None:
         raise Exception(f'Could not get the environment variables from the container "{name}".')
 
     envs = {}
-    for line in out.splitlines():
+    for line in (info.get('Config') or {}).get('Env') or []:
         if '=' not in line:
             continue
         key, value = line.split('=', 1)
@@ -24,11 +24,21 @@ http://github.com/FMCorz/mdk
 
 import logging
 from ..command import Command
+from ..db import get_databases_info
+from ..tools import format_size
 
 
 class InfoCommand(Command):
 
     _arguments = [
+        (
+            ['-d', '--databases'],
+            {
+                'action': 'store_true',
+                'dest': 'databases',
+                'help': 'used with --list, display the size of the databases of the instances'
+            }
+        ),
         (
             ['-e', '--edit'],
             {
@@ -99,10 +109,18 @@ class InfoCommand(Command):
             else:
                 l = self.Wp.list()
             l.sort()
+            entries = self.Wp.getIndex().entries()
+
+            # The databases are read all at once, with one query per database server.
+            databases = {}
+            if args.databases and not args.nameonly and l:
+                databases = get_databases_info([M for M in self.Wp.resolveMultiple(l) if M.get('installed')])
+
             for i in l:
-                if not args.nameonly:
-                    M = self.Wp.get(i)
-                    print('{0:<25}'.format(i), M.get('release'))
+                if not args.nameonly and args.databases:
+                    print('{0:<25} {1:<25}'.format(i, str(entries[i]['release'])), self.formatDatabase(databases.get(i)))
+                elif not args.nameonly:
+                    print('{0:<25}'.format(i), entries[i]['release'])
                 else:
                     print(i)
 
@@ -135,3 +153,14 @@ class InfoCommand(Command):
                 infos = M.info()
                 for key in sorted(infos.keys()):
                     print('{0:<20}: {1}'.format(key, infos[key]))
+
+    def formatDatabase(self, info):
+        """Describe the database of an instance"""
+        if info is None:
+            return '-'
+        elif not info['exists']:
+            return 'missing'
+        description = format_size(info['size']) if info['size'] is not None else 'exists'
+        if info['tables'] is not None:
+            description += ', %d tables' % info['tables']
+        return description
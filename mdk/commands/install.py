@@ -55,6 +55,13 @@ class InstallCommand(Command):
                 'help': 'full name of the instance',
                 'metavar': 'fullname'
             },
+        ), (
+            ['--no-template'],
+            {
+                'action': 'store_false',
+                'dest': 'usetemplate',
+                'help': 'run the installation script rather than making the instance from an install template'
+            },
         ), (
             ['-r', '--run'],
             {
@@ -88,8 +95,9 @@ class InstallCommand(Command):
         if not os.path.isdir(dataDir):
             mkdir(dataDir, 0o777)
 
-        kwargs = {'dbprofile': dbprofile, 'fullname': fullname, 'dataDir': dataDir}
+        kwargs = {'dbprofile': dbprofile, 'fullname': fullname, 'dataDir': dataDir, 'useTemplate': args.usetemplate}
         M.install(**kwargs)
+        self.Wp.getIndex().refresh(name)
 
         # Running scripts
         if M.isInstalled() and type(args.run) == list:
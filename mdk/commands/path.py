@@ -28,6 +28,7 @@ import sys
 from mdk.tools import get_absolute_path
 
 from ..command import Command, CommandArgumentError, CommandArgumentParser
+from ..completion import CompletionCache
 from ..paths import ComponentResolver, get_file_path_from_classname
 
 logger = logging.getLogger(__name__)
@@ -111,19 +112,15 @@ class PathCommand(Command):
             return str(abspath if not args.relative else relpath)
 
         if args.list_components:
-            components = set(f'core_{name}' for name in resolver.subsystems)
-            for plugintype, relpath in resolver.plugintypes.items():
-                typeroot = dirroot / relpath
-                if not typeroot.is_dir():
-                    continue
-                components.add(plugintype)
-                components.update(f'{plugintype}_{path.name}' for path in typeroot.iterdir() if path.is_dir())
-
-            for component in sorted(components):
-                path = resolver.get_component_directory(component)
-                if not path:
-                    continue
+            components = resolver.list_components()
+            for component, path in components.items():
                 print(f'{component} {path_formatter(path)}')
+
+            # Let the shell completion find the components without invoking us again.
+            try:
+                CompletionCache(self.C, self.Wp).setComponents(M.identifier, list(components.keys()))
+            except Exception as e:
+                logging.debug('Could not cache the components: %s' % e)
             return
 
         path = dirroot
@@ -27,7 +27,7 @@ import gzip
 import urllib.request, urllib.parse, urllib.error
 from ..command import Command
 from ..tools import question
-from ..phpunit import PHPUnit
+from ..phpunit import PHPUnit, WORKER_ENV
 
 
 class PhpunitCommand(Command):
@@ -76,7 +76,7 @@ class PhpunitCommand(Command):
             {
                 'action': 'store_true',
                 'dest': 'skipinit',
-                'help': 'allows tests to start quicker when the instance is already initialised'
+                'help': 'skip checking whether the environment must be initialised again'
             },
         ),
         (
@@ -118,6 +118,18 @@ class PhpunitCommand(Command):
                 'metavar': 'filter'
             },
         ),
+        (
+            ['--parallel'],
+            {
+                'default': 0,
+                'dest': 'parallel',
+                'help':
+                    'the number of parallel workers, each with its own database prefix and data root. The testsuites '
+                    'are distributed between the workers based on how long they took previously.',
+                'metavar': 'N',
+                'type': int
+            },
+        ),
         (
             ['--repeat'],
             {
@@ -154,6 +166,15 @@ class PhpunitCommand(Command):
         if args.testcase and M.branch_compare('26', '<'):
             self.argumentError('The --testcase option only works with Moodle 2.6 or greater.')
 
+        # Parallel workers run whole testsuites.
+        workers = args.parallel if args.parallel > 1 else None
+        if workers:
+            if M.branch_compare(35, '<'):
+                self.argumentError('The --parallel option only works with Moodle 3.5 or greater.')
+            elif args.testcase or args.testsuite or args.unittest or args.coverage or args.repeat:
+                self.argumentError('The --parallel option cannot be combined with --testcase, --testsuite, --unittest, '
+                                   '--coverage or --repeat.')
+
         # Create the Unit test object.
         PU = PHPUnit(self.Wp, M)
 
@@ -191,10 +212,16 @@ class PhpunitCommand(Command):
                        (['notices'] if args.displaynotices and M.branch_compare(500) else [])
         }
 
-        if args.run:
+        if args.run and workers:
+            if not PU.runParallel(workers, **kwargs):
+                logging.warning('Some of the workers have failed')
+        elif args.run:
             PU.run(**kwargs)
             if args.coverage:
                 logging.info('Code coverage is available at: \n %s', (PU.getCoverageUrl()))
+        elif workers:
+            logging.info('Start PHPUnit in each worker, with %s=N set in the environment:\n %s', WORKER_ENV,
+                         ' '.join(PU.getCommand(**kwargs)))
         else:
             logging.info('Start PHPUnit:\n %s', (' '.join(PU.getCommand(**kwargs))))
 
@@ -213,4 +240,4 @@ class PhpunitCommand(Command):
         else:
             prefix = None
 
-        PU.init(force=args.force, prefix=prefix)
+        PU.init(force=args.force, prefix=prefix, workers=args.parallel if args.parallel > 1 else None)
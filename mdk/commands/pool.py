@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import logging
+import time
+from ..command import Command
+
+
+class PoolCommand(Command):
+
+    _arguments = [
+        (
+            ['action'],
+            {
+                'metavar': 'action',
+                'help': 'the action to perform',
+                'sub-commands':
+                    {
+                        'clear': (
+                            {
+                                'help': 'remove all the repositories from the pool'
+                            },
+                            []
+                        ),
+                        'fill': (
+                            {
+                                'help': 'prepare the repositories missing from the pool'
+                            },
+                            [
+                                (
+                                    ['--no-update'],
+                                    {
+                                        'action': 'store_true',
+                                        'dest': 'noupdate',
+                                        'help': 'do not update the cached repositories first'
+                                    }
+                                )
+                            ]
+                        ),
+                        'list': (
+                            {
+                                'help': 'list the repositories in the pool'
+                            },
+                            []
+                        )
+                    }
+            }
+        )
+    ]
+    _description = 'Manage the pool of repositories used to create instances'
+
+    def run(self, args):
+        pool = self.Wp.getPool()
+
+        if args.action == 'clear':
+            pool.clear()
+            logging.info('The pool has been cleared')
+
+        elif args.action == 'fill':
+            wanted = pool.getWanted()
+            if not wanted:
+                logging.info('The pool is not configured, or the cached repositories do not exist, see the setting \'pool\'')
+                return
+
+            def update(wanted):
+                integration = any(integration for (branch, integration) in wanted.keys())
+                stable = any(not integration for (branch, integration) in wanted.keys())
+                self.Wp.updateCachedClones(integration=integration, stable=stable, verbose=False)
+
+            count = pool.fill(update=None if args.noupdate else update)
+            logging.info('%d repositories prepared' % count)
+
+        elif args.action == 'list':
+            now = time.time()
+            for entry in pool.list():
+                print('{0:<25} {1:<12} {2:>6.1f} hours old'.format(
+                    entry['branch'],
+                    'integration' if entry['integration'] else 'stable',
+                    (now - entry['created']) / 3600
+                ))
@@ -42,6 +42,14 @@ class RebaseCommand(Command):
                     'required': True,
                 },
             ),
+            (
+                ['--force-refresh'],
+                {
+                    'action': 'store_true',
+                    'dest': 'forcerefresh',
+                    'help': 'fetch the cached repositories even when they were recently fetched',
+                },
+            ),
             (
                 ['-s', '--suffix'],
                 {
@@ -133,7 +141,7 @@ class RebaseCommand(Command):
 
         # Updating cache remotes
         logging.info('Updating cached repositories')
-        self.Wp.updateCachedClones(verbose=False)
+        self.Wp.updateCachedClones(verbose=False, force=args.forcerefresh)
 
         # Loops over instances to rebase
         for M in Mlist:
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import datetime
+import logging
+from ..command import Command
+
+
+class SnapshotCommand(Command):
+
+    _arguments = [
+        (
+            ['action'],
+            {
+                'metavar': 'action',
+                'help': 'the action to perform',
+                'sub-commands':
+                    {
+                        'save': (
+                            {
+                                'help': 'save the state of an instance'
+                            },
+                            [
+                                (
+                                    ['-f', '--force'],
+                                    {
+                                        'action': 'store_true',
+                                        'help': 'replace the snapshot if it exists'
+                                    }
+                                ),
+                                (['snapshot'], {
+                                    'help': 'the name of the snapshot'
+                                }),
+                                (['name'], {
+                                    'default': None,
+                                    'help': 'name of the instance',
+                                    'metavar': 'name',
+                                    'nargs': '?'
+                                }),
+                            ]
+                        ),
+                        'restore': (
+                            {
+                                'help': 'restore an instance to the state of a snapshot'
+                            },
+                            [
+                                (
+                                    ['--no-git'],
+                                    {
+                                        'action': 'store_true',
+                                        'dest': 'nogit',
+                                        'help': 'do not check out the commit of the snapshot'
+                                    }
+                                ),
+                                (['snapshot'], {
+                                    'help': 'the name of the snapshot'
+                                }),
+                                (['name'], {
+                                    'default': None,
+                                    'help': 'name of the instance',
+                                    'metavar': 'name',
+                                    'nargs': '?'
+                                }),
+                            ]
+                        ),
+                        'list': (
+                            {
+                                'help': 'list the snapshots of an instance'
+                            },
+                            [
+                                (['name'], {
+                                    'default': None,
+                                    'help': 'name of the instance',
+                                    'metavar': 'name',
+                                    'nargs': '?'
+                                }),
+                            ]
+                        ),
+                        'prune': (
+                            {
+                                'help': 'delete a snapshot, or the oldest ones, and the files no longer used'
+                            },
+                            [
+                                (
+                                    ['-k', '--keep'],
+                                    {
+                                        'default': None,
+                                        'metavar': 'N',
+                                        'type': int,
+                                        'help': 'delete all but the N most recent snapshots'
+                                    }
+                                ),
+                                (['snapshot'], {
+                                    'default': None,
+                                    'help': 'the name of the snapshot to delete',
+                                    'nargs': '?'
+                                }),
+                                (['name'], {
+                                    'default': None,
+                                    'help': 'name of the instance',
+                                    'metavar': 'name',
+                                    'nargs': '?'
+                                }),
+                            ]
+                        ),
+                    }
+            }
+        )
+    ]
+    _description = 'Save and restore the state of an instance'
+
+    def run(self, args):
+        # With --keep, the only positional argument of prune is the instance.
+        if args.action == 'prune' and args.keep is not None and args.snapshot and not args.name:
+            (args.snapshot, args.name) = (None, args.snapshot)
+
+        M = self.Wp.resolve(args.name)
+        if not M:
+            raise Exception('This is not a Moodle instance')
+
+        from ..snapshot import InstanceSnapshots
+        snapshots = InstanceSnapshots(self.Wp, M)
+
+        if args.action == 'save':
+            snapshot = snapshots.save(args.snapshot, force=args.force)
+            logging.info('%d files in the data root, on %s' % (snapshot['files'], snapshot['branch'] or 'an unknown branch'))
+
+        elif args.action == 'restore':
+            snapshots.restore(args.snapshot, git=not args.nogit)
+
+        elif args.action == 'list':
+            for snapshot in snapshots.list():
+                print('{0:<20} {1:<17} {2:<30} {3}'.format(
+                    snapshot['name'],
+                    datetime.datetime.fromtimestamp(snapshot['created']).strftime('%Y-%m-%d %H:%M'),
+                    snapshot.get('branch') or '',
+                    (snapshot.get('head') or '')[:10],
+                ))
+
+        elif args.action == 'prune':
+            if args.snapshot:
+                snapshots.delete(args.snapshot)
+                logging.info('Snapshot %s deleted' % args.snapshot)
+            elif args.keep is None:
+                self.argumentError('Give the name of the snapshot to delete, or the number of snapshots to keep')
+            removed = snapshots.prune(keep=args.keep)
+            logging.debug('%d files removed' % removed)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import json
+from ..command import Command
+from ..status import InstanceProbe
+from ..tools import format_size
+
+
+class StatusCommand(Command):
+
+    _arguments = [
+        (
+            ['-j', '--jobs'],
+            {
+                'default': 8,
+                'dest': 'jobs',
+                'help': 'number of instances to probe at the same time',
+                'metavar': 'N',
+                'type': int
+            }
+        ),
+        (
+            ['--json'],
+            {
+                'action': 'store_true',
+                'dest': 'json',
+                'help': 'output the status in JSON'
+            }
+        ),
+        (
+            ['-u', '--upgrade'],
+            {
+                'action': 'store_true',
+                'dest': 'upgrade',
+                'help': 'check whether the instances need upgrading, this is slower as it runs PHP'
+            }
+        ),
+        (
+            ['names'],
+            {
+                'default': None,
+                'help': 'name of the instances, all of them by default',
+                'metavar': 'names',
+                'nargs': '*'
+            }
+        )
+    ]
+    _description = 'Display the status of the instances'
+
+    def run(self, args):
+        names = args.names or sorted(self.Wp.list())
+        statuses = InstanceProbe(self.Wp, jobs=args.jobs, upgrade=args.upgrade).probe(names)
+
+        if args.json:
+            print(json.dumps(statuses, indent=2))
+            return
+
+        headers = ['Instance', 'Branch', 'Changes', 'Upstream', 'Installed', 'Database', 'Docker']
+        if args.upgrade:
+            headers.append('Upgrade')
+
+        rows = []
+        for status in statuses:
+            if status['error']:
+                rows.append([status['name'], 'Error: %s' % status['error']])
+                continue
+            row = [
+                status['name'],
+                status['branch'] or '(detached)',
+                'dirty' if status['dirty'] else '',
+                self.formatUpstream(status),
+                'yes' if status['installed'] else 'no',
+                self.formatDatabase(status),
+                status['docker'] or '',
+            ]
+            if args.upgrade:
+                row.append({True: 'pending', False: '', None: '?'}[status['upgrade']] if status['installed'] else '')
+            rows.append(row)
+
+        widths = [max([len(headers[i])] + [len(row[i]) for row in rows if len(row) == len(headers)])
+                  for i in range(len(headers))]
+        for row in [headers] + rows:
+            if len(row) != len(headers):
+                print('{0:<{1}}  {2}'.format(row[0], widths[0], row[1]))
+                continue
+            print('  '.join('{0:<{1}}'.format(value, widths[i]) for i, value in enumerate(row)).rstrip())
+
+    def formatDatabase(self, status):
+        info = status['database']
+        if not status['installed']:
+            return ''
+        elif info is None:
+            return '?'
+        elif not info['exists']:
+            return 'missing'
+        return format_size(info['size']) if info['size'] is not None else 'exists'
+
+    def formatUpstream(self, status):
+        if status['ahead'] is None:
+            return ''
+        return '+%d -%d' % (status['ahead'], status['behind'])
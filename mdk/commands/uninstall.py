@@ -66,4 +66,5 @@ class UninstallCommand(Command):
 
         logging.info('Uninstalling %s...' % M.get('identifier'))
         M.uninstall()
+        self.Wp.getIndex().refresh(M.get('identifier'))
         logging.info('Done.')
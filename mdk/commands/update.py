@@ -26,6 +26,7 @@ import sys
 import logging
 from ..command import Command
 from ..exceptions import UpgradeNotAllowed
+from ..tools import ParallelJobs
 
 
 class UpdateCommand(Command):
@@ -46,6 +47,14 @@ class UpdateCommand(Command):
                 'help': 'only update the cached (mirrored) repositories'
             }
         ),
+        (
+            ['--force-refresh'],
+            {
+                'action': 'store_true',
+                'dest': 'forcerefresh',
+                'help': 'fetch the cached repositories even when they were recently fetched'
+            }
+        ),
         (
             ['-i', '--integration'],
             {
@@ -54,6 +63,24 @@ class UpdateCommand(Command):
                 'help': 'update integration instances'
             }
         ),
+        (
+            ['-j', '--jobs'],
+            {
+                'default': 1,
+                'dest': 'jobs',
+                'help': 'number of instances to update at the same time',
+                'metavar': 'N',
+                'type': int
+            }
+        ),
+        (
+            ['--concurrent-upgrades'],
+            {
+                'action': 'store_true',
+                'dest': 'concurrentupgrades',
+                'help': 'with --jobs, allow instances sharing a database server to be upgraded at the same time'
+            }
+        ),
         (
             ['-s', '--stable'],
             {
@@ -85,7 +112,7 @@ class UpdateCommand(Command):
     def run(self, args):
 
         if args.cached:
-            self.updateCached()
+            self.updateCached(args.forcerefresh)
             return
 
         # Updating instances
@@ -99,30 +126,11 @@ class UpdateCommand(Command):
         if len(Mlist) < 1:
             raise Exception('No instances to work on. Exiting...')
 
-        self.updateCached()
-
-        errors = []
-
-        for M in Mlist:
-            logging.info('Updating %s...' % M.get('identifier'))
-            try:
-                M.update()
-            except Exception as e:
-                errors.append(M)
-                logging.warning('Error during the update of %s' % M.get('identifier'))
-                logging.debug(e)
-            else:
-                if args.upgrade:
-                    try:
-                        M.upgrade()
-                    except UpgradeNotAllowed as e:
-                        logging.info('Skipping upgrade of %s (not allowed)' % (M.get('identifier')))
-                        logging.debug(e)
-                    except Exception as e:
-                        errors.append(M)
-                        logging.warning('Error during the upgrade of %s' % M.get('identifier'))
-                        pass
-            logging.info('')
+        self.updateCached(args.forcerefresh)
+
+        jobs = ParallelJobs(args.jobs)
+        results = jobs.run(lambda M, logger, stdio: self.updateInstance(M, args, jobs, logger, stdio), Mlist)
+        errors = [M for M, result in zip(Mlist, results) if result is not True]
         logging.info('Done.')
 
         if errors and len(Mlist) > 1:
@@ -133,7 +141,33 @@ class UpdateCommand(Command):
             # Remove sys.exit and handle error code
             sys.exit(1)
 
-    def updateCached(self):
+    def updateInstance(self, M, args, jobs, logger, stdio):
+        """Update an instance, and upgrade it if required. Returns True on success"""
+        success = True
+        logger.info('Updating %s...' % M.get('identifier'))
+        try:
+            M.update()
+        except Exception as e:
+            success = False
+            logger.warning('Error during the update of %s' % M.get('identifier'))
+            logger.debug(e)
+        else:
+            if args.upgrade:
+                # Instances sharing a database server are not upgraded at the same time.
+                lockkey = M.get('identifier') if args.concurrentupgrades else (M.get('dbtype'), M.get('dbhost'))
+                try:
+                    with jobs.lock(lockkey):
+                        M.upgrade(**stdio)
+                except UpgradeNotAllowed as e:
+                    logger.info('Skipping upgrade of %s (not allowed)' % (M.get('identifier')))
+                    logger.debug(e)
+                except Exception as e:
+                    success = False
+                    logger.warning('Error during the upgrade of %s' % M.get('identifier'))
+        logger.info('')
+        return success
+
+    def updateCached(self, force=False):
         # Updating cache
         print('Updating cached repositories')
-        self.Wp.updateCachedClones(verbose=False)
+        self.Wp.updateCachedClones(verbose=False, force=force)
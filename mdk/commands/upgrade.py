@@ -26,6 +26,7 @@ import sys
 import logging
 from ..command import Command
 from ..exceptions import UpgradeNotAllowed
+from ..tools import ParallelJobs
 
 class UpgradeCommand(Command):
 
@@ -38,6 +39,14 @@ class UpgradeCommand(Command):
                 'help': 'upgrade each instance'
             }
         ),
+        (
+            ['--force-refresh'],
+            {
+                'action': 'store_true',
+                'dest': 'forcerefresh',
+                'help': 'with --update, fetch the cached repositories even when they were recently fetched'
+            }
+        ),
         (
             ['-i', '--integration'],
             {
@@ -54,6 +63,24 @@ class UpgradeCommand(Command):
                 'help': 'upgrade stable instances'
             }
         ),
+        (
+            ['-j', '--jobs'],
+            {
+                'default': 1,
+                'dest': 'jobs',
+                'help': 'number of instances to upgrade at the same time',
+                'metavar': 'N',
+                'type': int
+            }
+        ),
+        (
+            ['--concurrent-upgrades'],
+            {
+                'action': 'store_true',
+                'dest': 'concurrentupgrades',
+                'help': 'with --jobs, allow instances sharing a database server to be upgraded at the same time'
+            }
+        ),
         (
             ['-n', '--no-checkout'],
             {
@@ -97,32 +124,11 @@ class UpgradeCommand(Command):
         # Updating cache if required
         if args.update:
             print('Updating cached repositories')
-            self.Wp.updateCachedClones(verbose=False)
-
-        errors = []
-
-        for M in Mlist:
-            if args.update:
-                logging.info('Updating %s...' % M.get('identifier'))
-                try:
-                    M.update()
-                except Exception as e:
-                    errors.append(M)
-                    logging.warning('Error during update. Skipping...')
-                    logging.debug(e)
-                    continue
-            logging.info('Upgrading %s...' % M.get('identifier'))
+            self.Wp.updateCachedClones(verbose=False, force=args.forcerefresh)
 
-            try:
-                M.upgrade(args.nocheckout)
-            except UpgradeNotAllowed as e:
-                logging.info('Skipping upgrade of %s (not allowed)' % (M.get('identifier')))
-                logging.debug(e)
-            except Exception as e:
-                errors.append(M)
-                logging.warning('Error during the upgrade of %s' % M.get('identifier'))
-                logging.debug(e)
-            logging.info('')
+        jobs = ParallelJobs(args.jobs)
+        results = jobs.run(lambda M, logger, stdio: self.upgradeInstance(M, args, jobs, logger, stdio), Mlist)
+        errors = [M for M, result in zip(Mlist, results) if result is not True]
         logging.info('Done.')
 
         if errors and len(Mlist) > 1:
@@ -132,3 +138,31 @@ class UpgradeCommand(Command):
                 logging.warning('- %s' % M.get('identifier'))
             # TODO Do not use sys.exit() but handle error code
             sys.exit(1)
+
+    def upgradeInstance(self, M, args, jobs, logger, stdio):
+        """Upgrade an instance, and update it first if required. Returns True on success"""
+        if args.update:
+            logger.info('Updating %s...' % M.get('identifier'))
+            try:
+                M.update()
+            except Exception as e:
+                logger.warning('Error during update. Skipping...')
+                logger.debug(e)
+                return False
+        logger.info('Upgrading %s...' % M.get('identifier'))
+
+        success = True
+        # Instances sharing a database server are not upgraded at the same time.
+        lockkey = M.get('identifier') if args.concurrentupgrades else (M.get('dbtype'), M.get('dbhost'))
+        try:
+            with jobs.lock(lockkey):
+                M.upgrade(args.nocheckout, **stdio)
+        except UpgradeNotAllowed as e:
+            logger.info('Skipping upgrade of %s (not allowed)' % (M.get('identifier')))
+            logger.debug(e)
+        except Exception as e:
+            success = False
+            logger.warning('Error during the upgrade of %s' % M.get('identifier'))
+            logger.debug(e)
+        logger.info('')
+        return success
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import json
+import logging
+import os
+import tempfile
+from typing import List
+
+from .commands import commandsList
+from .scripts import Scripts
+
+# Commands which are not offered by the completion on purpose.
+IGNORED_COMMANDS = ['init']
+
+
+class CompletionCache(object):
+    """Cache of the values offered by the shell completion scripts
+
+    The completion scripts read the files of this directory instead of invoking MDK on every
+    key stroke. Each file contains one value per line. The cache is refreshed after MDK has run,
+    whenever the config files, the script directories or the instances have changed.
+    """
+
+    _C = None
+    _path = None
+    _Wp = None
+
+    def __init__(self, C, Wp):
+        self._C = C
+        self._Wp = Wp
+        self._path = self.getPath(C)
+
+    @staticmethod
+    def getPath(C):
+        """The path to the cache, the completion scripts expect it next to the user config file"""
+        return os.path.join(os.path.dirname(C.userFile), 'completion')
+
+    def refresh(self, force=False):
+        """Refresh the cache when it is out of date, returns whether it was refreshed"""
+        entries = self._Wp.getIndex().entries()
+        signature = self._signature(entries)
+        state = self._readState()
+        if not force and state.get('signature') == signature:
+            return False
+
+        self._makeDirs()
+
+        aliases = sorted(str(k) for k in (self._C.get('aliases') or {}).keys())
+        profiles = sorted(k for k, v in (self._C.get('db') or {}).items() if type(v) is dict and 'engine' in v)
+        self._write('commands', sorted(c for c in commandsList if c not in IGNORED_COMMANDS))
+        self._write('aliases', aliases)
+        self._write('dbprofiles', profiles)
+        self._write('instances', sorted(entries.keys()))
+        self._write('scripts', sorted(Scripts.list().keys()))
+        self._write('storage', [self._Wp.path])
+
+        # Remove the components of the instances which changed, they will be listed again on demand.
+        components = {}
+        for name, componentsSignature in state.get('components', {}).items():
+            if name in entries and entries[name]['signature'] == componentsSignature:
+                components[name] = componentsSignature
+                continue
+            try:
+                os.remove(os.path.join(self._path, 'components', name))
+            except OSError:
+                pass
+
+        self._writeState({'signature': signature, 'components': components})
+        return True
+
+    def setComponents(self, name, components: List[str]):
+        """Store the list of components of an instance"""
+        entry = self._Wp.getIndex().get(name)
+        if not entry:
+            return
+
+        self._makeDirs()
+        self._write(os.path.join('components', name), components)
+
+        state = self._readState()
+        state.setdefault('components', {})[name] = entry['signature']
+        self._writeState(state)
+
+    def _makeDirs(self):
+        os.makedirs(os.path.join(self._path, 'components'), exist_ok=True)
+
+    def _readState(self) -> dict:
+        try:
+            with open(os.path.join(self._path, 'state.json'), 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def _signature(self, entries) -> dict:
+        """The signature of everything the cache is built from"""
+        stats = {}
+        for path in list(self._C.files) + sorted(Scripts.dirs()):
+            try:
+                stat = os.stat(path)
+                stats[path] = [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                stats[path] = None
+        return {
+            'files': stats,
+            'storage': self._Wp.path,
+            'instances': {name: entry['signature'] for name, entry in entries.items()},
+        }
+
+    def _write(self, name, values: List[str]):
+        self._writeFile(name, ''.join('%s\n' % v for v in values))
+
+    def _writeFile(self, name, content):
+        """Atomically write a file, the completion scripts may be reading it"""
+        path = os.path.join(self._path, name)
+        fd, tmppath = tempfile.mkstemp(prefix='.tmp', dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(tmppath, path)
+
+    def _writeState(self, state):
+        self._writeFile('state.json', json.dumps(state))
+
+
+def refresh_completion_cache(C):
+    """Refresh the completion cache if needed, errors are not reported"""
+    try:
+        from .workplace import Workplace
+        CompletionCache(C, Workplace()).refresh()
+    except Exception as e:
+        logging.debug('Could not refresh the completion cache: %s' % e)
@@ -28,6 +28,18 @@ import re
 import copy
 
 
+def copyData(data):
+    """Copy the data as copy.deepcopy would, but faster for the types JSON produces"""
+    t = type(data)
+    if t == dict:
+        return {k: copyData(v) for k, v in data.items()}
+    elif t == list:
+        return [copyData(v) for v in data]
+    elif t in (str, int, float, bool) or data is None:
+        return data
+    return copy.deepcopy(data)
+
+
 class ConfigObject(object):
     """Configuration object"""
     data = None
@@ -49,16 +61,17 @@ class ConfigObject(object):
         """Return all the settings, or the setting if name is specified.
         In case the setting is not found default is returned instead.
         """
-        data = copy.deepcopy(self.data)
+        data = self.data
         if name != None:
             name = str(name).split('.')
             for n in name:
                 try:
                     data = data[n]
                 except:
-                    data = default
-                    break
-        return data
+                    return default
+
+        # Only copy what is returned, the caller may modify it.
+        return copyData(data)
 
     def getFlat(self, data=None, parent=''):
         """Return the entire data as a flat array"""
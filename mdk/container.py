@@ -2,9 +2,11 @@ import abc
 import os
 from pathlib import Path
 import shutil
+import subprocess
 import sys
 from typing import Dict, List, Optional
 from mdk.config import Conf
+from mdk.docker import docker_exec, get_local_docker_port
 
 from mdk.tools import get_absolute_path, mkdir, process
 
@@ -39,10 +41,27 @@ class Container(abc.ABC):
     def path(self) -> Path:
         pass
 
+    @abc.abstractmethod
+    def popen(self, command: List[str], addtoenv: Dict[str, str] = None, **kwargs) -> subprocess.Popen:
+        """Start a command without waiting for it to complete, the arguments are those of subprocess.Popen"""
+        pass
+
+    @abc.abstractmethod
+    def readfile(self, path: Path) -> str:
+        pass
+
     @abc.abstractmethod
     def rmtree(self, path: Path) -> None:
         pass
 
+    @abc.abstractmethod
+    def unlink(self, path: Path) -> None:
+        pass
+
+    @abc.abstractmethod
+    def writefile(self, path: Path, content: str) -> None:
+        pass
+
     @property
     @abc.abstractmethod
     def dataroot(self) -> Path:
@@ -112,9 +131,26 @@ class HostContainer(Container):
     def path(self) -> Path:
         return self._path
 
+    def popen(self, command: List[str], addtoenv: Dict[str, str] = None, **kwargs) -> subprocess.Popen:
+        bin = command[0]
+        if bin in self._binaries:
+            command[0] = self._binaries[bin]
+        if addtoenv:
+            kwargs['env'] = {**os.environ, **addtoenv}
+        return subprocess.Popen(command, cwd=self.path, **kwargs)
+
+    def readfile(self, path: Path) -> str:
+        return get_absolute_path(path, self.path).read_text(encoding='utf-8')
+
     def rmtree(self, path: Path) -> None:
         shutil.rmtree(get_absolute_path(path, self.path), True)
 
+    def unlink(self, path: Path) -> None:
+        get_absolute_path(path, self.path).unlink(missing_ok=True)
+
+    def writefile(self, path: Path, content: str) -> None:
+        get_absolute_path(path, self.path).write_text(content, encoding='utf-8')
+
     @property
     def dataroot(self) -> Path:
         if not self._dataroot:
@@ -173,21 +209,36 @@ class DockerContainer(Container):
         r, _, _ = self.exec(['test', '-e', (get_absolute_path(path, self.path)).as_posix()])
         return r == 0
 
-    def exec(self, command: List[str], **kwargs):
-        # We surely will want to customise the user, but for simplicity at the moment all is done by root.
+    def exec(self, command: List[str], addtoenv: Dict[str, str] = None, **kwargs):
         isttyok = sys.stdin.isatty() and sys.stdout.isatty()
-        hostcommand = [
+
+        # The commands which do not need the terminal are run through the Engine API when it can be used.
+        if kwargs.get('stdin') is None and not (isttyok and kwargs.get('stdout', subprocess.PIPE) is None):
+            stdio = {'stdout': kwargs.get('stdout', subprocess.PIPE), 'stderr': kwargs.get('stderr', subprocess.PIPE)}
+            result = docker_exec(self._name, command, workdir=self.path.as_posix(), user='0:0', env=addtoenv, **stdio)
+            if result is not None:
+                return result
+
+        options = ['-it'] if isttyok else []
+        return process(self._hostcommand(command, options, addtoenv), cwd=self._hostpath, **kwargs)
+
+    def _hostcommand(self, command: List[str], options: List[str], addtoenv: Dict[str, str] = None) -> List[str]:
+        # The environment variables are given to the command in the container, not to docker.
+        for name, value in (addtoenv or {}).items():
+            options = [*options, '-e', '%s=%s' % (name, value)]
+
+        # We surely will want to customise the user, but for simplicity at the moment all is done by root.
+        return [
             'docker',
             'exec',
             '-w',
             self.path.as_posix(),
             '-u',
             '0:0',
-            *(['-it'] if isttyok else []),
+            *options,
             self._name,
             *command,
         ]
-        return process(hostcommand, cwd=self._hostpath, **kwargs)
 
     def isdir(self, path: Path) -> bool:
         r, _, _ = self.exec(['test', '-d', get_absolute_path(path, self.path).as_posix()])
@@ -202,10 +253,32 @@ class DockerContainer(Container):
     def path(self) -> Path:
         return Path('/var/www/html')
 
+    def popen(self, command: List[str], addtoenv: Dict[str, str] = None, **kwargs) -> subprocess.Popen:
+        options = ['-i'] if kwargs.get('stdin') is not None else []
+        return subprocess.Popen(self._hostcommand(command, options, addtoenv), cwd=self._hostpath, **kwargs)
+
+    def readfile(self, path: Path) -> str:
+        path = get_absolute_path(path, self.path)
+        r, output, _ = self.exec(['cat', path.as_posix()])
+        if r != 0:
+            raise Exception(f'Could not read {path}.')
+        return output
+
     def rmtree(self, path: Path) -> None:
         path = get_absolute_path(path, self.path)
         self.exec(['rm', '-r', path.as_posix()])
 
+    def unlink(self, path: Path) -> None:
+        path = get_absolute_path(path, self.path)
+        self.exec(['rm', '-f', path.as_posix()])
+
+    def writefile(self, path: Path, content: str) -> None:
+        path = get_absolute_path(path, self.path)
+        proc = self.popen(['sh', '-c', 'cat > "$0"', path.as_posix()], stdin=subprocess.PIPE, encoding='utf-8')
+        proc.communicate(content)
+        if proc.returncode != 0:
+            raise Exception(f'Could not write {path}.')
+
     @property
     def dataroot(self) -> Path:
         return Path('/var/www/moodledata')
@@ -214,17 +287,11 @@ class DockerContainer(Container):
     def wwwroot(self) -> str:
         wwwroot = '%s://%s' % (C.get('scheme'), C.get('host'))
 
-        r, output, _ = process(['docker', 'port', self._name, '80'])
-        if r != 0:
+        port = get_local_docker_port(self._name, 80)
+        if port is None:
             raise Exception(f'Could not get the port for {self._name}.')
 
-        port = None
-        try:
-            port = output.splitlines()[0].split(':', 1)[-1]
-        except ValueError:
-            raise ValueError(f'Could not resolve the port of {self._name}.')
-
-        return wwwroot + ':' + port
+        return wwwroot + ':' + str(port)
 
     @property
     def behat_dataroot(self) -> Path:
@@ -20,10 +20,16 @@ http://github.com/FMCorz/mdk
 """
 
 import abc
+import atexit
 from contextlib import contextmanager
 import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
 from io import IOBase
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional
 
 from mdk.tools import process
 
@@ -44,6 +50,191 @@ def get_dbo_from_profile(profile: Dict[str, Any]) -> 'Database':
     raise ValueError(f"Unsupported engine '{engine}'")
 
 
+class ConnectionPool(object):
+    """Database connections kept open to be reused for the duration of the process
+
+    Opening a connection costs a round trip to the server and the authentication, a few of the
+    connections are kept per server and credentials to be reused by the next operations. A
+    connection which has been idle for a while is checked before being reused, and replaced when
+    it is no longer usable. A connection is only used by one thread at a time.
+    """
+
+    _idle = None
+    _lock = None
+
+    def __init__(self, maxIdle: int = 2, checkAfter: float = 5):
+        """
+        :param maxIdle: The number of idle connections kept per key.
+        :param checkAfter: The number of seconds a connection can be idle before being checked.
+        """
+        self.maxIdle = maxIdle
+        self.checkAfter = checkAfter
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def closeAll(self):
+        """Close the idle connections"""
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for connections in idle.values():
+            for (conn, _) in connections:
+                self._close(conn)
+
+    @contextmanager
+    def connection(self, key, connect: Callable[[], Any], check: Callable[[Any], Any], reset: Callable[[Any], Any]):
+        """Yield an idle connection of the key, or a new one from connect()
+
+        The connection is checked with check() when it has been idle for a while, it is unusable
+        when that raises an exception or returns False. Once used, the connection is kept if
+        reset() succeeds, and it is closed when the block raises an exception.
+        """
+        conn = self._take(key, check)
+        if conn is None:
+            conn = connect()
+
+        try:
+            yield conn
+        except BaseException:
+            self._close(conn)
+            raise
+
+        try:
+            reset(conn)
+        except Exception as e:
+            logging.debug('Closing a connection which could not be reset: %s' % e)
+            self._close(conn)
+            return
+
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.maxIdle:
+                connections.append((conn, time.monotonic()))
+                return
+        self._close(conn)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _take(self, key, check):
+        """Return an idle connection of the key which is usable, or None"""
+        while True:
+            with self._lock:
+                connections = self._idle.get(key)
+                if not connections:
+                    return None
+                (conn, since) = connections.pop()
+
+            if time.monotonic() - since < self.checkAfter:
+                return conn
+
+            try:
+                if check(conn) is not False:
+                    return conn
+            except Exception as e:
+                logging.debug('Discarding an unusable connection: %s' % e)
+            self._close(conn)
+
+
+_pool = None
+_poollock = threading.Lock()
+
+
+def get_connection_pool() -> ConnectionPool:
+    """Return the pool of connections shared by the database objects of the process"""
+    global _pool
+    with _poollock:
+        if _pool is None:
+            _pool = ConnectionPool()
+            atexit.register(_pool.closeAll)
+        return _pool
+
+
+def get_compressor(path: str, decompress: bool = False) -> Optional[List[str]]:
+    """Return the command compressing, or decompressing, a stream for the extension of path"""
+    if path.endswith('.zst'):
+        if not shutil.which('zstd'):
+            raise Exception('The command zstd is required for the file %s' % path)
+        return ['zstd', '-q', '-d', '-c'] if decompress else ['zstd', '-q', '-c', '-T0']
+    elif path.endswith('.gz'):
+        gzip = 'pigz' if shutil.which('pigz') else 'gzip'
+        return [gzip, '-d', '-c'] if decompress else [gzip, '-c']
+    return None
+
+
+def dump_database(dbo: 'Database', dbname: str, path: str, prefix: Optional[str] = None):
+    """Dump a database to a file, compressed when its extension is .gz or .zst
+
+    The dump is streamed from the tool of the engine to the compressor, and then to the file,
+    without passing through Python, so it does not matter how large the database is.
+    """
+    compressor = get_compressor(path)
+    with open(path, 'wb') as f:
+        if not compressor:
+            dbo.dump(dbname, f, prefix=prefix)
+            return
+
+        proc = subprocess.Popen(compressor, stdin=subprocess.PIPE, stdout=f)
+        try:
+            dbo.dump(dbname, proc.stdin, prefix=prefix)
+        finally:
+            proc.stdin.close()
+            proc.wait()
+        if proc.returncode != 0:
+            raise Exception('Could not compress the dump to %s' % path)
+
+
+def restore_database(dbo: 'Database', dbname: str, path: str):
+    """Restore a dump made by dump_database() in an existing database"""
+    decompressor = get_compressor(path, decompress=True)
+    with open(path, 'rb') as f:
+        if not decompressor:
+            dbo.restore(dbname, f)
+            return
+
+        proc = subprocess.Popen(decompressor, stdin=f, stdout=subprocess.PIPE)
+        try:
+            dbo.restore(dbname, proc.stdout)
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        if proc.returncode != 0:
+            raise Exception('Could not decompress the dump %s' % path)
+
+
+def database_info(exists: bool, size: Optional[int] = None, tables: Optional[int] = None,
+                  modified: Optional[float] = None) -> Dict[str, Any]:
+    return {'exists': exists, 'size': size, 'tables': tables, 'modified': modified}
+
+
+def get_databases_info(instances) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Return the information about the databases of instances, keyed by identifier
+
+    The instances are grouped by database server, and each server is queried once. The
+    information is None for the instances without a database, or whose server failed.
+    """
+    groups = {}
+    result = {}
+    for M in instances:
+        result[M.get('identifier')] = None
+        if M.get('dbname'):
+            groups.setdefault((M.get('dbtype'), M.get('dbhost'), M.get('dbuser')), []).append(M)
+
+    for (engine, host, user), group in groups.items():
+        try:
+            infos = group[0].dbo().databases_info([M.get('dbname') for M in group])
+        except Exception as e:
+            logging.debug('Could not read the databases of %s@%s: %s' % (user, host, e))
+            continue
+        for M in group:
+            result[M.get('identifier')] = infos.get(M.get('dbname'))
+
+    return result
+
+
 class Database(abc.ABC):
 
     @abc.abstractmethod
@@ -59,9 +250,43 @@ class Database(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def dump(self, dbname, fd):
+    def dump(self, dbname, fd, prefix=None):
+        """Write a dump of the database to the file object, optionally only the tables starting with prefix"""
         pass
 
+    def clonedb(self, source, target):
+        """Create the database target as a copy of source, with the means of the engine"""
+        raise NotImplementedError('Cloning databases is not supported by this engine')
+
+    def databases_info(self, names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the information about databases, keyed by name
+
+        The information contains whether the database exists, its size in bytes, its number of
+        tables, and the timestamp at which it was last modified. What the engine does not report
+        is None. The engines read it from their catalog in a single query.
+        """
+        return {name: database_info(self.dbexists(name)) for name in set(names)}
+
+    def droptables(self, dbname, prefix):
+        """Drop the tables starting with prefix"""
+        raise NotImplementedError('Dropping tables is not supported by this engine')
+
+    def tables(self, dbname, prefix) -> List[str]:
+        """Return the names of the tables starting with prefix"""
+        raise NotImplementedError('Listing tables is not supported by this engine')
+
+    def snapshotdb(self, dbname, snapname, prefix):
+        """Copy the tables starting with prefix to the new database snapname, with the means of the engine"""
+        raise NotImplementedError('Snapshots are not supported by this engine')
+
+    def restore(self, dbname, fd):
+        """Restore a dump made by dump() in the database, replacing the tables it contains"""
+        raise NotImplementedError('Restoring dumps is not supported by this engine')
+
+    def restoresnapshot(self, snapname, dbname, prefix):
+        """Replace the tables starting with prefix by those of a snapshot made by snapshotdb()"""
+        raise NotImplementedError('Snapshots are not supported by this engine')
+
 
 class MySQLCursor(Database):
 
@@ -78,12 +303,13 @@ class MySQLCursor(Database):
 
     @contextmanager
     def cursor(self):
-        import MySQLdb as mysql
-        conn = mysql.connect(host=self._host, port=self._port, user=self._user, passwd=self._passwd, db='')
-        cursor = conn.cursor()
-        yield cursor
-        cursor.close()
-        conn.close()
+        key = ('mysql', self._host, self._port, self._user, self._passwd)
+        with get_connection_pool().connection(key, self._connect, lambda conn: conn.ping(), lambda conn: conn.rollback()) as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
 
     def createdb(self, dbname, **options):
         with self.cursor() as cursor:
@@ -106,12 +332,109 @@ class MySQLCursor(Database):
             cursor.execute(sql)
             return cursor.fetchone() is not None
 
-    def dump(self, dbname, fd):
-        raise NotImplementedError('This method is not implemented, but it probably should be.')
+    def clonedb(self, source, target):
+        self.createdb(target)
+        self._copytables(source, target, '')
+
+    def databases_info(self, names):
+        names = list(set(names))
+        result = {name: database_info(False) for name in names}
+        if not names:
+            return result
+        with self.cursor() as cursor:
+            sql = ('SELECT s.SCHEMA_NAME, COUNT(t.TABLE_NAME), COALESCE(SUM(t.DATA_LENGTH + t.INDEX_LENGTH), 0), '
+                   'MAX(COALESCE(t.UPDATE_TIME, t.CREATE_TIME)) '
+                   'FROM information_schema.SCHEMATA s '
+                   'LEFT JOIN information_schema.TABLES t ON t.TABLE_SCHEMA = s.SCHEMA_NAME '
+                   'WHERE s.SCHEMA_NAME IN (%s) GROUP BY s.SCHEMA_NAME' % ', '.join(['%s'] * len(names)))
+            logging.debug(sql)
+            cursor.execute(sql, names)
+            for (name, tables, size, modified) in cursor.fetchall():
+                result[name] = database_info(True, int(size), int(tables), modified.timestamp() if modified else None)
+        return result
+
+    def droptables(self, dbname, prefix):
+        with self.cursor() as cursor:
+            tables = self._tables(cursor, dbname, prefix)
+            if tables:
+                sql = 'DROP TABLE ' + ', '.join(f'`{dbname}`.`{table}`' for table in tables)
+                logging.debug('DROP TABLE %d tables of %s' % (len(tables), dbname))
+                cursor.execute(sql)
+
+    def dump(self, dbname, fd, prefix=None):
+        tables = []
+        if prefix:
+            with self.cursor() as cursor:
+                tables = self._tables(cursor, dbname, prefix)
+            if not tables:
+                raise Exception('No tables starting with \'%s\' in the database %s' % (prefix, dbname))
+
+        # Quick streams the rows rather than buffering the tables, and the single transaction
+        # gives a consistent dump without locking the tables.
+        cmd = [self._dumpbin, '--quick', '--single-transaction', '--skip-lock-tables', *self._options(), dbname, *tables]
+        (returncode, _, err) = process(cmd, stdout=fd, addtoenv={'MYSQL_PWD': self._passwd})
+        if returncode != 0:
+            raise Exception('Could not dump the database %s: %s' % (dbname, err))
+
+    def restore(self, dbname, fd):
+        cmd = [self._clientbin, *self._options(), dbname]
+        (returncode, _, err) = process(cmd, stdin=fd, addtoenv={'MYSQL_PWD': self._passwd})
+        if returncode != 0:
+            raise Exception('Could not restore the database %s: %s' % (dbname, err))
+
+    def restoresnapshot(self, snapname, dbname, prefix):
+        self.droptables(dbname, prefix)
+        self._copytables(snapname, dbname, prefix)
+
+    def snapshotdb(self, dbname, snapname, prefix):
+        self.createdb(snapname)
+        self._copytables(dbname, snapname, prefix)
+
+    def tables(self, dbname, prefix):
+        with self.cursor() as cursor:
+            return self._tables(cursor, dbname, prefix)
+
+    def _copytables(self, source, target, prefix):
+        """Copy the tables, and their rows, from a database to another on the same server"""
+        with self.cursor() as cursor:
+            tables = self._tables(cursor, source, prefix)
+            logging.debug('Copying %d tables from %s to %s' % (len(tables), source, target))
+            for table in tables:
+                cursor.execute(f'CREATE TABLE `{target}`.`{table}` LIKE `{source}`.`{table}`')
+                cursor.execute(f'INSERT INTO `{target}`.`{table}` SELECT * FROM `{source}`.`{table}`')
+            cursor.connection.commit()
+
+    def _connect(self):
+        import MySQLdb as mysql
+        logging.debug('Connecting to %s:%d' % (self._host, self._port))
+        return mysql.connect(host=self._host, port=self._port, user=self._user, passwd=self._passwd, db='')
+
+    def _options(self):
+        return ['--host=%s' % self._host, '--port=%d' % self._port, '--user=%s' % self._user]
+
+    def _tables(self, cursor, dbname, prefix):
+        sql = "SELECT TABLE_NAME FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME LIKE %s"
+        cursor.execute(sql, (dbname, prefix.replace('_', '\\_').replace('%', '\\%') + '%'))
+        return [row[0] for row in cursor.fetchall()]
+
+    @property
+    def _clientbin(self):
+        return 'mysql'
+
+    @property
+    def _dumpbin(self):
+        return 'mysqldump'
 
 
 class MariaDBCursor(MySQLCursor):
-    pass
+
+    @property
+    def _clientbin(self):
+        return 'mariadb' if shutil.which('mariadb') else 'mysql'
+
+    @property
+    def _dumpbin(self):
+        return 'mariadb-dump' if shutil.which('mariadb-dump') else 'mysqldump'
 
 
 class PgSQLCursor(Database):
@@ -128,18 +451,18 @@ class PgSQLCursor(Database):
         self._passwd = str(passwd)
 
     @contextmanager
-    def cursor(self, autocommit=None):
-        import psycopg2 as pgsql
-        conn = pgsql.connect(host=self._host, port=self._port, user=self._user, password=self._passwd)
-        if autocommit is not None:
-            conn.set_session(autocommit=autocommit)
-        try:
-            cursor = conn.cursor()
-            yield cursor
-        except:
-            raise Exception('Connection failed! Make sure the database \'%s\' exists.' % self._user)
-        cursor.close()
-        conn.close()
+    def cursor(self, autocommit=None, dbname=None):
+        # The connections to a database are not kept, as they would prevent it from being
+        # dropped, or from being used as a template.
+        if dbname:
+            with self._cursor(self._connect(dbname), autocommit) as cursor:
+                yield cursor
+            return
+
+        key = ('pgsql', self._host, self._port, self._user, self._passwd)
+        with get_connection_pool().connection(key, self._connect, self._check, lambda conn: conn.rollback()) as conn:
+            with self._cursor(conn, autocommit, close=False) as cursor:
+                yield cursor
 
     def createdb(self, dbname, **options):
         with self.cursor(autocommit=True) as cursor:
@@ -160,8 +483,129 @@ class PgSQLCursor(Database):
             cursor.execute(sql)
             return cursor.fetchone() is not None
 
-    def dump(self, dbname, fd):
-        raise NotImplementedError('This method is not implemented, but it probably should be.')
+    def clonedb(self, source, target):
+        # The template copies the files of the database. It requires that nothing else is connected to it.
+        with self.cursor(autocommit=True) as cursor:
+            sql = f'CREATE DATABASE "{target}" TEMPLATE "{source}"'
+            logging.debug(sql)
+            cursor.execute(sql)
+
+    def databases_info(self, names):
+        # The tables of a database can only be listed when connected to it.
+        names = list(set(names))
+        result = {name: database_info(False) for name in names}
+        with self.cursor() as cursor:
+            sql = 'SELECT datname, pg_database_size(datname) FROM pg_database WHERE datname = ANY(%s)'
+            logging.debug(sql)
+            cursor.execute(sql, (names, ))
+            for (name, size) in cursor.fetchall():
+                result[name] = database_info(True, int(size))
+        return result
+
+    def droptables(self, dbname, prefix):
+        with self.cursor(autocommit=True, dbname=dbname) as cursor:
+            cursor.execute(PGSQL_TABLES_SQL, (pgsql_like(prefix), ))
+            tables = [row[0] for row in cursor.fetchall()]
+            if tables:
+                logging.debug('DROP TABLE %d tables of %s' % (len(tables), dbname))
+                cursor.execute('DROP TABLE ' + ', '.join(f'"{table}"' for table in tables) + ' CASCADE')
+
+    def dump(self, dbname, fd, prefix=None):
+        cmd = ['pg_dump', *self._options(), *pgsql_dump_options(prefix), dbname]
+        (returncode, _, err) = process(cmd, stdout=fd, addtoenv={'PGPASSWORD': self._passwd})
+        if returncode != 0:
+            raise Exception('Could not dump the database %s: %s' % (dbname, err))
+
+    def restore(self, dbname, fd):
+        cmd = ['pg_restore', *self._options(), *pgsql_restore_options(), '-d', dbname]
+        (returncode, _, err) = process(cmd, stdin=fd, addtoenv={'PGPASSWORD': self._passwd})
+        if returncode != 0:
+            raise Exception('Could not restore the database %s: %s' % (dbname, err))
+
+    def restoresnapshot(self, snapname, dbname, prefix):
+        self.droptables(dbname, prefix)
+        self._copytables(snapname, dbname, prefix)
+
+    def snapshotdb(self, dbname, snapname, prefix):
+        # Only the tables of the prefix are copied. A template would copy the whole database, and
+        # cannot be used while another session, such as a web request, is connected to it.
+        self.createdb(snapname)
+        try:
+            self._copytables(dbname, snapname, prefix)
+        except Exception:
+            self.dropdb(snapname)
+            raise
+
+    def tables(self, dbname, prefix):
+        with self.cursor(dbname=dbname) as cursor:
+            cursor.execute(PGSQL_TABLES_SQL, (pgsql_like(prefix), ))
+            return [row[0] for row in cursor.fetchall()]
+
+    def _copytables(self, source, target, prefix):
+        """Copy the tables starting with prefix, streamed from pg_dump to pg_restore without going through a file"""
+        cmd = ['pg_restore', *self._options(), *pgsql_restore_options(), '-d', target]
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+                                env={**os.environ, 'PGPASSWORD': self._passwd})
+        try:
+            self.dump(source, proc.stdin, prefix=prefix)
+        finally:
+            proc.stdin.close()
+            err = proc.stderr.read()
+            proc.wait()
+        if proc.returncode != 0:
+            raise Exception('Could not copy the tables of %s to %s: %s' % (source, target, err.decode('utf-8', 'replace')))
+
+    def _check(self, conn):
+        if conn.closed:
+            return False
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    def _connect(self, dbname=None):
+        import psycopg2 as pgsql
+        logging.debug('Connecting to %s:%d' % (self._host, self._port))
+        kwargs = {'dbname': dbname} if dbname else {}
+        return pgsql.connect(host=self._host, port=self._port, user=self._user, password=self._passwd, **kwargs)
+
+    @contextmanager
+    def _cursor(self, conn, autocommit, close=True):
+        conn.set_session(autocommit=bool(autocommit))
+        try:
+            cursor = conn.cursor()
+            yield cursor
+        except:
+            raise Exception('Connection failed! Make sure the database \'%s\' exists.' % self._user)
+        cursor.close()
+        if close:
+            conn.close()
+
+    def _options(self):
+        return ['-h', self._host, '-p', str(self._port), '-U', self._user, '-w']
+
+
+# The tables of the current schema starting with a prefix.
+PGSQL_TABLES_SQL = "SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE %s"
+
+
+def pgsql_like(prefix):
+    """Return the pattern matching the names starting with prefix"""
+    return prefix.replace('_', '\\_').replace('%', '\\%') + '%'
+
+
+def pgsql_dump_options(prefix=None):
+    """Options of pg_dump, the custom format can be streamed to pg_restore
+
+    The custom format is not compressed, the compression is left to the caller.
+    """
+    options = ['-Fc', '-Z0']
+    if prefix:
+        options += ['-t', prefix + '*']
+    return options
+
+
+def pgsql_restore_options():
+    """Options of pg_restore, to replace the existing tables"""
+    return ['--clean', '--if-exists', '--no-owner', '--single-transaction']
 
 
 class PgSQLDocker(Database):
@@ -179,14 +623,81 @@ class PgSQLDocker(Database):
         code, stdout, _ = self.exec(['psql', '-t', '-A', '-c', f"SELECT 1 FROM pg_database WHERE datname = '{dbname}'"])
         return code == 0 and stdout.strip() == "1"
 
-    def dump(self, dbname, fd):
-        self.exec(['pg_dump', '-d', dbname], stdout=fd)
+    def clonedb(self, source, target):
+        (returncode, _, err) = self.exec(['createdb', '-T', source, target])
+        if returncode != 0:
+            raise Exception('Could not copy the database %s: %s' % (source, err))
+
+    def databases_info(self, names):
+        names = list(set(names))
+        result = {name: database_info(False) for name in names}
+        if not names:
+            return result
+        quoted = ', '.join("'%s'" % name.replace("'", "''") for name in names)
+        sql = f'SELECT datname, pg_database_size(datname) FROM pg_database WHERE datname IN ({quoted})'
+        (returncode, stdout, err) = self.exec(['psql', '-t', '-A', '-F', '\t', '-c', sql])
+        if returncode != 0:
+            raise Exception('Could not read the information about the databases: %s' % err)
+        for line in stdout.splitlines():
+            if '\t' in line:
+                (name, size) = line.split('\t', 1)
+                result[name] = database_info(True, int(size))
+        return result
+
+    def droptables(self, dbname, prefix):
+        # The tables are dropped from a block, as psql does not take parameters for the prefix.
+        pattern = pgsql_like(prefix).replace("'", "''")
+        sql = ("DO $$ DECLARE r record; BEGIN FOR r IN SELECT tablename FROM pg_tables WHERE schemaname = current_schema() "
+               f"AND tablename LIKE '{pattern}' LOOP EXECUTE 'DROP TABLE ' || quote_ident(r.tablename) || ' CASCADE'; "
+               "END LOOP; END $$;")
+        (returncode, _, err) = self.exec(['psql', '-d', dbname, '-v', 'ON_ERROR_STOP=1', '-c', sql])
+        if returncode != 0:
+            raise Exception('Could not drop the tables of the database %s: %s' % (dbname, err))
+
+    def dump(self, dbname, fd, prefix=None):
+        (returncode, _, err) = self.exec(['pg_dump', *pgsql_dump_options(prefix), dbname], stdout=fd)
+        if returncode != 0:
+            raise Exception('Could not dump the database %s: %s' % (dbname, err))
+
+    def restore(self, dbname, fd):
+        (returncode, _, err) = self.exec(['pg_restore', *pgsql_restore_options(), '-d', dbname], stdin=fd)
+        if returncode != 0:
+            raise Exception('Could not restore the database %s: %s' % (dbname, err))
+
+    def tables(self, dbname, prefix):
+        pattern = pgsql_like(prefix).replace("'", "''")
+        sql = f"SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE '{pattern}'"
+        (returncode, stdout, err) = self.exec(['psql', '-d', dbname, '-t', '-A', '-c', sql])
+        if returncode != 0:
+            raise Exception('Could not list the tables of the database %s: %s' % (dbname, err))
+        return [line for line in stdout.splitlines() if line]
 
     def exec(self, command: List[str], **kwargs):
         hostcommand = ['docker', 'exec', '-i', '-u', 'postgres', self._name, *command]
         return process(hostcommand, **kwargs)
 
 
+_sqlsrvdriver = None
+
+
+def get_sqlsrv_driver() -> str:
+    """Return the name of the installed ODBC driver for SQL Server, it is only looked up once"""
+    global _sqlsrvdriver
+    if _sqlsrvdriver is None:
+        import pyodbc
+
+        # Look for installed ODBC Driver for SQL Server.
+        drivers = pyodbc.drivers()
+        sqlsrvdriver = next((driver for driver in drivers if "for SQL Server" in driver), None)
+        if sqlsrvdriver is None:
+            installurl = 'https://sqlchoice.azurewebsites.net/en-us/sql-server/developer-get-started/python'
+            raise Exception("You need to install an ODBC Driver for SQL Server. Check out %s for more info." % installurl)
+
+        logging.debug('Using %s' % sqlsrvdriver)
+        _sqlsrvdriver = sqlsrvdriver
+    return _sqlsrvdriver
+
+
 class SQLServerCursor(Database):
 
     _host: str
@@ -202,24 +713,14 @@ class SQLServerCursor(Database):
 
     @contextmanager
     def cursor(self, autocommit=True):
-        import pyodbc
-
-        # Look for installed ODBC Driver for SQL Server.
-        drivers = pyodbc.drivers()
-        sqlsrvdriver = next((driver for driver in drivers if "for SQL Server" in driver), None)
-        if sqlsrvdriver is None:
-            installurl = 'https://sqlchoice.azurewebsites.net/en-us/sql-server/developer-get-started/python'
-            raise Exception("You need to install an ODBC Driver for SQL Server. Check out %s for more info." % installurl)
-
-        logging.debug('Using %s' % sqlsrvdriver)
-
-        connectionstr = f"DRIVER={sqlsrvdriver};SERVER={self._host};PORT={self._port};UID={self._user};PWD={self._passwd}"
-        conn = pyodbc.connect(connectionstr)
-        conn.autocommit = autocommit
-        cursor = conn.cursor()
-        yield cursor
-        cursor.close()
-        conn.close()
+        key = ('sqlsrv', self._host, self._port, self._user, self._passwd)
+        with get_connection_pool().connection(key, self._connect, self._check, lambda conn: conn.rollback()) as conn:
+            conn.autocommit = autocommit
+            cursor = conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
 
     def createdb(self, dbname, **options):
         with self.cursor(autocommit=False) as cursor:
@@ -243,9 +744,43 @@ class SQLServerCursor(Database):
             cursor.execute(sql)
             return cursor.fetchone()[0] > 0
 
-    def dump(self, dbname, fd):
+    def databases_info(self, names):
+        names = list(set(names))
+        result = {name: database_info(False) for name in names}
+        if not names:
+            return result
+        with self.cursor() as cursor:
+            sql = ('SELECT d.name, SUM(CAST(f.size AS BIGINT)) * 8192 FROM sys.databases d '
+                   'LEFT JOIN sys.master_files f ON f.database_id = d.database_id '
+                   'WHERE d.name IN (%s) GROUP BY d.name' % ', '.join(['?'] * len(names)))
+            logging.debug(sql)
+            cursor.execute(sql, *names)
+            for (name, size) in cursor.fetchall():
+                result[name] = database_info(True, int(size) if size is not None else None)
+        return result
+
+    def dump(self, dbname, fd, prefix=None):
         raise NotImplementedError('This method is not implemented, but it probably should be.')
 
+    def tables(self, dbname, prefix):
+        pattern = prefix.replace('[', '[[]').replace('_', '[_]').replace('%', '[%]') + '%'
+        with self.cursor() as cursor:
+            cursor.execute(f'SELECT TABLE_NAME FROM [{dbname}].INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME LIKE ?', pattern)
+            return [row[0] for row in cursor.fetchall()]
+
+    def _check(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def _connect(self):
+        import pyodbc
+        sqlsrvdriver = get_sqlsrv_driver()
+        connectionstr = f"DRIVER={sqlsrvdriver};SERVER={self._host};PORT={self._port};UID={self._user};PWD={self._passwd}"
+        return pyodbc.connect(connectionstr)
+
 
 class DB(object):
     """
@@ -407,14 +942,20 @@ class DB(object):
         except:
             pass
 
-    def dump(self, fd, prefix=''):
-        """Dump a database to the file descriptor passed"""
+    def dump(self, fd, prefix='', batchsize=1048576):
+        """Dump a database to the file descriptor passed
+
+        The rows are streamed from the server, and written in INSERT statements of up to
+        batchsize bytes, so that neither the rows nor the dump are held in memory.
+        """
 
         if self.engine not in ('mysqli', 'mariadb'):
             raise Exception('Function dump not supported by %s' % self.engine)
         if not isinstance(fd, IOBase):
             raise Exception('Passed parameter is not a file object')
 
+        import MySQLdb.cursors
+
         # Looping over selected tables
         tables = self.tables()
         for table in tables:
@@ -427,19 +968,38 @@ class DB(object):
 
             # Get the columns
             columns = self.columns(table)
+            insert = 'INSERT INTO %s (%s) VALUES ' % (table, ','.join(columns))
 
-            # Get the field values
-            self.cur.execute('SELECT %s FROM %s' % (','.join(columns), table))
-            for row in self.cur.fetchall():
-                values = []
-                for value in row:
-                    if value == None:
-                        value = 'null'
-                    else:
-                        value = str(self.conn.escape(value))
-                    values.append(value)
-                insert = 'INSERT INTO %s (%s) VALUES(%s)' % (table, ','.join(columns), ','.join(values))
-                fd.write(insert + ';\n')
+            # Get the field values, a server side cursor does not fetch all the rows at once.
+            cur = self.conn.cursor(MySQLdb.cursors.SSCursor)
+            try:
+                cur.execute('SELECT %s FROM %s' % (','.join(columns), table))
+                statement = []
+                size = 0
+                while True:
+                    rows = cur.fetchmany(1000)
+                    if not rows:
+                        break
+                    for row in rows:
+                        values = []
+                        for value in row:
+                            if value == None:
+                                value = 'null'
+                            else:
+                                value = self.conn.literal(value)
+                                value = value.decode('utf-8') if type(value) == bytes else str(value)
+                            values.append(value)
+                        values = '(%s)' % ','.join(values)
+                        statement.append(values)
+                        size += len(values)
+                        if size >= batchsize:
+                            fd.write(insert + ','.join(statement) + ';\n')
+                            statement = []
+                            size = 0
+                if statement:
+                    fd.write(insert + ','.join(statement) + ';\n')
+            finally:
+                cur.close()
 
     def execute(self, query):
         self.cur.execute(query)
@@ -19,33 +19,152 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 http://github.com/FMCorz/mdk
 """
 
+import json
+import logging
+import os
 import re
-from typing import Optional
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from mdk.config import Conf
 from mdk.tools import process
 
+C = Conf()
+
+# The number of seconds during which the state of Docker is reused rather than read again.
+STATE_TTL = 10
+
+_api = None
+_apilock = threading.Lock()
+_containers = None
+_networks = None
+_statelock = threading.Lock()
+
+# Returned by _call_docker_api when the docker command is to be used instead.
+_USE_CLI = object()
+
 
 def create_docker_network(name: str) -> bool:
     """Create a Docker network with the given name."""
     r, _, _ = process(['docker', 'network', 'create', name])
+    invalidate_docker_state()
     return r == 0
 
 
 def docker_container_exists(name: str) -> bool:
     """Check if a Docker container exists."""
-    r, out, _ = process(['docker', 'ps', '-a', '--filter', f'name=^{name}$', '-q'])
-    return r == 0 and out.strip() != ''
+    return name in get_docker_state()
+
+
+def docker_exec(name: str, command: List[str], workdir: Optional[str] = None, user: Optional[str] = None,
+                env: Optional[Dict[str, str]] = None, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE) -> Optional[Tuple]:
+    """Run a command in a Docker container through the Engine API.
+
+    The result is the one of process(), or None when the API cannot be used and the docker
+    command must be used instead. Like with process(), the output of the command is captured
+    when its stream is subprocess.PIPE, and written to the standard output or error when None.
+    """
+    logging.debug(' '.join(command))
+    try:
+        execid = _call_docker_api('createExec', name, command, workdir=workdir, user=user, env=env)
+    except Exception as e:
+        # Like with the docker command, an error of Docker is reported as the failure of the command.
+        return (1, '' if stdout == subprocess.PIPE else None, str(e) if stderr == subprocess.PIPE else None)
+    if execid is _USE_CLI:
+        return None
+
+    if stderr == subprocess.STDOUT:
+        stderr = stdout
+        merged = True
+    else:
+        merged = False
+
+    output = {1: [], 2: []}
+    for stream, data in get_docker_api().startExec(execid):
+        stream = 2 if stream == 2 and not merged else 1
+        target = stdout if stream == 1 else stderr
+        if target == subprocess.PIPE:
+            output[stream].append(data)
+        elif target is None:
+            buffer = sys.stdout.buffer if stream == 1 else sys.stderr.buffer
+            buffer.write(data)
+            buffer.flush()
+        elif target != subprocess.DEVNULL:
+            os.write(target if isinstance(target, int) else target.fileno(), data)
+
+    out = b''.join(output[1]).decode('utf-8', 'replace') if stdout == subprocess.PIPE else None
+    err = b''.join(output[2]).decode('utf-8', 'replace') if stderr == subprocess.PIPE and not merged else None
+    return (get_docker_api().waitExec(execid), out, err)
 
 
 def docker_network_exists(name: str) -> bool:
     """Check if a Docker network exists."""
-    r, _, _ = process(['docker', 'network', 'inspect', name])
-    return r == 0
+    return name in get_docker_networks()
+
+
+def get_docker_containers() -> Dict[str, str]:
+    """Return the state of all the Docker containers, keyed by name."""
+    return {name: container['state'] for name, container in get_docker_state().items()}
+
+
+def get_docker_api():
+    """Return the client of the Docker Engine API, or None when the docker command is to be used.
+
+    The API is used when enabled with docker.api, and when its socket answers.
+    """
+    global _api
+    with _apilock:
+        if _api is None:
+            _api = False
+            if C.get('docker.api'):
+                from mdk.dockerapi import DockerAPI, get_docker_socket
+                path = get_docker_socket()
+                api = DockerAPI(path) if path else None
+                if api and api.ping():
+                    _api = api
+                else:
+                    logging.debug('The Docker Engine API cannot be used, using the docker command')
+        return _api or None
+
+
+def get_docker_networks() -> List[str]:
+    """Return the names of the Docker networks, they are listed once for all."""
+    global _networks
+    with _statelock:
+        if _networks is None or time.monotonic() - _networks[0] > STATE_TTL:
+            _networks = (time.monotonic(), _read_docker_networks())
+        return _networks[1]
+
+
+def get_docker_state() -> Dict[str, Dict]:
+    """Return the Docker containers, keyed by name.
+
+    All the containers are listed with a single call, and the result is reused for a few
+    seconds. Each container has its state, the local ports its ports are published on, and
+    its networks.
+    """
+    global _containers
+    with _statelock:
+        if _containers is None or time.monotonic() - _containers[0] > STATE_TTL:
+            _containers = (time.monotonic(), _read_docker_state())
+        return _containers[1]
+
+
+def invalidate_docker_state():
+    """Forget the state of Docker, to be called after changing it."""
+    global _containers, _networks
+    with _statelock:
+        _containers = None
+        _networks = None
 
 
 def is_docker_container_running(name: str) -> bool:
     """Check if a Docker container is running."""
-    r, _, _ = process(['docker', 'top', name])
-    return r == 0
+    container = get_docker_state().get(name)
+    return container is not None and container['state'] == 'running'
 
 
 def ensure_docker_network_exists(name: str):
@@ -58,16 +177,172 @@ def ensure_docker_network_exists(name: str):
 
 def get_local_docker_port(name: str, destpost: int) -> Optional[int]:
     """Get the local port for a Docker container."""
-    r, out, _ = process(['docker', 'port', name, str(destpost)])
+    container = get_docker_state().get(name)
+    if not container:
+        return None
+    return container['ports'].get(int(destpost))
+
+
+def parse_docker_ports(ports: str) -> Dict[int, int]:
+    """Return the local ports from the ports listed by docker ps, keyed by the port of the container."""
+    result = {}
+    for mapping in ports.split(','):
+        match = re.search(r':(\d+)(?:-(\d+))?->(\d+)(?:-(\d+))?/tcp$', mapping.strip())
+        if not match:
+            continue
+        localport = int(match.group(1))
+        port = int(match.group(3))
+        count = int(match.group(4) or port) - port + 1
+        for i in range(count):
+            result.setdefault(port + i, localport + i)
+    return result
+
+
+def inspect_docker_container(name: str) -> Optional[Dict]:
+    """Return the low-level information about a Docker container, or None when it does not exist."""
+    try:
+        info = _call_docker_api('inspect', name)
+    except Exception as e:
+        logging.debug(f'Could not inspect the container "{name}": {e}')
+        return None
+    if info is not _USE_CLI:
+        return info
+
+    r, out, _ = process(['docker', 'inspect', '--type', 'container', name])
     if r != 0:
         return None
-    match = re.search(r':(\d+)$', out)
-    if match:
-        return int(match.group(1))
-    return None
+    return json.loads(out)[0]
+
+
+def remove_docker_container(name: str) -> bool:
+    """Remove a Docker container."""
+    return _change_docker_container('remove', ['docker', 'rm', name], name)
 
 
 def start_docker_container(name: str) -> bool:
     """Start a Docker container."""
-    r, _, _ = process(['docker', 'start', name])
-    return r == 0
+    return _change_docker_container('start', ['docker', 'start', name], name)
+
+
+def stop_docker_container(name: str) -> bool:
+    """Stop a Docker container."""
+    return _change_docker_container('stop', ['docker', 'stop', name], name)
+
+
+def stream_docker_logs(name: str, follow: bool = False, stdout: bool = True, stderr: bool = True):
+    """Write the logs of a Docker container to the standard output and error."""
+    try:
+        frames = _call_docker_api('logs', name, stdout=stdout, stderr=stderr, follow=follow)
+    except Exception as e:
+        raise Exception(f'Could not read the logs of the container "{name}": {e}')
+
+    if frames is _USE_CLI:
+        process(['docker', 'logs', name] + (['-f'] if follow else []),
+                stdout=None if stdout else subprocess.DEVNULL,
+                stderr=None if stderr else subprocess.DEVNULL)
+        return
+
+    for stream, data in frames:
+        buffer = sys.stderr.buffer if stream == 2 else sys.stdout.buffer
+        buffer.write(data)
+        buffer.flush()
+
+
+def _call_docker_api(method: str, *args, **kwargs):
+    """Call a method of the Docker Engine API, or return _USE_CLI when the docker command is to be used.
+
+    The errors returned by Docker are raised. When the engine cannot be reached, the API is
+    no longer used and the docker command is used instead.
+    """
+    global _api
+    api = get_docker_api()
+    if not api:
+        return _USE_CLI
+
+    from mdk.dockerapi import DockerAPIError
+    try:
+        return getattr(api, method)(*args, **kwargs)
+    except DockerAPIError as e:
+        if e.status is not None:
+            raise
+        logging.debug(f'{e}, using the docker command')
+        with _apilock:
+            _api = False
+        return _USE_CLI
+
+
+def _change_docker_container(method: str, command: List[str], name: str) -> bool:
+    try:
+        result = _call_docker_api(method, name)
+    except Exception as e:
+        logging.error(f'Docker: {e}')
+        result = False
+    if result is _USE_CLI:
+        r, _, err = process(command)
+        if r != 0:
+            logging.error(err.strip())
+        result = r == 0
+    invalidate_docker_state()
+    return result
+
+
+def _read_docker_networks() -> List[str]:
+    try:
+        networks = _call_docker_api('networks')
+    except Exception as e:
+        logging.debug(f'Could not list the Docker networks: {e}')
+        return []
+    if networks is not _USE_CLI:
+        return [network['Name'] for network in networks]
+
+    try:
+        r, out, _ = process(['docker', 'network', 'ls', '--format', '{{.Name}}'])
+    except OSError:
+        return []
+    return out.split() if r == 0 else []
+
+
+def _read_docker_state() -> Dict[str, Dict]:
+    try:
+        containers = _call_docker_api('containers')
+    except Exception as e:
+        logging.debug(f'Could not list the Docker containers: {e}')
+        return {}
+    if containers is not _USE_CLI:
+        return _read_docker_state_from_api(containers)
+
+    try:
+        r, out, _ = process(['docker', 'ps', '-a', '--no-trunc', '--format', '{{json .}}'])
+    except OSError:
+        return {}
+    if r != 0:
+        return {}
+
+    containers = {}
+    for line in out.splitlines():
+        try:
+            info = json.loads(line)
+        except ValueError:
+            continue
+        # The state is not given by older versions of Docker.
+        state = info.get('State') or ('running' if info.get('Status', '').startswith('Up') else 'exited')
+        for name in info.get('Names', '').split(','):
+            containers[name] = {
+                'state': state,
+                'ports': parse_docker_ports(info.get('Ports', '')),
+                'networks': [n for n in info.get('Networks', '').split(',') if n],
+            }
+    return containers
+
+
+def _read_docker_state_from_api(containers: List[Dict]) -> Dict[str, Dict]:
+    result = {}
+    for info in containers:
+        ports = {}
+        for port in info.get('Ports') or []:
+            if port.get('Type') == 'tcp' and port.get('PublicPort'):
+                ports.setdefault(port['PrivatePort'], port['PublicPort'])
+        networks = list(((info.get('NetworkSettings') or {}).get('Networks') or {}).keys())
+        for name in info.get('Names') or []:
+            result[name.lstrip('/')] = {'state': info.get('State'), 'ports': ports, 'networks': networks}
+    return result
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import http.client
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+DEFAULT_SOCKET = '/var/run/docker.sock'
+
+# The streams of the multiplexed output of the containers.
+STDOUT = 1
+STDERR = 2
+
+
+def get_docker_socket() -> Optional[str]:
+    """Return the path to the socket of the Docker Engine, or None when it is not reached through a socket"""
+    host = os.environ.get('DOCKER_HOST')
+    if host:
+        return host[len('unix://'):] if host.startswith('unix://') else None
+    return DEFAULT_SOCKET if os.path.exists(DEFAULT_SOCKET) else None
+
+
+class DockerAPIError(Exception):
+    """An error of the Docker Engine API
+
+    The status is the one of the response, it is None when the engine could not be reached.
+    """
+
+    def __init__(self, status: Optional[int], message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket"""
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__('localhost')
+        self._path = path
+        self._timeout = timeout
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
+        try:
+            sock.connect(self._path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class DockerAPI(object):
+    """Client of the Docker Engine API, talking to its Unix socket
+
+    Starting the docker command takes a significant time, which adds up when MDK calls it many
+    times. The requests are sent over a connection kept open, one per thread, and only the
+    responses which are streamed, such as the output of a command or the logs, use a connection
+    of their own.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET, timeout: Optional[float] = None):
+        """
+        :param path: The path to the socket of the engine.
+        :param timeout: The number of seconds after which a request without answer fails.
+        """
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def close(self):
+        """Close the connection of the current thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def containers(self, all: bool = True) -> List[Dict]:
+        """List the containers, including the stopped ones when all is set"""
+        return self.request('GET', '/containers/json', {'all': int(all)})
+
+    def createExec(self, name: str, command: List[str], workdir: Optional[str] = None, user: Optional[str] = None,
+                   env: Optional[Dict[str, str]] = None) -> str:
+        """Prepare a command to run in a container, and return the ID of the exec instance"""
+        body = {'AttachStdout': True, 'AttachStderr': True, 'Cmd': command}
+        if workdir:
+            body['WorkingDir'] = workdir
+        if user:
+            body['User'] = user
+        if env:
+            body['Env'] = ['%s=%s' % (key, value) for key, value in env.items()]
+        return self.request('POST', '/containers/%s/exec' % quote(name, safe=''), body=body)['Id']
+
+    def exec(self, name: str, command: List[str], **kwargs) -> Tuple[int, bytes, bytes]:
+        """Run a command in a container, and return its exit code, its output and its error output"""
+        execid = self.createExec(name, command, **kwargs)
+        output = {STDOUT: [], STDERR: []}
+        for stream, data in self.startExec(execid):
+            output.get(stream, output[STDOUT]).append(data)
+        return (self.waitExec(execid), b''.join(output[STDOUT]), b''.join(output[STDERR]))
+
+    def inspect(self, name: str) -> Dict:
+        """Return the low-level information about a container"""
+        return self.request('GET', '/containers/%s/json' % quote(name, safe=''))
+
+    def logs(self, name: str, stdout: bool = True, stderr: bool = True, follow: bool = False,
+             tail: Optional[int] = None) -> Iterator[Tuple[int, bytes]]:
+        """Stream the logs of a container, as tuples of the stream and the data"""
+        tty = bool(self.inspect(name).get('Config', {}).get('Tty'))
+        query = {'stdout': int(stdout), 'stderr': int(stderr), 'follow': int(follow)}
+        if tail is not None:
+            query['tail'] = tail
+        return self._stream('GET', '/containers/%s/logs' % quote(name, safe=''), query, tty=tty)
+
+    def networks(self) -> List[Dict]:
+        """List the networks"""
+        return self.request('GET', '/networks')
+
+    def ping(self) -> bool:
+        """Whether the engine answers"""
+        connection = UnixHTTPConnection(self.path, timeout=2)
+        try:
+            connection.request('GET', '/_ping')
+            return connection.getresponse().status == 200
+        except (OSError, http.client.HTTPException) as e:
+            logging.debug('The Docker Engine API at %s did not answer: %s' % (self.path, e))
+            return False
+        finally:
+            connection.close()
+
+    def port(self, name: str, port: int) -> Optional[int]:
+        """Return the local port to which a TCP port of a container is published"""
+        ports = (self.inspect(name).get('NetworkSettings') or {}).get('Ports') or {}
+        for binding in ports.get('%d/tcp' % port) or []:
+            if binding.get('HostPort'):
+                return int(binding['HostPort'])
+        return None
+
+    def remove(self, name: str) -> bool:
+        """Remove a container"""
+        self.request('DELETE', '/containers/%s' % quote(name, safe=''))
+        return True
+
+    def request(self, method: str, path: str, query: Optional[Dict] = None, body: Optional[Dict] = None):
+        """Send a request over the connection of the thread, and return the decoded response"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = UnixHTTPConnection(self.path, self.timeout)
+
+        reused = connection.sock is not None
+        try:
+            try:
+                response = self._send(connection, method, path, query, body)
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # The engine closes the connections which are idle, the request is sent again over a new one.
+                connection.close()
+                if not reused:
+                    raise
+                response = self._send(connection, method, path, query, body)
+            data = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise DockerAPIError(None, 'Could not reach the Docker Engine API: %s' % e) from e
+
+        if response.status >= 400:
+            raise DockerAPIError(response.status, self._getErrorMessage(data))
+        elif data and response.getheader('Content-Type', '').startswith('application/json'):
+            return json.loads(data)
+        return data
+
+    def start(self, name: str) -> bool:
+        """Start a container, it is not an error when it is already running"""
+        self.request('POST', '/containers/%s/start' % quote(name, safe=''))
+        return True
+
+    def startExec(self, execid: str) -> Iterator[Tuple[int, bytes]]:
+        """Start an exec instance, and stream its output as tuples of the stream and the data"""
+        return self._stream('POST', '/exec/%s/start' % execid, body={'Detach': False, 'Tty': False})
+
+    def stop(self, name: str, timeout: Optional[int] = None) -> bool:
+        """Stop a container, it is not an error when it is not running"""
+        query = {'t': timeout} if timeout is not None else None
+        self.request('POST', '/containers/%s/stop' % quote(name, safe=''), query)
+        return True
+
+    def waitExec(self, execid: str, timeout: float = 5) -> int:
+        """Return the exit code of an exec instance, waiting for its command to have exited"""
+        deadline = time.monotonic() + timeout
+        while True:
+            info = self.request('GET', '/exec/%s/json' % execid)
+            if not info.get('Running') or time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+        if info.get('ExitCode') is None:
+            raise DockerAPIError(None, 'Could not read the exit code of the command')
+        return info['ExitCode']
+
+    def _getErrorMessage(self, data: bytes) -> str:
+        try:
+            return json.loads(data)['message']
+        except (ValueError, KeyError, TypeError):
+            return data.decode('utf-8', 'replace').strip()
+
+    def _readExactly(self, response: http.client.HTTPResponse, size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = response.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def _send(self, connection: http.client.HTTPConnection, method: str, path: str, query: Optional[Dict],
+              body: Optional[Dict]) -> http.client.HTTPResponse:
+        url = path + ('?' + urlencode(query) if query else '')
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        logging.debug('Docker API: %s %s' % (method, url))
+        connection.request(method, url, payload, headers)
+        return connection.getresponse()
+
+    def _stream(self, method: str, path: str, query: Optional[Dict] = None, body: Optional[Dict] = None,
+                tty: bool = False) -> Iterator[Tuple[int, bytes]]:
+        """Send a request whose response is streamed, over a connection of its own
+
+        Unless the container has a TTY, the output is multiplexed: each frame starts with the
+        stream it comes from and its size.
+        """
+        connection = UnixHTTPConnection(self.path, self.timeout)
+        try:
+            response = self._send(connection, method, path, query, body)
+            if response.status >= 400:
+                raise DockerAPIError(response.status, self._getErrorMessage(response.read()))
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            raise DockerAPIError(None, 'Could not reach the Docker Engine API: %s' % e) from e
+        except DockerAPIError:
+            connection.close()
+            raise
+
+        def frames():
+            try:
+                while True:
+                    if tty:
+                        data = response.read1(65536)
+                        if not data:
+                            return
+                        yield (STDOUT, data)
+                        continue
+
+                    header = self._readExactly(response, 8)
+                    if len(header) < 8:
+                        return
+                    (stream, size) = struct.unpack('>BxxxL', header)
+                    yield (stream, self._readExactly(response, size))
+            finally:
+                response.close()
+                connection.close()
+
+        return frames()
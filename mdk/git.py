@@ -23,6 +23,7 @@ http://github.com/FMCorz/mdk
 """
 
 import logging
+import os
 import re
 import shlex
 import subprocess
@@ -32,8 +33,11 @@ class Git(object):
 
     _path = None
     _bin = None
+    _repositories = None
+    _snapshot = None
 
     def __init__(self, path, bin='/usr/bin/git'):
+        self._repositories = set()
         self.setPath(path)
         self.setBin(bin)
 
@@ -104,6 +108,12 @@ class Git(object):
         return result[1]
 
     def currentBranch(self):
+        head = self.getSnapshot('head')
+        if head is not None:
+            if not head.startswith('refs/heads/'):
+                return 'HEAD'
+            return head.replace('refs/heads/', '', 1)
+
         cmd = 'symbolic-ref -q HEAD'
         result = self.execute(cmd)
         if result[0] != 0:
@@ -116,13 +126,17 @@ class Git(object):
         result = self.execute(cmd)
         return result[0] == 0
 
-    def execute(self, cmd, path=None):
+    def execute(self, cmd, path=None, readonly=False):
         if path == None:
             path = self.getPath()
 
         if not self.isRepository(path):
             raise Exception('This is not a Git repository')
 
+        # Any command may change the refs or the config, even when the timestamps do not tell.
+        if not readonly:
+            self._snapshot = None
+
         if not type(cmd) == list:
             cmd = shlex.split(str(cmd))
         cmd.insert(0, self.getBin())
@@ -142,13 +156,18 @@ class Git(object):
 
         return (proc.returncode, stdout.decode('utf-8'), stderr.decode('utf-8'))
 
-    def fetch(self, remote='', ref=''):
+    def fetch(self, remote='', ref='', options=''):
         remote = self.updateUnauthenticatedGithub(remote)
-        cmd = 'fetch %s %s' % (remote, ref)
+        cmd = 'fetch %s %s %s' % (options, remote, ref)
         result = self.execute(cmd)
         return result[0] == 0
 
     def getConfig(self, name):
+        config = self.getSnapshot('config')
+        if config is not None:
+            values = config.get(self._normaliseConfigName(name))
+            return values[-1] if values else None
+
         cmd = 'config --get %s' % name
         result = self.execute(cmd)
         if result[0] == 0:
@@ -162,6 +181,10 @@ class Git(object):
 
     def getRemotes(self):
         """Return the remotes"""
+        remotes = self.getSnapshot('remotes')
+        if remotes is not None:
+            return dict(remotes)
+
         cmd = 'remote -v'
         result = self.execute(cmd)
         remotes = None
@@ -175,6 +198,12 @@ class Git(object):
         return remotes
 
     def hasBranch(self, branch, remote=''):
+        refs = self.getSnapshot('refs')
+        if refs is not None:
+            if remote != '':
+                return 'refs/remotes/%s/%s' % (remote, branch) in refs
+            return 'refs/heads/%s' % branch in refs
+
         if remote != '':
             cmd = 'show-ref --verify --quiet "refs/remotes/%s/%s"' % (remote, branch)
         else:
@@ -191,6 +220,10 @@ class Git(object):
         if path == None:
             path = self.getPath()
 
+        # A repository is not expected to stop being one, so only that outcome is remembered.
+        if path in self._repositories:
+            return True
+
         cmd = shlex.split(str('%s log -1') % self.getBin())
         proc = subprocess.Popen(cmd,
             stdout=subprocess.PIPE,
@@ -198,6 +231,8 @@ class Git(object):
             cwd=path
         )
         proc.wait()
+        if proc.returncode == 0:
+            self._repositories.add(path)
         return proc.returncode == 0
 
     def updateUnauthenticatedGithub(self, path):
@@ -279,14 +314,18 @@ class Git(object):
 
     def remoteBranches(self, remote):
         pattern = 'refs/remotes/%s' % remote
-        cmd = 'show-ref'
 
-        result = self.execute(cmd)
-        if result[0] != 0:
-            return []
+        refs = self.getSnapshot('refs')
+        if refs is not None:
+            lines = ['%s %s' % (hash, ref) for ref, hash in refs.items()]
+        else:
+            result = self.execute('show-ref')
+            if result[0] != 0:
+                return []
+            lines = result[1].split('\n')
 
         refs = []
-        for ref in result[1].split('\n'):
+        for ref in lines:
             try:
                 (hash, ref) = ref.split(' ', 1)
             except ValueError:
@@ -340,6 +379,151 @@ class Git(object):
 
     def setPath(self, path):
         self._path = str(path)
+        self._snapshot = None
+
+    def getSnapshot(self, key):
+        """Return a value from the snapshot of the repository
+
+        The snapshot answers the questions about HEAD, the refs, the config and the remotes without
+        invoking Git for each of them. Each value is read once, and read again when the files it
+        comes from change, or after any other command was executed. None is returned when the
+        value cannot be read from the snapshot, the callers must then ask Git.
+
+        :param key: One of 'head', 'refs', 'config' or 'remotes'.
+        """
+        signature = self._getSnapshotSignature()
+        if signature is None:
+            self._snapshot = None
+            return None
+        elif not self._snapshot or self._snapshot['signature'] != signature:
+            self._snapshot = {'signature': signature}
+
+        if key not in self._snapshot:
+            loaders = {
+                'head': self._loadSnapshotHead,
+                'refs': self._loadSnapshotRefs,
+                'config': self._loadSnapshotConfig,
+                'remotes': self._loadSnapshotRemotes,
+            }
+            value = loaders[key](signature[0])
+            if value is None:
+                return None
+            self._snapshot[key] = value
+
+        return self._snapshot[key]
+
+    def _getGitDirs(self):
+        """Return the Git directory and the common directory, when not using reftable"""
+        gitdir = os.path.join(self.getPath(), '.git')
+        if os.path.isfile(gitdir):
+            # Worktrees and submodules point to their Git directory.
+            try:
+                with open(gitdir, 'r') as f:
+                    content = f.read().strip()
+            except OSError:
+                return None
+            if not content.startswith('gitdir:'):
+                return None
+            gitdir = os.path.join(self.getPath(), content[7:].strip())
+        elif not os.path.isdir(gitdir):
+            return None
+
+        commondir = gitdir
+        try:
+            with open(os.path.join(gitdir, 'commondir'), 'r') as f:
+                commondir = os.path.join(gitdir, f.read().strip())
+        except OSError:
+            pass
+
+        if os.path.exists(os.path.join(commondir, 'reftable')):
+            return None
+        return (gitdir, commondir)
+
+    def _getSnapshotSignature(self):
+        """Return the signature of the files the snapshot is read from"""
+        dirs = self._getGitDirs()
+        if dirs is None:
+            return None
+        (gitdir, commondir) = dirs
+
+        files = [
+            os.path.join(gitdir, 'HEAD'),
+            os.path.join(gitdir, 'config.worktree'),
+            os.path.join(commondir, 'config'),
+            os.path.join(commondir, 'packed-refs'),
+        ]
+
+        # Writing a loose ref renames a lock file, which changes the mtime of its directory.
+        for root, subdirs, filenames in os.walk(os.path.join(commondir, 'refs')):
+            files.append(root)
+
+        signature = [gitdir]
+        for f in files:
+            try:
+                stat = os.stat(f)
+                signature.append((f, stat.st_mtime_ns, stat.st_size, stat.st_ino))
+            except OSError:
+                signature.append((f, None))
+        return signature
+
+    def _loadSnapshotConfig(self, gitdir):
+        """Read the config, the values are lists as keys can be repeated"""
+        (returncode, stdout, stderr) = self.execute(['config', '--list', '-z'], readonly=True)
+        if returncode != 0:
+            return None
+        config = {}
+        for entry in stdout.split('\0'):
+            if entry:
+                (name, _, value) = entry.partition('\n')
+                config.setdefault(self._normaliseConfigName(name), []).append(value)
+        return config
+
+    def _loadSnapshotHead(self, gitdir):
+        """Read the ref HEAD points to, or an empty string when it is detached"""
+        try:
+            with open(os.path.join(gitdir, 'HEAD'), 'r') as f:
+                head = f.read().strip()
+        except OSError:
+            return None
+        if head.startswith('ref:'):
+            return head[4:].strip()
+        return ''
+
+    def _loadSnapshotRefs(self, gitdir):
+        """Read the refs and the hash they point to"""
+        (returncode, stdout, stderr) = self.execute(['for-each-ref', '--format=%(objectname) %(refname)'], readonly=True)
+        if returncode != 0:
+            return None
+        refs = {}
+        for line in stdout.split('\n'):
+            if line:
+                (hash, ref) = line.split(' ', 1)
+                refs[ref] = hash
+        return refs
+
+    def _loadSnapshotRemotes(self, gitdir):
+        """Read the remotes from the config, as 'git remote -v' would list their push URL"""
+        config = self.getSnapshot('config')
+        if config is None:
+            return None
+
+        # The URLs can be rewritten, in which case we let Git resolve them.
+        if any(name.startswith('url.') for name in config):
+            return None
+
+        remotes = {}
+        for name, values in sorted(config.items()):
+            if name.startswith('remote.') and name.endswith('.url'):
+                remote = name[7:-4]
+                remotes[remote] = (config.get('remote.%s.pushurl' % remote) or values)[-1]
+        return remotes
+
+    def _normaliseConfigName(self, name):
+        """The section and the key are case-insensitive, not the subsection"""
+        parts = name.split('.')
+        parts[0] = parts[0].lower()
+        parts[-1] = parts[-1].lower()
+        return '.'.join(parts)
 
 
 class GitException(Exception):
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+INDEX_VERSION = 1
+
+
+class InstanceIndex(object):
+    """Persistent index of the instances found in the storage directory
+
+    Listing the instances requires reading the version.php file and the Git configuration of
+    each of them. The index records that information along with the signature of the files it
+    was read from (modification times and sizes), and only reads it again when they change.
+    The index can be used from several threads, as when creating instances concurrently.
+    """
+
+    _data = None
+    _dirty = False
+    _lock = None
+    _path = None
+    _Wp = None
+
+    def __init__(self, Wp, path):
+        self._Wp = Wp
+        self._path = path
+        self._lock = threading.RLock()
+
+    def entries(self) -> Dict[str, dict]:
+        """Return the up-to-date entries of the Moodle instances, keyed by identifier"""
+        with self._lock:
+            self._load()
+            self._validate()
+            self.save()
+            return {name: entry for name, entry in self._data['entries'].items() if entry['moodle']}
+
+    def get(self, name) -> Optional[dict]:
+        """Return the up-to-date entry of an instance, or None"""
+        return self.entries().get(name)
+
+    def refresh(self, name):
+        """Rebuild the entry of an instance"""
+        with self._lock:
+            self._load()
+            self._data['entries'][name] = self._build(name, self._signature(name))
+            self._dirty = True
+            self.save()
+
+    def remove(self, name):
+        """Remove the entry of an instance"""
+        with self._lock:
+            self._load()
+            if self._data['entries'].pop(name, None) is not None:
+                self._dirty = True
+            self.save()
+
+    def save(self):
+        """Write the index to disk, if it changed"""
+        with self._lock:
+            if not self._dirty:
+                return
+
+            dirname = os.path.dirname(self._path)
+            if not os.path.isdir(dirname):
+                return
+
+            try:
+                fd, tmppath = tempfile.mkstemp(prefix='.instances', dir=dirname)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self._data, f)
+                os.replace(tmppath, self._path)
+            except OSError as e:
+                logging.debug('Could not save the instance index: %s' % e)
+                return
+
+            self._dirty = False
+
+    def _build(self, name, signature) -> dict:
+        """Build the entry of an instance"""
+        entry = {'signature': signature, 'moodle': False}
+        if not self._Wp.isMoodle(name):
+            return entry
+
+        entry.update({
+            'moodle': True,
+            'branch': None,
+            'release': None,
+            'integration': None,
+            'installed': None,
+            'dbname': None,
+        })
+
+        try:
+            M = self._Wp.get(name)
+            for key in ('branch', 'release', 'integration', 'installed', 'dbname'):
+                entry[key] = M.get(key)
+        except Exception as e:
+            logging.debug('Could not read the information of %s: %s' % (name, e))
+
+        return entry
+
+    def _load(self):
+        """Load the index from disk"""
+        if self._data is not None:
+            return
+
+        data = None
+        try:
+            with open(self._path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        if not isinstance(data, dict) or data.get('version') != INDEX_VERSION or data.get('storage') != self._Wp.path:
+            data = {'version': INDEX_VERSION, 'storage': self._Wp.path, 'mtime': None, 'entries': {}}
+            self._dirty = True
+
+        self._data = data
+
+    def _signature(self, name) -> List:
+        """Return the signature of the files an entry is built from"""
+        base = os.path.join(self._Wp.path, name)
+        wwwDir = os.path.join(base, self._Wp.wwwDir)
+        signature = [os.path.isdir(wwwDir), os.path.isdir(os.path.join(base, self._Wp.dataDir))]
+        for f in ('version.php', os.path.join('public', 'version.php'), 'config.php', os.path.join('.git', 'config')):
+            try:
+                stat = os.stat(os.path.join(wwwDir, f))
+                signature.append([stat.st_mtime_ns, stat.st_size])
+            except OSError:
+                signature.append(None)
+        return signature
+
+    def _validate(self):
+        """Rebuild the entries which are out of date"""
+        entries = self._data['entries']
+
+        # The directory is only listed when its content has changed.
+        mtime = os.stat(self._Wp.path).st_mtime_ns
+        if mtime != self._data['mtime']:
+            names = [d for d in os.listdir(self._Wp.path) if os.path.isdir(os.path.join(self._Wp.path, d))]
+            for name in list(entries.keys()):
+                if name not in names:
+                    del entries[name]
+            for name in names:
+                entries.setdefault(name, None)
+            self._data['mtime'] = mtime
+            self._dirty = True
+
+        for name, entry in list(entries.items()):
+            signature = self._signature(name)
+            if entry is None or entry['signature'] != signature:
+                entries[name] = self._build(name, signature)
+                self._dirty = True
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from typing import Dict, List, Optional
+
+from .config import Conf
+from .db import dump_database, get_dbo_from_profile, restore_database
+from .snapshot import EXCLUDED_DIRS, clone_file, sha1_file
+
+C = Conf()
+
+# The script completing an installation made from a template, it is placed at the root of the instance.
+SCRIPT_NAME = 'mdk_install_template.php'
+SCRIPT = r"""<?php
+define('CLI_SCRIPT', true);
+require(__DIR__ . '/config.php');
+require_once($CFG->libdir . '/clilib.php');
+
+list($options, $unrecognized) = cli_get_params(['fullname' => '', 'shortname' => '']);
+
+$DB->update_record('course', (object) [
+    'id' => SITEID,
+    'fullname' => $options['fullname'],
+    'shortname' => $options['shortname'],
+]);
+
+// The site identifier must be unique, it is generated again when missing.
+unset_config('siteidentifier');
+get_site_identifier();
+
+purge_all_caches();
+"""
+
+# The settings of config.php which differ between the instances made from a template.
+CONFIG_SETTINGS = ['dbname', 'wwwroot', 'dataroot']
+
+
+def php_string(value: str) -> str:
+    """Return a value as a single quoted PHP string"""
+    return "'%s'" % value.replace('\\', '\\\\').replace("'", "\\'")
+
+
+class InstallTemplates(object):
+    """Installed instances from which other instances are made rather than installing them
+
+    Installing an instance takes minutes, and for a given branch and database the result is
+    always the same. After an installation, its database, data root and config file are kept as
+    a template, identified by the branch, the database profile, and the content of version.php.
+    The next installations matching it copy the database with the means of the engine, or restore
+    a dump, copy the data root, and only update the settings specific to the instance.
+
+    The templates which were the least recently used are removed when there are more than the limit.
+    """
+
+    _path = None
+
+    def __init__(self, path: str, keep: int = 5):
+        """
+        :param path: The directory in which the templates are kept.
+        :param keep: The number of templates to keep.
+        """
+        self._path = path
+        self.keep = keep
+
+    def delete(self, key: str):
+        """Delete a template"""
+        template = self.get(key)
+        logging.debug('Deleting the install template %s' % key)
+        if template and template.get('method') == 'native':
+            try:
+                dbo = get_dbo_from_profile(C.get('db.%s' % template['dbprofile']))
+                if dbo.dbexists(self._getDbName(key)):
+                    dbo.dropdb(self._getDbName(key))
+            except Exception as e:
+                logging.warning('Could not drop the database of the install template %s: %s' % (key, e))
+        shutil.rmtree(self._getPath(key), True)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the information about a template"""
+        try:
+            with open(os.path.join(self._getPath(key), 'template.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def getKey(self, M, dbprofilename: str, dbprofile: Dict, prefix: str, login: str, passwd: str) -> str:
+        """Return the key of the template of an instance installed with these settings"""
+        values = [
+            str(M.get('branch')),
+            dbprofilename,
+            dbprofile['engine'],
+            str(dbprofile.get('host')),
+            str(dbprofile.get('port')),
+            sha1_file(M.getVersionPath(M.get('path'))),
+            prefix,
+            login,
+            passwd,
+        ]
+        return hashlib.sha1('\n'.join(values).encode('utf-8')).hexdigest()[:16]
+
+    def list(self) -> List[dict]:
+        """List the templates, the most recently used first"""
+        templates = []
+        if os.path.isdir(self._path):
+            for key in os.listdir(self._path):
+                template = self.get(key)
+                if template:
+                    templates.append(template)
+        return sorted(templates, key=lambda t: t.get('used', 0), reverse=True)
+
+    def prune(self, keep: Optional[int] = None):
+        """Delete the least recently used templates beyond the number to keep"""
+        keep = self.keep if keep is None else keep
+        for template in self.list()[keep:]:
+            self.delete(template['key'])
+
+    def restore(self, key: str, M, dbo, values: Dict[str, str], fullname: str, **stdio) -> bool:
+        """Install an instance from a template, and return whether it was
+
+        The database of the instance must not exist, and values contains the settings of
+        config.php specific to the instance. When the template cannot be used, what was
+        done is undone so that the instance can be installed from scratch.
+        """
+        template = self.get(key)
+        if not template:
+            return False
+
+        logging.info('Installing %s from a template...' % M.get('identifier'))
+        started = time.monotonic()
+        dbname = values['dbname']
+        dataroot = values['dataroot']
+        configFile = os.path.join(M.get('path'), 'config.php')
+        scriptFile = os.path.join(M.get('path'), SCRIPT_NAME)
+        try:
+            if template.get('method') == 'native':
+                dbo.clonedb(self._getDbName(key), dbname)
+            else:
+                dbo.createdb(dbname)
+                restore_database(dbo, dbname, os.path.join(self._getPath(key), 'database.dump'))
+
+            shutil.copytree(os.path.join(self._getPath(key), 'dataroot'), dataroot, copy_function=clone_file,
+                            dirs_exist_ok=True)
+            for dirname in EXCLUDED_DIRS:
+                os.makedirs(os.path.join(dataroot, dirname), exist_ok=True)
+
+            with open(os.path.join(self._getPath(key), 'config.php'), 'r') as f:
+                config = f.read()
+            with open(configFile, 'w') as f:
+                f.write(self._rewriteConfig(config, values))
+
+            with open(scriptFile, 'w') as f:
+                f.write(SCRIPT)
+            try:
+                args = ['--fullname=%s' % fullname, '--shortname=%s' % M.get('identifier')]
+                r, _, err = M.cli(SCRIPT_NAME, args, **stdio)
+            finally:
+                os.remove(scriptFile)
+            if r != 0:
+                raise Exception('The script completing the installation failed %s' % (err or ''))
+
+        except Exception as e:
+            logging.warning('Could not install from the template %s, installing from scratch: %s' % (key, e))
+            self._undo(M, dbo, dbname, dataroot)
+            return False
+
+        template['used'] = time.time()
+        self._writeTemplate(key, template)
+        logging.info('Installed from the template in %.1f seconds' % (time.monotonic() - started))
+        return True
+
+    def save(self, key: str, M, dbo, dbprofilename: str, values: Dict[str, str]) -> bool:
+        """Keep the freshly installed instance as a template, and return whether it was
+
+        This must be called right after the installation, before config.php is modified.
+        """
+        if self.get(key):
+            return False
+
+        logging.info('Keeping the installation as a template')
+        started = time.monotonic()
+        path = self._getPath(key)
+        building = '%s.%d' % (path, os.getpid())
+        shutil.rmtree(building, True)
+        os.makedirs(building)
+        template = {
+            'key': key,
+            'branch': M.get('branch'),
+            'dbprofile': dbprofilename,
+            'created': time.time(),
+            'used': time.time(),
+            'method': 'native',
+        }
+        try:
+            try:
+                if dbo.dbexists(self._getDbName(key)):
+                    dbo.dropdb(self._getDbName(key))
+                dbo.clonedb(values['dbname'], self._getDbName(key))
+            except NotImplementedError:
+                template['method'] = 'dump'
+                dump_database(dbo, values['dbname'], os.path.join(building, 'database.dump'))
+
+            shutil.copytree(values['dataroot'], os.path.join(building, 'dataroot'), copy_function=clone_file,
+                            ignore=lambda d, names: EXCLUDED_DIRS if d == values['dataroot'] else [])
+            shutil.copy2(os.path.join(M.get('path'), 'config.php'), os.path.join(building, 'config.php'))
+            with open(os.path.join(building, 'template.json'), 'w') as f:
+                json.dump(template, f, indent=2)
+
+            # Another process may have saved the same template in the meantime.
+            if os.path.isdir(path):
+                shutil.rmtree(building, True)
+                return False
+            os.rename(building, path)
+        except Exception as e:
+            logging.warning('Could not keep the installation as a template: %s' % e)
+            shutil.rmtree(building, True)
+            return False
+
+        logging.info('Template kept in %.1f seconds' % (time.monotonic() - started))
+        self.prune()
+        return True
+
+    def _getDbName(self, key: str) -> str:
+        return 'mdktpl_%s' % key
+
+    def _getPath(self, key: str) -> str:
+        return os.path.join(self._path, key)
+
+    def _rewriteConfig(self, config: str, values: Dict[str, str]) -> str:
+        """Replace the settings of config.php specific to the instance"""
+        for name in CONFIG_SETTINGS:
+            regex = re.compile(r'^(\s*\$CFG->%s\s*=\s*)(.*?);[ \t]*$' % name, re.MULTILINE)
+            config, count = regex.subn(lambda m: m.group(1) + php_string(values[name]) + ';', config, count=1)
+            if not count:
+                raise Exception('Could not find $CFG->%s in config.php' % name)
+        return config
+
+    def _undo(self, M, dbo, dbname: str, dataroot: str):
+        """Remove what an installation from a template left behind"""
+        try:
+            if dbo.dbexists(dbname):
+                dbo.dropdb(dbname)
+        except Exception as e:
+            logging.debug('Could not drop the database %s: %s' % (dbname, e))
+        if os.path.isdir(dataroot):
+            for name in os.listdir(dataroot):
+                path = os.path.join(dataroot, name)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path, True)
+                else:
+                    os.remove(path)
+        configFile = os.path.join(M.get('path'), 'config.php')
+        if os.path.isfile(configFile):
+            os.remove(configFile)
+
+    def _writeTemplate(self, key: str, template: dict):
+        try:
+            with open(os.path.join(self._getPath(key), 'template.json'), 'w') as f:
+                json.dump(template, f, indent=2)
+        except OSError as e:
+            logging.debug('Could not update the install template %s: %s' % (key, e))
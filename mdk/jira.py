@@ -30,17 +30,28 @@ from datetime import datetime
 import re
 import logging
 import os
-import requests
 import mimetypes
-try:
-    import keyring
-except:
-    logging.warning('Could not load module keyring. You might want to install it.')
-    logging.warning('Try `apt-get install python-keyring`, or visit https://pypi.python.org/pypi/keyring#installation-instructions')
 
 C = Conf()
 
 
+_keyring = None
+
+
+def get_keyring():
+    """Import the keyring module on first use, it is slow to load"""
+    global _keyring
+    if _keyring is None:
+        try:
+            import keyring
+            _keyring = keyring
+        except:
+            logging.warning('Could not load module keyring. You might want to install it.')
+            logging.warning('Try `apt-get install python-keyring`, or visit https://pypi.python.org/pypi/keyring#installation-instructions')
+            _keyring = False
+    return _keyring or None
+
+
 class Jira(object):
 
     username = ''
@@ -101,6 +112,7 @@ class Jira(object):
 
     def download(self, url, dest):
         """Download a URL to the destination while authenticating the user"""
+        import requests
 
         r = requests.get(url, auth=requests.auth.HTTPBasicAuth(self.username, self.password))
         if r.status_code == 403:
@@ -243,7 +255,7 @@ class Jira(object):
 
         try:
             # str() is needed because keyring does not handle unicode.
-            self.password = keyring.get_password('mdk-jira-apikey', str(self.username))
+            self.password = get_keyring().get_password('mdk-jira-apikey', str(self.username))
         except:
             # Do not die if keyring package is not available.
             self.password = None
@@ -274,7 +286,7 @@ class Jira(object):
             C.set('tracker.username', self.username)
 
         try:
-            keyring.set_password('mdk-jira-apikey', str(self.username), str(self.password))
+            get_keyring().set_password('mdk-jira-apikey', str(self.username), str(self.password))
         except:
             # Do not die if keyring package is not available.
             pass
@@ -289,6 +301,8 @@ class Jira(object):
     def request(self, uri, method='GET', data='', params={}, headers={}, files=None):
         """Sends a request to the server and returns the response status and data"""
 
+        import requests
+
         url = self.url + self.uri + '/rest/api/' + str(self.apiversion) + '/' + uri.strip('/')
 
         # Define method to method to use.
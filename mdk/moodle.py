@@ -21,15 +21,13 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 http://github.com/FMCorz/mdk
 """
 
-import gzip
 import logging
 import os
 from pathlib import Path
 import re
 import shlex
 import subprocess
-from typing import Union
-import urllib
+from typing import List, Optional, Union
 import json
 from tempfile import gettempdir
 
@@ -40,9 +38,10 @@ from .config import Conf
 from .db import DB, get_dbo_from_profile
 from .exceptions import InstallException, UpgradeNotAllowed
 from .git import Git, GitException
+from .installtemplates import InstallTemplates
 from .jira import Jira, JiraException
 from .scripts import Scripts
-from .tools import (getMDLFromCommitMessage, parseBranch, stableBranch)
+from .tools import (getMDLFromCommitMessage, get_init_action, parseBranch, stableBranch)
 
 C = Conf()
 
@@ -61,7 +60,9 @@ class Moodle(object):
 
     _dbo = None
     _git = None
+    _info = None
     _loaded = False
+    _signature = None
 
     _cos_hasstash = False
     _cos_oldbranch = None
@@ -286,6 +287,25 @@ class Moodle(object):
         """Executes a command"""
         return self.container.exec(cmd, **kwargs)
 
+    def forgetTestEnvironments(self):
+        """Forget how the test environments were initialised, so that they are initialised again
+
+        The fingerprints of the environments are kept beside their data roots, they must be removed
+        when the database is replaced as the tables of the environments are gone with it.
+        """
+        from .behat import FINGERPRINT_FILE
+        from .phpunit import get_fingerprint_file
+        try:
+            paths = [self.container.behat_dataroot / FINGERPRINT_FILE, get_fingerprint_file(self)]
+        except Exception as e:
+            logging.debug('Could not resolve the paths of the test environments: %s' % e)
+            return
+        for path in paths:
+            try:
+                self.container.unlink(path)
+            except Exception as e:
+                logging.debug('Could not remove %s: %s' % (path, e))
+
     def generateBranchName(self, issue, suffix='', version=''):
         """Generates a branch name"""
         mdl = re.sub(r'(MDL|mdl)(-|_)?', '', issue)
@@ -299,12 +319,45 @@ class Moodle(object):
 
     def get(self, param, default=None):
         """Returns a property of this instance"""
-        info = self.info()
+        info = self._getInfo()
         try:
             return info[param]
         except:
             return default
 
+    def getComponentHashes(self, filenames):
+        """Return the hashes of files of the components, keyed by their path relative to the root
+
+        The files, such as version.php or db/install.xml, are searched throughout the code except
+        in the directories of the dependencies. The hash of composer.lock is always included.
+        """
+        import hashlib
+        patterns = [os.path.split(filename) for filename in filenames]
+        hashes = {}
+
+        def add(path):
+            with open(path, 'rb') as f:
+                hashes[os.path.relpath(path, self.path)] = hashlib.sha1(f.read()).hexdigest()
+
+        for root, dirs, files in os.walk(self.path):
+            dirs[:] = [d for d in dirs if d not in ('.git', 'node_modules', 'vendor')]
+            dirname = os.path.basename(root)
+            for (parent, name) in patterns:
+                if name in files and (not parent or parent == dirname):
+                    add(os.path.join(root, name))
+
+        if os.path.isfile(os.path.join(self.path, 'composer.lock')):
+            add(os.path.join(self.path, 'composer.lock'))
+        return hashes
+
+    def getPrefixedTables(self, prefix) -> Optional[List[str]]:
+        """Return the tables of the database starting with prefix, or None when they cannot be listed"""
+        try:
+            return self.dbo().tables(self.get('dbname'), prefix)
+        except Exception as e:
+            logging.debug('Could not list the tables starting with %s: %s' % (prefix, e))
+            return None
+
     def get_file_path(self, relpath: Union[Path, str]) -> Path:
         """
         Get the relative path to a file.
@@ -412,11 +465,18 @@ class Moodle(object):
         """Initialise the PHPUnit environment"""
         raise Exception('This method is deprecated, use phpunit.PHPUnit.init() instead.')
 
-    def initBehat(self, force=False, prefix=None, faildumppath=None):
-        """Initialise the Behat environment"""
+    def initBehat(self, force=False, prefix=None, faildumppath=None, parallel=None, snapshots=None):
+        """Initialise the Behat environment, for a number of parallel runs when parallel is set
+
+        The environment is only initialised again when what it was initialised from changed, see
+        mdk.behat.get_fingerprint, and is restored from the snapshots (mdk.testsnapshots.TestSnapshots)
+        when one matches. Returns what was done: 'install', 'config', or None.
+        """
+        from .behat import FINGERPRINT_FILE, FINGERPRINT_INSTALL_KEYS, get_fingerprint
 
         # Set Behat data root
-        self.updateConfig('behat_dataroot', self.container.behat_dataroot.as_posix())
+        if self.get('behat_dataroot') != self.container.behat_dataroot.as_posix():
+            self.updateConfig('behat_dataroot', self.container.behat_dataroot.as_posix())
 
         # Set Behat DB prefix
         currentPrefix = self.get('behat_prefix')
@@ -429,7 +489,7 @@ class Moodle(object):
         elif (not faildumppath and currentFailDumpPath):
             self.removeConfig('behat_faildump_path')
 
-        if not currentPrefix or force:
+        if (not currentPrefix or force) and currentPrefix != behat_prefix:
             self.updateConfig('behat_prefix', behat_prefix)
         elif currentPrefix != behat_prefix and self.get('dbtype') != 'oci':
             # Warn that a prefix is already set and we did not change it.
@@ -438,40 +498,92 @@ class Moodle(object):
 
         wwwroot = self.container.behat_wwwroot
         currentWwwroot = self.get('behat_wwwroot')
-        if not currentWwwroot or force:
+        if (not currentWwwroot or force) and currentWwwroot != wwwroot:
             self.updateConfig('behat_wwwroot', wwwroot)
         elif currentWwwroot != wwwroot:
             logging.warning('Behat wwwroot not changed, already set to \'%s\', expected \'%s\'.' % (currentWwwroot, wwwroot))
 
-        # Force a cache purge
-        self.purge()
+        # Compare with what the environment was last initialised from.
+        fingerprintPath = self.container.behat_dataroot / FINGERPRINT_FILE
+        fingerprint = get_fingerprint(self, parallel)
+        previous = None
+        if not force and self.container.exists(fingerprintPath):
+            try:
+                previous = json.loads(self.container.readfile(fingerprintPath))
+            except Exception:
+                logging.debug('Could not read the Behat fingerprint')
+
+        # The fingerprint is not removed with the database, it is only trusted when the tables of each run exist.
+        if previous:
+            prefix = self.get('behat_prefix') or ''
+            regex = re.compile(re.escape(prefix) + r'(\d+_)?config$')
+            runs = [table for table in self.getPrefixedTables(prefix) or [] if regex.match(table)]
+            if len(runs) < int(fingerprint['parallel']):
+                logging.debug('The Behat tables are missing from the database')
+                previous = None
+
+        action = get_init_action(previous, fingerprint, FINGERPRINT_INSTALL_KEYS)
+        initargs = ['--parallel=%d' % parallel] if parallel and parallel > 1 else []
+
+        # The snapshot of an environment initialised from the same versions only needs its configuration rebuilt.
+        if action == 'install' and not force and snapshots and snapshots.restore(snapshots.getKey(fingerprint)):
+            action = 'config'
+
+        if not action:
+            logging.info('Behat is up to date, nothing changed since it was initialised')
+            return None
+
+        elif action == 'config':
+            logging.info('Updating the Behat configuration')
+            result = self.cli('admin/tool/behat/cli/util.php', args=['--enable', *initargs], stdout=None, stderr=None)
+            if result[0] != 0:
+                raise Exception('Error while updating the Behat configuration. Please try manually.')
+
+        else:
+            logging.info('Initialising Behat, please be patient!')
+
+            # Force a cache purge
+            self.purge()
 
-        # Force dropping the tables if there are any.
-        if force:
-            result = self.cli('admin/tool/behat/cli/util.php', args=['--drop'], stdout=None, stderr=None)
+            # Force dropping the tables if there are any.
+            if force:
+                result = self.cli('admin/tool/behat/cli/util.php', args=['--drop'], stdout=None, stderr=None)
+                if result[0] != 0:
+                    raise Exception('Error while initialising Behat. Please try manually.')
+
+            # Run the init script.
+            result = self.cli('admin/tool/behat/cli/init.php', args=initargs, stdout=None, stderr=None)
             if result[0] != 0:
                 raise Exception('Error while initialising Behat. Please try manually.')
 
-        # Run the init script.
-        result = self.cli('admin/tool/behat/cli/init.php', stdout=None, stderr=None)
-        if result[0] != 0:
-            raise Exception('Error while initialising Behat. Please try manually.')
+            # Force a cache purge
+            self.purge()
 
-        # Force a cache purge
-        self.purge()
+            if snapshots:
+                snapshots.save(snapshots.getKey(fingerprint))
+
+        self.container.writefile(fingerprintPath, json.dumps(fingerprint, indent=2, sort_keys=True))
+        return action
 
     def info(self):
         """Returns a dictionary of information about this instance"""
-        self._load()
-        info = {'path': self.path, 'installed': self.isInstalled(), 'identifier': self.identifier}
-        for (k, v) in list(self.config.items()):
-            info[k] = v
-        for (k, v) in list(self.version.items()):
-            info[k] = v
-        return info
+        return dict(self._getInfo())
 
-    def install(self, dbprofile=None, dbname=None, engine=None, dataDir=None, fullname=None, dropDb=False, wwwroot=None):
-        """Launch the install script of an Instance"""
+    def _getInfo(self):
+        """Returns the information snapshot, it must not be modified"""
+        self._load()
+        if self._info is None:
+            info = {'path': self.path, 'installed': self.installed == True, 'identifier': self.identifier}
+            for (k, v) in list(self.config.items()):
+                info[k] = v
+            for (k, v) in list(self.version.items()):
+                info[k] = v
+            self._info = info
+        return self._info
+
+    def install(self, dbprofile=None, dbname=None, engine=None, dataDir=None, fullname=None, dropDb=False, wwwroot=None,
+                stdout=None, stderr=None, useTemplate=True):
+        """Launch the install script of an Instance, or make it from an install template when useTemplate is set"""
 
         if self.isInstalled():
             raise InstallException('Instance already installed!')
@@ -500,46 +612,62 @@ class Moodle(object):
             fullname = self.identifier.replace('-', ' ').replace('_', ' ').title()
             fullname = fullname + ' ' + C.get('wording.%s' % engine)
 
-        logging.info('Creating database...')
         dbo = get_dbo_from_profile(dbprofile)
-        if dbo.dbexists(dbname):
-            if dropDb:
+        if dbo.dbexists(dbname) and not dropDb:
+            raise InstallException('Cannot install an instance on an existing database (%s)' % dbname)
+
+        # The instance is made from a template when one matches, and becomes one otherwise.
+        templates = None
+        values = {'dbname': dbname, 'wwwroot': wwwroot, 'dataroot': dataDir}
+        if useTemplate and C.get('installTemplates'):
+            templates = InstallTemplates(os.path.join(os.path.expanduser(C.get('dirs.mdk')), 'templates'),
+                                         C.get('installTemplates'))
+            templateKey = templates.getKey(self, dbprofilename, dbprofile, C.get('db.tablePrefix'), C.get('login'),
+                                           C.get('passwd'))
+            if templates.get(templateKey) and dbo.dbexists(dbname):
+                dbo.dropdb(dbname)
+
+        if templates and templates.restore(templateKey, self, dbo, values, fullname, stdout=stdout, stderr=stderr):
+            templates = None
+        else:
+            logging.info('Creating database...')
+            createdbkwargs = {}
+            if dbo.dbexists(dbname):
                 dbo.dropdb(dbname)
-                createdbkwargs = {}
                 if engine in ('mysqli', 'mariadb') and self.branch_compare(31, '<'):
                     createdbkwargs['charset'] = 'utf8'
-                dbo.createdb(dbname, **createdbkwargs)
-            else:
-                raise InstallException('Cannot install an instance on an existing database (%s)' % dbname)
-        else:
-            dbo.createdb(dbname)
-
-        logging.info('Installing %s...' % self.identifier)
-        args = [
-            '--wwwroot=%s' % wwwroot,
-            '--dataroot=%s' % dataDir,
-            '--dbtype=%s' % engine,
-            '--dbname=%s' % dbname,
-            '--dbuser=%s' % dbprofile['user'],
-            '--dbpass=%s' % dbprofile['passwd'],
-            '--dbhost=%s' % dbprofile['host'],
-            '--dbport=%s' % dbprofile['port'],
-            '--prefix=%s' % C.get('db.tablePrefix'),
-            '--fullname=%s' % fullname,
-            '--shortname=%s' % self.identifier,
-            '--adminuser=%s' % C.get('login'),
-            '--adminpass=%s' % C.get('passwd'),
-            '--allow-unstable',
-            '--agree-license',
-            '--non-interactive',
-        ]
-        cli = 'admin/cli/install.php'
-        result = self.cli(cli, args, stdout=None, stderr=None)
-        if result[0] != 0:
-            raise InstallException(
-                'Error while running the install, please manually fix the problem.\n'
-                '- Command was: %s %s' % (cli, ' '.join(args))
-            )
+            dbo.createdb(dbname, **createdbkwargs)
+
+            logging.info('Installing %s...' % self.identifier)
+            args = [
+                '--wwwroot=%s' % wwwroot,
+                '--dataroot=%s' % dataDir,
+                '--dbtype=%s' % engine,
+                '--dbname=%s' % dbname,
+                '--dbuser=%s' % dbprofile['user'],
+                '--dbpass=%s' % dbprofile['passwd'],
+                '--dbhost=%s' % dbprofile['host'],
+                '--dbport=%s' % dbprofile['port'],
+                '--prefix=%s' % C.get('db.tablePrefix'),
+                '--fullname=%s' % fullname,
+                '--shortname=%s' % self.identifier,
+                '--adminuser=%s' % C.get('login'),
+                '--adminpass=%s' % C.get('passwd'),
+                '--allow-unstable',
+                '--agree-license',
+                '--non-interactive',
+            ]
+            cli = 'admin/cli/install.php'
+            result = self.cli(cli, args, stdout=stdout, stderr=stderr)
+            if result[0] != 0:
+                raise InstallException(
+                    'Error while running the install, please manually fix the problem.\n'
+                    '- Command was: %s %s' % (cli, ' '.join(args))
+                )
+
+        if templates:
+            templates.save(templateKey, self, dbo, dbprofilename, values)
+        self.forgetTestEnvironments()
 
         configFile = Path('config.php')
         self.container.chmod(configFile, 0o666)
@@ -578,11 +706,13 @@ class Moodle(object):
         cliFile = 'mdk_install_composer.php'
         cliPath = os.path.join(self.get('path'), cliFile)
 
+        import urllib.request
         opener = urllib.request.build_opener()
         opener.addheaders = [('Accept-Encoding', 'gzip')]
         urllib.request.install_opener(opener)
         (to, headers) = urllib.request.urlretrieve('http://getcomposer.org/installer', cliPath)
         if headers.get('content-encoding') == 'gzip':
+            import gzip
             f = gzip.open(cliPath, 'r')
             content = f.read().decode('utf-8')
             f.close()
@@ -659,15 +789,36 @@ class Moodle(object):
         """Assume an instance is stable if not integration"""
         return not self.isIntegration()
 
+    def _getSignature(self):
+        """Return the signature of the files the information is read from
+
+        The signature is made of the modification time and size of version.php and config.php,
+        it changes whenever one of them is created, deleted or modified.
+        """
+        signature = []
+        for f in ('version.php', os.path.join('public', 'version.php'), 'config.php'):
+            try:
+                stat = os.stat(os.path.join(self.path, f))
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
     def _load(self):
-        """Loads the information"""
-        if not self.isInstance(self.path):
-            return False
+        """Loads the information
 
-        if self._loaded:
+        The information is only read again when the instance was reloaded, or when
+        version.php or config.php changed since they were last read.
+        """
+        signature = self._getSignature()
+        if self._loaded and signature == self._signature:
             return True
 
+        if not self.isInstance(self.path):
+            return False
+
         # Extracts information from version.php
+        self._info = None
         self.version = {}
 
         version = Moodle.getVersionPath(self.path)
@@ -746,6 +897,7 @@ class Moodle(object):
         else:
             self.installed = False
 
+        self._signature = signature
         self._loaded = True
         return True
 
@@ -827,6 +979,7 @@ class Moodle(object):
 
     def reload(self):
         """Sets the value to be reloaded"""
+        self._info = None
         self._loaded = False
 
     def removeConfig(self, name):
@@ -866,6 +1019,37 @@ class Moodle(object):
             else:
                 raise Exception("Unsupport type of scripts.")
 
+    def setConfigSnippet(self, name, code=None):
+        """Add, replace or remove (when code is None) a line of PHP code in the config file
+
+        The line is identified by name, and written right before the inclusion of lib/setup.php
+        so that it is executed after all the settings have been set.
+        """
+        configFile = os.path.join(self.path, 'config.php')
+        if not os.path.isfile(configFile):
+            return None
+
+        marker = '// MDK %s.' % name
+        try:
+            f = open(configFile, 'r')
+            lines = f.readlines()
+            f.close()
+
+            lines = [line for line in lines if not line.rstrip().endswith(marker)]
+            if code is not None:
+                for i, line in enumerate(lines):
+                    if re.search(r'require_once.*/lib/setup\.php', line):
+                        lines.insert(i, '%s %s\n' % (code, marker))
+                        break
+
+            f = open(configFile, 'w')
+            f.writelines(lines)
+            f.close()
+        except:
+            raise Exception('Error while writing to config file')
+
+        self.reload()
+
     def update(self, remote=None):
         """Update the instance from the remote"""
 
@@ -912,6 +1096,7 @@ class Moodle(object):
         if self.dbo().dbexists(dbname):
             logging.debug('Droping database (%s)' % (dbname))
             self.dbo().dropdb(dbname)
+        self.forgetTestEnvironments()
 
         # Remove the config file
         configFile = os.path.join(self.get('path'), 'config.php')
@@ -985,7 +1170,7 @@ class Moodle(object):
             )
             J.setCustomFields(issue, {fieldrepositoryurl: repositoryurl, fieldbranch: branch, fielddiffurl: diffurl})
 
-    def upgrade(self, nocheckout=False):
+    def upgrade(self, nocheckout=False, stdout=None, stderr=None):
         """Calls the upgrade script"""
         if not self.isInstalled():
             raise Exception('Cannot upgrade an instance which is not installed.')
@@ -1000,7 +1185,7 @@ class Moodle(object):
 
         cli = '/admin/cli/upgrade.php'
         args = ['--non-interactive', '--allow-unstable']
-        result = self.cli(cli, args, stdout=None, stderr=None)
+        result = self.cli(cli, args, stdout=stdout, stderr=stderr)
         if result[0] != 0:
             raise Exception('Error while running the upgrade.')
 
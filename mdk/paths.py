@@ -162,6 +162,23 @@ class ComponentResolver():
 
         return (ctype, cname)
 
+    def list_components(self) -> Dict[str, Path]:
+        """List the components found in the instance, and their directories."""
+        components = set(f'core_{name}' for name in self.subsystems)
+        for plugintype, relpath in self.plugintypes.items():
+            typeroot = self._root / relpath
+            if not typeroot.is_dir():
+                continue
+            components.add(plugintype)
+            components.update(f'{plugintype}_{path.name}' for path in typeroot.iterdir() if path.is_dir())
+
+        result = {}
+        for component in sorted(components):
+            path = self.get_component_directory(component)
+            if path:
+                result[component] = path
+        return result
+
     def plugintype_prefixes(self) -> List[str]:
         self._load_components()
         self._load_subplugins()
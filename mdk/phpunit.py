@@ -21,17 +21,53 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 http://github.com/FMCorz/mdk
 """
 
+import json
 import logging
 import os
-from typing import List, Literal, Optional
+import statistics
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, List, Literal, Optional
 
 from mdk.moodle import Moodle
 
 from .config import Conf
-from .tools import mkdir
+from .tools import ParallelJobs, distribute_by_duration, get_init_action, mkdir
 
 C = Conf()
 
+# The duration given to the testsuites which have never been timed.
+DEFAULT_DURATION = 30.0
+
+# The workers of a parallel run each use their own prefix and data root, derived from the ones
+# of the instance, when the environment variable MDK_PHPUNIT_WORKER is set.
+WORKER_ENV = 'MDK_PHPUNIT_WORKER'
+WORKER_SNIPPET = (
+    "if ($mdkworker = getenv('" + WORKER_ENV + "')) { "
+    "list($CFG->phpunit_prefix, $CFG->phpunit_dataroot) = "
+    "array(rtrim($CFG->phpunit_prefix, '_') . $mdkworker . '_', $CFG->phpunit_dataroot . '_' . $mdkworker); "
+    "}"
+)
+
+# The parts of the fingerprint which require the test database to be built again when they change,
+# the others only require phpunit.xml to be rebuilt.
+FINGERPRINT_INSTALL_KEYS = ['versions', 'database', 'prefix', 'workers']
+
+# The exit codes of admin/tool/phpunit/cli/util.php --diag when the test database must be installed,
+# or dropped and installed again.
+DIAG_INSTALL = 133
+DIAG_REINSTALL = 134
+
+
+def get_fingerprint_file(M) -> Path:
+    """Return the path to the file recording the last initialisation of the PHPUnit environment
+
+    It is beside phpunit_dataroot, as the files added to it are removed when the tests reset it.
+    """
+    dataroot = M.container.phpunit_dataroot
+    return dataroot.with_name(dataroot.name + '_mdk.json')
+
 
 class PHPUnit(object):
     """Class wrapping PHPUnit functions"""
@@ -104,35 +140,156 @@ class PHPUnit(object):
         """Return the code coverage URL"""
         return self.Wp.getUrl(self.M.get('identifier'), extra='coverage')
 
-    def init(self, force=False, prefix=None):
-        """Initialise the PHPUnit environment"""
+    def getFingerprint(self, workers=None) -> Dict[str, str]:
+        """Return the fingerprint of what the PHPUnit environment is initialised from
+
+        The versions and database schemas of the components, the database, and the dependencies,
+        determine the test database. The config file and the distributed configs setting only affect phpunit.xml.
+        """
+        import hashlib
+        hashes = self.M.getComponentHashes(['version.php', 'db/install.xml'])
+        versions = hashlib.sha1(json.dumps(hashes, sort_keys=True).encode('utf-8'))
+
+        config = hashlib.sha1()
+        try:
+            with open(os.path.join(self.M.get('path'), 'config.php'), 'rb') as f:
+                config.update(f.read())
+        except OSError:
+            pass
+
+        return {
+            'versions': versions.hexdigest(),
+            'database': '%s@%s' % (self.M.get('dbname'), self.M.get('dbhost')),
+            'prefix': self.M.get('phpunit_prefix') or '',
+            'workers': str(workers or 0),
+            'config': config.hexdigest(),
+            'componentconfigs': str(bool(C.get('phpunit.buildcomponentconfigs'))),
+        }
+
+    def getFingerprintFile(self) -> Path:
+        """Return the path to the file recording the last initialisation"""
+        return get_fingerprint_file(self.M)
+
+    def getSnapshots(self):
+        """Return the snapshots of the environment, or None when they are disabled"""
+        keep = C.get('testSnapshots')
+        if not keep:
+            return None
+        from .testsnapshots import TestSnapshots
+        return TestSnapshots(self.M, 'phpunit', self.M.get('phpunit_prefix'), self.M.container.phpunit_dataroot,
+                             self.Wp.getExtraDir(self.M.get('identifier'), 'snapshots'), keep=int(keep))
+
+    def getTestsuites(self) -> List[str]:
+        """Return the names of the testsuites defined in phpunit.xml"""
+        import xml.etree.ElementTree as ET
+        tree = ET.parse(os.path.join(self.M.get('path'), 'phpunit.xml'))
+        return [testsuite.get('name') for testsuite in tree.getroot().iter('testsuite') if testsuite.get('name')]
+
+    def getTimings(self) -> Dict[str, float]:
+        """Return the durations of the testsuites recorded during the previous parallel runs"""
+        try:
+            with open(self.getTimingsFile(), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def getTimingsFile(self):
+        return os.path.join(self.Wp.getExtraDir(self.M.get('identifier'), 'phpunit'), 'timings.json')
+
+    def getWorkerDataroot(self, worker) -> Path:
+        """Return the data root of a worker, as set by WORKER_SNIPPET"""
+        dataroot = self.M.container.phpunit_dataroot
+        return dataroot.with_name('%s_%d' % (dataroot.name, worker))
+
+    def getWorkerEnv(self, worker) -> Dict[str, str]:
+        """Return the environment variables to give to the commands of a worker"""
+        return {WORKER_ENV: str(worker)}
+
+    def hasTables(self, workers=None) -> bool:
+        """Whether the config table of the environment, or of each worker, exists in the database"""
+        prefix = self.M.get('phpunit_prefix') or ''
+        if workers:
+            prefixes = ['%s%d_' % (prefix.rstrip('_'), worker) for worker in range(1, workers + 1)]
+        else:
+            prefixes = [prefix]
+        tables = self.M.getPrefixedTables(os.path.commonprefix(prefixes))
+        return tables is not None and all('%sconfig' % p in tables for p in prefixes)
+
+    def init(self, force=False, prefix=None, workers=None):
+        """Initialise the PHPUnit environment
+
+        When workers is set, the environments of that number of parallel workers are initialised
+        rather than the one of the instance. The environment is only built again when what it was
+        built from changed, see getFingerprint. When only the configuration changed, phpunit.xml
+        is rebuilt, otherwise nothing is done.
+        """
 
         if self.M.branch_compare(23, '<'):
             raise Exception('PHPUnit is only available from Moodle 2.3')
 
         # Set PHPUnit data root
         phpunit_dataroot = self.M.container.phpunit_dataroot
-        self.M.updateConfig('phpunit_dataroot', phpunit_dataroot.as_posix())
-        if not self.M.container.isdir(self.M.container.phpunit_dataroot):
-            self.M.container.mkdir(self.M.container.phpunit_dataroot, 0o777)
+        if self.M.get('phpunit_dataroot') != phpunit_dataroot.as_posix():
+            self.M.updateConfig('phpunit_dataroot', phpunit_dataroot.as_posix())
+        initialised = self.M.container.isdir(phpunit_dataroot)
+        if not initialised:
+            self.M.container.mkdir(phpunit_dataroot, 0o777)
 
         # Set PHPUnit prefix
         currentPrefix = self.M.get('phpunit_prefix')
         phpunit_prefix = prefix or 'phpu_'
 
-        if not currentPrefix or force:
+        if (not currentPrefix or force) and currentPrefix != phpunit_prefix:
             self.M.updateConfig('phpunit_prefix', phpunit_prefix)
         elif currentPrefix != phpunit_prefix and self.M.get('dbtype') != 'oci':
             # Warn that a prefix is already set and we did not change it.
             # No warning for Oracle as we need to set it to something else.
             logging.warning('PHPUnit prefix not changed, already set to \'%s\', expected \'%s\'.' % (currentPrefix, phpunit_prefix))
 
+        # The workers' settings are derived from the ones above when the config file is loaded.
+        self.M.setConfigSnippet('PHPUnit workers', WORKER_SNIPPET if workers else None)
+
+        # Compare with what the environment was last initialised from.
+        fingerprint = self.getFingerprint(workers)
+        previous = {}
+        if initialised and not force:
+            try:
+                previous = json.loads(self.M.container.readfile(self.getFingerprintFile()))
+            except Exception:
+                logging.debug('Could not read the PHPUnit fingerprint')
+
+        # The fingerprint is not removed with the database, it is only trusted when the tables exist.
+        if previous and not self.hasTables(workers):
+            logging.debug('The PHPUnit tables are missing from the database')
+            previous = {}
+
+        action = get_init_action(previous.get('fingerprint'), fingerprint, FINGERPRINT_INSTALL_KEYS)
+        lastDuration = previous.get('duration')
+        started = time.monotonic()
+
+        # The snapshot of an environment initialised from the same versions only needs its configuration rebuilt.
+        snapshots = self.getSnapshots() if not workers else None
+        if action == 'install' and not force and snapshots and snapshots.restore(snapshots.getKey(fingerprint)):
+            action = 'config'
+
+        if not action:
+            logging.info('PHPUnit is up to date, nothing changed since it was initialised')
+            if lastDuration:
+                logging.info('Saved about %d seconds' % lastDuration)
+            return
+
         result = (None, None, None)
         exception = None
         try:
-            if force:
-                result = self.M.cli('/admin/tool/phpunit/cli/util.php', args=['--drop'], stdout=None, stderr=None)
-            result = self.M.cli('/admin/tool/phpunit/cli/init.php', stdout=None, stderr=None)
+            if action == 'config':
+                logging.info('Rebuilding the PHPUnit configuration')
+                result = self.M.cli('/admin/tool/phpunit/cli/util.php', args=['--buildconfig'], stdout=None, stderr=None)
+            elif workers:
+                result = self.initWorkers(workers, force=force)
+            else:
+                if force:
+                    result = self.M.cli('/admin/tool/phpunit/cli/util.php', args=['--drop'], stdout=None, stderr=None)
+                result = self.M.cli('/admin/tool/phpunit/cli/init.php', stdout=None, stderr=None)
         except Exception as exc:
             exception = exc
             pass
@@ -157,13 +314,146 @@ class PHPUnit(object):
             else:
                 logging.info('Distributed phpunit.xml files built.')
 
+        # The duration of the full initialisation is kept to report the time saved afterwards.
+        duration = time.monotonic() - started
+        if action == 'install' and snapshots:
+            snapshots.save(snapshots.getKey(fingerprint))
+        if action == 'config' and lastDuration:
+            logging.info('Saved about %d seconds' % max(0, lastDuration - duration))
+            duration = lastDuration
+        record = {'fingerprint': fingerprint, 'duration': round(duration, 1)}
+        try:
+            self.M.container.writefile(self.getFingerprintFile(), json.dumps(record, indent=2, sort_keys=True))
+        except Exception as e:
+            logging.warning('Could not record the PHPUnit fingerprint: %s' % e)
+
         logging.info('PHPUnit ready!')
 
+    def initWorkers(self, workers, force=False):
+        """Initialise the environments of the workers, and return the first failed result
+
+        The first worker is initialised on its own, as init.php also installs the dependencies and
+        writes phpunit.xml in the code shared by all the workers. The databases and data roots of
+        the other workers are then installed concurrently, without touching the code.
+        """
+
+        def initWorker(worker, logger, stdio):
+            dataroot = self.getWorkerDataroot(worker)
+            if not self.M.container.isdir(dataroot):
+                self.M.container.mkdir(dataroot, 0o777)
+
+            logger.info('Initialising PHPUnit worker %d' % worker)
+            env = self.getWorkerEnv(worker)
+            if force:
+                self.M.cli('/admin/tool/phpunit/cli/util.php', args=['--drop'], addtoenv=env, **stdio)
+            if worker == 1:
+                return self.M.cli('/admin/tool/phpunit/cli/init.php', addtoenv=env, **stdio)
+
+            result = self.M.cli('/admin/tool/phpunit/cli/util.php', args=['--diag'], addtoenv=env, **stdio)
+            if result[0] == DIAG_REINSTALL:
+                self.M.cli('/admin/tool/phpunit/cli/util.php', args=['--drop'], addtoenv=env, **stdio)
+            elif result[0] != DIAG_INSTALL:
+                return result
+            return self.M.cli('/admin/tool/phpunit/cli/util.php', args=['--install'], addtoenv=env, **stdio)
+
+        results = ParallelJobs(1).run(initWorker, [1])
+        if not isinstance(results[0], Exception) and results[0][0] == 0:
+            results += ParallelJobs(workers - 1).run(initWorker, list(range(2, workers + 1)))
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+            elif result[0] != 0:
+                return result
+        return results[0]
+
     def run(self, **kwargs):
         """Execute the command"""
         cmd = self.getCommand(**kwargs)
         return self.M.exec(cmd, stdout=None, stderr=None)
 
+    def runParallel(self, workers, **kwargs) -> bool:
+        """Run the testsuites over parallel workers, and return whether they all passed
+
+        The testsuites are distributed between the workers based on how long they took during the
+        previous runs. The output of each worker is written to a log file, and their JUnit reports
+        are merged in junit.xml, both in the extra directory of the instance.
+        """
+        outputDir = self.Wp.getExtraDir(self.M.get('identifier'), 'phpunit')
+        timings = self.getTimings()
+        default = statistics.median(timings.values()) if timings else DEFAULT_DURATION
+        (buckets, loads) = distribute_by_duration({t: timings.get(t, default) for t in self.getTestsuites()}, workers)
+
+        cmd = self.getCommand(**kwargs)
+        running = {}
+        for worker, bucket in enumerate(buckets, 1):
+            if not bucket:
+                continue
+            junit = self.getWorkerDataroot(worker) / 'junit.xml'
+            workercmd = [*cmd, '--testsuite', ','.join(bucket), '--log-junit', junit.as_posix()]
+            logging.info('Starting worker %d with %d testsuites, estimated to %d seconds', worker, len(bucket), loads[worker - 1])
+            logging.debug(' '.join(workercmd))
+
+            log = open(os.path.join(outputDir, 'worker%d.log' % worker), 'w')
+            proc = self.M.container.popen(workercmd, addtoenv=self.getWorkerEnv(worker), stdout=log, stderr=subprocess.STDOUT)
+            running[worker] = (proc, log, time.monotonic())
+
+        success = True
+        results = {}
+        try:
+            while running:
+                for worker, (proc, log, started) in list(running.items()):
+                    if proc.poll() is None:
+                        continue
+                    log.close()
+                    del running[worker]
+                    results[worker] = proc.returncode
+                    success = success and proc.returncode == 0
+                    logging.info('Worker %d %s in %.1fs: %s', worker, 'passed' if proc.returncode == 0 else 'failed',
+                                 time.monotonic() - started, self._getSummary(log.name))
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            for (proc, log, started) in running.values():
+                proc.terminate()
+                proc.wait()
+                log.close()
+            success = False
+
+        self._mergeJUnit(list(results.keys()), os.path.join(outputDir, 'junit.xml'), timings)
+        with open(self.getTimingsFile(), 'w') as f:
+            json.dump(timings, f, indent=2, sort_keys=True)
+
+        for worker, returncode in sorted(results.items()):
+            if returncode != 0:
+                logging.info('The output of worker %d is in %s', worker, os.path.join(outputDir, 'worker%d.log' % worker))
+        logging.info('The merged JUnit report is in %s', os.path.join(outputDir, 'junit.xml'))
+
+        return success
+
+    def _getSummary(self, logfile):
+        """Return the last line of the output of a worker, where PHPUnit prints its summary"""
+        with open(logfile, 'r', errors='replace') as f:
+            lines = [line.strip() for line in f if line.strip()]
+        return lines[-1] if lines else ''
+
+    def _mergeJUnit(self, workers, path, timings):
+        """Merge the JUnit reports of the workers, and record the duration of their testsuites"""
+        import xml.etree.ElementTree as ET
+        testsuites = set(self.getTestsuites())
+        merged = ET.Element('testsuites')
+        for worker in sorted(workers):
+            try:
+                root = ET.fromstring(self.M.container.readfile(self.getWorkerDataroot(worker) / 'junit.xml'))
+            except Exception as e:
+                logging.warning('Could not read the JUnit report of worker %d: %s', worker, e)
+                continue
+
+            for testsuite in root.iter('testsuite'):
+                if testsuite.get('name') in testsuites and testsuite.get('time'):
+                    timings[testsuite.get('name')] = round(float(testsuite.get('time')), 1)
+            merged.extend(list(root) if root.tag == 'testsuites' else [root])
+
+        ET.ElementTree(merged).write(path, encoding='utf-8', xml_declaration=True)
+
     def usesComposer(self):
         """Return whether or not the instance uses composer, the latter is considered installed"""
         return os.path.isfile(os.path.join(self.M.get('path'), 'composer.json'))
@@ -24,9 +24,7 @@ http://github.com/FMCorz/mdk
 
 import os
 import json
-import http.client
 from urllib.parse import urlencode
-from urllib.request import urlretrieve
 import logging
 import zipfile
 import re
@@ -383,6 +381,8 @@ class PluginDownloadInfo(dict):
                 logging.info('Found cached plugin file: %s' % (os.path.basename(target)))
                 return target
 
+        from urllib.request import urlretrieve
+
         logging.info('Downloading %s (%s)' % (plugin, release))
         if logging.getLogger().level <= logging.INFO:
             urlretrieve(dl, target, tools.downloadProcessHook)
@@ -476,6 +476,7 @@ class PluginRepository(object):
 
     def request(self, uri, method, data, headers={}):
         """Sends a request to the server and returns the response status and data"""
+        import http.client
 
         uri = self.uri + '/' + str(self.apiversion) + '/' + uri.strip('/')
         method = method.upper()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, List, Optional
+
+from .config import Conf
+from .tools import stableBranch
+
+C = Conf()
+
+
+class RepositoryPool(object):
+    """Pool of repositories prepared ahead of the creation of instances
+
+    Cloning and checking out a branch is what takes most of the time when creating an instance.
+    The pool contains repositories which have been cloned from the cached repositories, and have
+    their branch checked out. Creating an instance claims one of them by moving it in place, it
+    is then brought up to date like any other instance.
+
+    The repositories are stored in the storage directory, so that moving them is instantaneous.
+    """
+
+    _path = None
+    _Wp = None
+
+    def __init__(self, Wp):
+        self._Wp = Wp
+        self._path = os.path.join(Wp.path, '.mdkpool')
+
+    def claim(self, branch, integration, dest) -> bool:
+        """Move a repository of the pool to dest, which must not exist or be empty
+
+        Returns whether a repository was claimed.
+        """
+        for entry in reversed(self._entries(branch, integration)):
+            try:
+                os.rename(entry, dest)
+            except OSError:
+                # Another process may have claimed it.
+                continue
+            logging.debug('Claimed %s from the pool' % entry)
+            return True
+        return False
+
+    def clear(self):
+        """Remove all the repositories from the pool"""
+        if os.path.isdir(self._path):
+            shutil.rmtree(self._path)
+
+    def fill(self, update: Optional[Callable[[dict], None]] = None) -> int:
+        """Prepare the repositories missing from the pool, and return how many were prepared
+
+        Only one process fills the pool at a time, the others return immediately. The function
+        update, which updates the cached repositories, is only called once the lock is held so
+        that the processes do not fetch them concurrently.
+        """
+        wanted = self.getWanted()
+        if not wanted:
+            return 0
+
+        os.makedirs(self._path, exist_ok=True)
+        with open(os.path.join(self._path, '.lock'), 'w') as lockfile:
+            try:
+                import fcntl
+                fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except ImportError:
+                pass
+            except OSError:
+                logging.info('The pool is already being filled by another process')
+                return 0
+
+            if update:
+                update(wanted)
+
+            prepared = 0
+            for (branch, integration), count in sorted(wanted.items()):
+                self._cleanUp(branch, integration)
+                for i in range(count - len(self._entries(branch, integration))):
+                    logging.info('Preparing a repository for %s%s...' % (branch, ' (integration)' if integration else ''))
+                    self._prepare(branch, integration)
+                    prepared += 1
+
+        return prepared
+
+    def getWanted(self) -> dict:
+        """Return the number of repositories to keep for each branch, keyed by (branch, integration)"""
+        wanted = {}
+        for key, integration in (('stable', False), ('integration', True)):
+            for version, count in (C.get('pool.%s' % key) or {}).items():
+                if not os.path.isdir(self._Wp.getCachedRemote(integration)):
+                    continue
+                wanted[(stableBranch(version), integration)] = int(count)
+        return wanted
+
+    def list(self) -> List[dict]:
+        """List the repositories of the pool"""
+        entries = []
+        for kind, integration in (('stable', False), ('integration', True)):
+            kindDir = os.path.join(self._path, kind)
+            if not os.path.isdir(kindDir):
+                continue
+            for branch in sorted(os.listdir(kindDir)):
+                for entry in self._entries(branch, integration):
+                    entries.append({
+                        'branch': branch,
+                        'integration': integration,
+                        'path': entry,
+                        'created': os.stat(entry).st_mtime,
+                    })
+        return entries
+
+    def refillInBackground(self):
+        """Start a process filling the pool, which outlives the current one
+
+        The cached repositories are not updated by that process, they were when the repository
+        taken from the pool was brought up to date.
+        """
+        if not self.getWanted():
+            return
+
+        os.makedirs(self._path, exist_ok=True)
+        with open(os.path.join(self._path, 'fill.log'), 'a') as log:
+            subprocess.Popen(
+                [sys.executable, '-m', 'mdk', 'pool', 'fill', '--no-update'],
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True
+            )
+
+    def _branchDir(self, branch, integration):
+        return os.path.join(self._path, 'integration' if integration else 'stable', branch)
+
+    def _cleanUp(self, branch, integration):
+        """Remove the repositories left over by an interrupted preparation"""
+        branchDir = self._branchDir(branch, integration)
+        if not os.path.isdir(branchDir):
+            return
+        for name in os.listdir(branchDir):
+            if name.startswith('.tmp'):
+                shutil.rmtree(os.path.join(branchDir, name), ignore_errors=True)
+
+    def _entries(self, branch, integration) -> List[str]:
+        """Return the path to the repositories ready for a branch, from the oldest"""
+        branchDir = self._branchDir(branch, integration)
+        if not os.path.isdir(branchDir):
+            return []
+        return [os.path.join(branchDir, name) for name in sorted(os.listdir(branchDir)) if not name.startswith('.')]
+
+    def _prepare(self, branch, integration):
+        """Prepare a repository and add it to the pool"""
+        branchDir = self._branchDir(branch, integration)
+        os.makedirs(branchDir, exist_ok=True)
+
+        # The repository is prepared in a temporary directory which is not considered by claim().
+        tmpDir = tempfile.mkdtemp(prefix='.tmp', dir=branchDir)
+        try:
+            self._Wp.cloneCachedRepository(branch, integration, tmpDir)
+            self._Wp.setUpRepository(tmpDir, branch, integration)
+        except Exception:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+            raise
+
+        os.rename(tmpDir, os.path.join(branchDir, '%d%s' % (time.time(), os.path.basename(tmpDir)[4:])))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import json
+import logging
+import os
+import shlex
+import signal
+import subprocess
+import time
+from tempfile import gettempdir
+from typing import Callable, Optional
+
+from mdk.docker import docker_exec, is_docker_container_running
+from mdk.tools import process
+
+DEFAULT_PORT = 4444
+
+# The variants of the containers started by `mdk docker selenium up`.
+DOCKER_VARIANTS = ['firefox', 'chrome', 'chromium']
+
+# Selenium 4 answers on /status, Selenium 3 on /wd/hub/status.
+STATUS_PATHS = ['/status', '/wd/hub/status']
+
+
+def is_selenium_ready(port: int = DEFAULT_PORT, host: str = '127.0.0.1') -> bool:
+    """Whether a Selenium server is ready to accept sessions on the port"""
+    import urllib.request
+    for path in STATUS_PATHS:
+        try:
+            with urllib.request.urlopen('http://%s:%d%s' % (host, port, path), timeout=1) as response:
+                return _is_status_ready(response.read())
+        except (OSError, ValueError):
+            continue
+    return False
+
+
+def is_docker_selenium_ready(name: str) -> bool:
+    """Whether the Selenium server of a container is ready to accept sessions"""
+    command = ['curl', '-sf', 'http://localhost:%d/status' % DEFAULT_PORT]
+    r, out, _ = docker_exec(name, command) or process(['docker', 'exec', name, *command])
+    return r == 0 and _is_status_ready(out)
+
+
+def find_docker_selenium() -> Optional[str]:
+    """Return the name of the running container started by `mdk docker selenium up`, if any"""
+    for variant in DOCKER_VARIANTS:
+        name = 'selenium-%s' % variant
+        if is_docker_container_running(name):
+            return name
+    return None
+
+
+def wait_until(probe: Callable[[], bool], timeout: float, interval: float = 0.25, maxinterval: float = 2.0) -> bool:
+    """Call probe until it returns True, waiting longer between each call, and return False on timeout"""
+    deadline = time.monotonic() + timeout
+    while True:
+        if probe():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, maxinterval)
+
+
+def start_kept_selenium(command: str, port: int, logpath: str) -> int:
+    """Start a Selenium server which outlives MDK, so that the following runs can use it
+
+    The ID of its process is recorded to stop it later with stop_kept_selenium().
+    """
+    with open(logpath, 'a') as log:
+        proc = subprocess.Popen(shlex.split(command), stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                start_new_session=True)
+    with open(_get_pid_file(port), 'w') as f:
+        f.write(str(proc.pid))
+    return proc.pid
+
+
+def stop_kept_selenium() -> int:
+    """Stop the Selenium servers started by start_kept_selenium(), and return how many were stopped"""
+    import glob
+    stopped = 0
+    for pidfile in glob.glob(_get_pid_file('*')):
+        try:
+            with open(pidfile, 'r') as f:
+                pid = int(f.read().strip())
+            os.remove(pidfile)
+            os.kill(pid, signal.SIGTERM)
+        except (OSError, ValueError):
+            continue
+        logging.debug('Stopped the Selenium server with PID %d' % pid)
+        stopped += 1
+    return stopped
+
+
+def _get_pid_file(port) -> str:
+    return os.path.join(gettempdir(), 'mdk_selenium_%s.pid' % port)
+
+
+def _is_status_ready(content) -> bool:
+    try:
+        status = json.loads(content)
+    except ValueError:
+        return False
+    value = status.get('value') if isinstance(status, dict) else None
+    if not isinstance(value, dict):
+        return False
+    # Older versions of Selenium 3 do not report whether they are ready, only whether they run.
+    return value.get('ready') is True or ('ready' not in value and status.get('status') == 0)
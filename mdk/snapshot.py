@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from typing import Dict, List, Optional
+
+from .db import dump_database, restore_database
+
+# The directories of the data root which are not kept, Moodle creates them again when needed.
+EXCLUDED_DIRS = ['cache', 'localcache', 'lock', 'sessions', 'temp', 'trashdir']
+
+# The files of the file pool are named after the SHA1 of their content, and are never modified.
+FILEDIR_REGEX = re.compile(r'^filedir/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{40})$')
+
+# The ioctl cloning a file on the file systems supporting it, such as Btrfs and XFS.
+FICLONE = 0x40049409
+
+
+def clone_file(src: str, dst: str):
+    """Copy a file, sharing its blocks with the original when the file system supports it"""
+    try:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copy2(src, dst)
+
+
+def sha1_file(path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1048576), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class InstanceSnapshots(object):
+    """Snapshots of the state of an instance: its database, data root, config file and commit
+
+    The snapshots are kept in the extra directory of the instance. Their database is a copy made
+    by the engine when it supports it, and a dump otherwise. The files of their data root are
+    stored once, named after their content, in a directory shared by all the snapshots. The files
+    of the file pool, which are never modified, are hard linked to and from the data root, the
+    other files are copied, sharing their blocks when the file system supports it.
+    """
+
+    _M = None
+    _path = None
+
+    def __init__(self, Wp, M):
+        self._M = M
+        self._Wp = Wp
+        self._path = Wp.getExtraDir(M.get('identifier'), 'snapshots')
+
+    def delete(self, name: str):
+        """Delete a snapshot, the files it does not share with the others are removed by prune()"""
+        snapshot = self.get(name)
+        if not snapshot:
+            raise Exception('The snapshot \'%s\' does not exist' % name)
+
+        if snapshot['db'] == 'clone':
+            dbo = self._M.dbo()
+            if dbo.dbexists(self._getDbName(name)):
+                dbo.dropdb(self._getDbName(name))
+        shutil.rmtree(self._getPath(name))
+
+    def get(self, name: str) -> Optional[dict]:
+        """Return the information about a snapshot"""
+        try:
+            with open(os.path.join(self._getPath(name), 'snapshot.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def list(self) -> List[dict]:
+        """List the snapshots, the most recent first"""
+        snapshots = []
+        for name in os.listdir(self._path):
+            snapshot = self.get(name) if not name.startswith('.') else None
+            if snapshot:
+                snapshots.append(snapshot)
+        return sorted(snapshots, key=lambda s: s['created'], reverse=True)
+
+    def prune(self, keep: Optional[int] = None) -> int:
+        """Delete the snapshots beyond the most recent to keep, and the files no longer used
+
+        Returns the number of files removed.
+        """
+        if keep is not None:
+            for snapshot in self.list()[keep:]:
+                logging.info('Deleting the snapshot %s' % snapshot['name'])
+                self.delete(snapshot['name'])
+
+        used = set()
+        for snapshot in self.list():
+            used.update(entry[0] for entry in self._readManifest(snapshot['name']).values())
+
+        removed = 0
+        objects = os.path.join(self._path, '.objects')
+        for root, dirs, files in os.walk(objects):
+            for name in files:
+                if name not in used:
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+        return removed
+
+    def restore(self, name: str, git: bool = True):
+        """Restore a snapshot, and its commit when git is set"""
+        snapshot = self.get(name)
+        if not snapshot:
+            raise Exception('The snapshot \'%s\' does not exist' % name)
+
+        M = self._M
+        if git:
+            self._checkCanCheckout()
+
+        started = time.monotonic()
+        logging.info('Restoring the database')
+        dbo = M.dbo()
+        dbname = M.get('dbname')
+        if dbo.dbexists(dbname):
+            dbo.dropdb(dbname)
+        if snapshot['db'] == 'clone':
+            dbo.clonedb(self._getDbName(name), dbname)
+        else:
+            dbo.createdb(dbname)
+            restore_database(dbo, dbname, os.path.join(self._getPath(name), 'database.dump'))
+
+        logging.info('Restoring the data root')
+        self._restoreDataroot(name)
+        shutil.copy2(os.path.join(self._getPath(name), 'config.php'), os.path.join(M.get('path'), 'config.php'))
+        M.reload()
+        M.forgetTestEnvironments()
+
+        if git and snapshot.get('head'):
+            self._checkout(snapshot)
+
+        logging.info('Snapshot %s restored in %.1f seconds' % (name, time.monotonic() - started))
+
+    def save(self, name: str, force: bool = False) -> dict:
+        """Take a snapshot of the instance"""
+        if not re.match(r'^[a-zA-Z0-9_.-]+$', name) or name.startswith('.'):
+            raise Exception('The name of a snapshot can only contain letters, digits, and _.-')
+        elif self.get(name):
+            if not force:
+                raise Exception('The snapshot \'%s\' already exists' % name)
+            self.delete(name)
+
+        M = self._M
+        if not M.get('installed'):
+            raise Exception('The instance is not installed')
+
+        started = time.monotonic()
+        path = self._getPath(name)
+        os.makedirs(path)
+        snapshot = {'name': name, 'created': time.time(), 'db': 'clone', 'head': None, 'branch': None}
+        try:
+            logging.info('Saving the database')
+            dbo = M.dbo()
+            try:
+                if dbo.dbexists(self._getDbName(name)):
+                    dbo.dropdb(self._getDbName(name))
+                dbo.clonedb(M.get('dbname'), self._getDbName(name))
+            except NotImplementedError:
+                snapshot['db'] = 'dump'
+                dump_database(dbo, M.get('dbname'), os.path.join(path, 'database.dump'))
+
+            logging.info('Saving the data root')
+            snapshot['files'] = self._saveDataroot(name)
+            shutil.copy2(os.path.join(M.get('path'), 'config.php'), os.path.join(path, 'config.php'))
+
+            try:
+                snapshot['head'] = M.git().execute('rev-parse HEAD')[1].strip()
+                snapshot['branch'] = M.currentBranch()
+            except Exception:
+                logging.debug('Could not read the commit of the instance')
+
+            with open(os.path.join(path, 'snapshot.json'), 'w') as f:
+                json.dump(snapshot, f, indent=2)
+        except Exception:
+            shutil.rmtree(path, True)
+            raise
+
+        logging.info('Snapshot %s saved in %.1f seconds' % (name, time.monotonic() - started))
+        return snapshot
+
+    def _checkCanCheckout(self):
+        r, out, _ = self._M.git().execute('status --porcelain --untracked-files=no')
+        if r != 0 or out.strip():
+            raise Exception('The instance has uncommitted changes, commit or stash them, or do not restore the code')
+
+    def _checkout(self, snapshot):
+        git = self._M.git()
+        branch = snapshot.get('branch')
+        if branch and branch != 'HEAD' and git.hasBranch(branch):
+            if not git.checkout(branch):
+                raise Exception('Could not check out the branch %s' % branch)
+            if git.execute('rev-parse %s' % branch)[1].strip() != snapshot['head']:
+                logging.warning('The branch %s has moved since the snapshot was taken, the code may not match the database'
+                                % branch)
+        elif not git.checkout(snapshot['head']):
+            raise Exception('Could not check out the commit %s' % snapshot['head'])
+
+    def _getDbName(self, name: str) -> str:
+        return 'mdksnap_%s' % hashlib.sha1(('%s/%s' % (self._M.get('dbname'), name)).encode('utf-8')).hexdigest()[:16]
+
+    def _getDataroot(self) -> str:
+        # The data root of the instances running in Docker is mounted from the data directory.
+        dataroot = self._M.get('dataroot')
+        if not dataroot or not os.path.isdir(dataroot):
+            dataroot = self._Wp.getPath(self._M.get('identifier'), 'data')
+        return dataroot
+
+    def _getObjectPath(self, digest: str) -> str:
+        return os.path.join(self._path, '.objects', digest[:2], digest)
+
+    def _getPath(self, name: str) -> str:
+        return os.path.join(self._path, name)
+
+    def _readManifest(self, name: str) -> Dict[str, list]:
+        try:
+            with open(os.path.join(self._getPath(name), 'manifest.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _restoreDataroot(self, name: str):
+        """Build the data root of the snapshot beside the current one, and swap them"""
+        dataroot = self._getDataroot()
+        building = dataroot + '.mdkrestore'
+        shutil.rmtree(building, True)
+        os.makedirs(building)
+        if os.path.isdir(dataroot):
+            shutil.copystat(dataroot, building)
+
+        for relpath, (digest, mode, linked) in self._readManifest(name).items():
+            dst = os.path.join(building, relpath)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if linked:
+                try:
+                    os.link(self._getObjectPath(digest), dst)
+                    continue
+                except OSError:
+                    pass
+            clone_file(self._getObjectPath(digest), dst)
+            os.chmod(dst, mode)
+
+        for dirname in EXCLUDED_DIRS:
+            os.makedirs(os.path.join(building, dirname), exist_ok=True)
+
+        if os.path.isdir(dataroot):
+            old = dataroot + '.mdkold'
+            os.rename(dataroot, old)
+            os.rename(building, dataroot)
+            shutil.rmtree(old, True)
+        else:
+            os.rename(building, dataroot)
+
+    def _saveDataroot(self, name: str) -> int:
+        """Store the files of the data root, and write the manifest of the snapshot"""
+        dataroot = self._getDataroot()
+        manifest = {}
+        for root, dirs, files in os.walk(dataroot):
+            if root == dataroot:
+                dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+            for filename in files:
+                src = os.path.join(root, filename)
+                relpath = os.path.relpath(src, dataroot)
+                if os.path.islink(src):
+                    continue
+
+                match = FILEDIR_REGEX.match(relpath.replace(os.sep, '/'))
+                if match:
+                    digest = match.group(1)
+                else:
+                    digest = sha1_file(src)
+
+                linked = bool(match)
+                obj = self._getObjectPath(digest)
+                if not os.path.exists(obj):
+                    os.makedirs(os.path.dirname(obj), exist_ok=True)
+                    try:
+                        if not linked:
+                            raise OSError()
+                        os.link(src, obj)
+                    except OSError:
+                        clone_file(src, obj)
+                manifest[relpath] = [digest, os.stat(src).st_mode & 0o7777, linked]
+
+        with open(os.path.join(self._getPath(name), 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        return len(manifest)
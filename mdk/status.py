@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import logging
+import subprocess
+from typing import Dict, List, Optional
+
+from .config import Conf
+from .db import get_databases_info
+from .docker import get_docker_containers
+from .tools import ParallelJobs
+
+C = Conf()
+
+
+def parse_git_status(output: str) -> Dict:
+    """Parse the output of git status --porcelain=v2 --branch"""
+    status = {'branch': None, 'upstream': None, 'ahead': None, 'behind': None, 'dirty': False}
+    for line in output.splitlines():
+        if line.startswith('# branch.head '):
+            head = line[len('# branch.head '):]
+            status['branch'] = head if head != '(detached)' else None
+        elif line.startswith('# branch.upstream '):
+            status['upstream'] = line[len('# branch.upstream '):]
+        elif line.startswith('# branch.ab '):
+            (ahead, behind) = line[len('# branch.ab '):].split()
+            status['ahead'] = int(ahead)
+            status['behind'] = -int(behind)
+        elif line and not line.startswith('#'):
+            status['dirty'] = True
+    return status
+
+
+class InstanceProbe(object):
+    """Reads the state of many instances at once
+
+    The instances are probed concurrently, each with a single call to git for its branch, its
+    changes and how it compares to its upstream branch. The state of the Docker containers is
+    read once for all of them, and the databases are read with one query per database server.
+    """
+
+    def __init__(self, Wp, jobs: int = 8, upgrade: bool = False):
+        """
+        :param jobs: The number of instances probed at the same time.
+        :param upgrade: Whether to check if the instances need upgrading, this runs PHP.
+        """
+        self._Wp = Wp
+        self.jobs = jobs
+        self.upgrade = upgrade
+
+    def probe(self, names: List[str]) -> List[Dict]:
+        """Return the state of the instances, in the same order"""
+        containers = get_docker_containers()
+        results = ParallelJobs(self.jobs).run(lambda name, logger, stdio: self.probeInstance(name, containers), names)
+
+        statuses = []
+        instances = []
+        for name, result in zip(names, results):
+            if isinstance(result, Exception):
+                status = self.getEmptyStatus(name)
+                status['error'] = str(result)
+                statuses.append(status)
+                continue
+            (status, M) = result
+            statuses.append(status)
+            if status['installed']:
+                instances.append(M)
+
+        databases = get_databases_info(instances)
+        for status in statuses:
+            info = databases.get(status['name'])
+            if info is not None:
+                status['database'] = info
+        return statuses
+
+    def getEmptyStatus(self, name: str) -> Dict:
+        return {
+            'name': name,
+            'branch': None,
+            'upstream': None,
+            'ahead': None,
+            'behind': None,
+            'dirty': None,
+            'installed': None,
+            'database': None,
+            'docker': None,
+            'upgrade': None,
+            'error': None,
+        }
+
+    def probeInstance(self, name: str, containers: Dict[str, str]):
+        """Return the state of an instance, and the instance"""
+        M = self._Wp.get(name)
+        status = self.getEmptyStatus(name)
+        status['installed'] = bool(M.get('installed'))
+        status['docker'] = containers.get(name)
+
+        git = M.git()
+        r, out, err = git.execute(['status', '--porcelain=v2', '--branch', '--untracked-files=no'], readonly=True)
+        if r == 0:
+            status.update(parse_git_status(out))
+        else:
+            logging.debug('Could not read the status of %s: %s' % (name, err))
+
+        # Without a tracking branch, compare with the stable branch of the upstream remote.
+        if status['upstream'] is None and M.get('stablebranch'):
+            ref = '%s/%s' % (C.get('upstreamRemote'), M.get('stablebranch'))
+            r, out, _ = git.execute(['rev-list', '--left-right', '--count', 'HEAD...%s' % ref], readonly=True)
+            if r == 0:
+                (ahead, behind) = out.split()
+                status.update({'upstream': ref, 'ahead': int(ahead), 'behind': int(behind)})
+
+        if self.upgrade and status['installed']:
+            status['upgrade'] = self.isUpgradePending(M)
+
+        return (status, M)
+
+    def isUpgradePending(self, M) -> Optional[bool]:
+        """Return whether the instance needs upgrading, or None when that is unknown"""
+        if not M.branch_compare(32):
+            return None
+        try:
+            r, _, _ = M.cli('admin/cli/upgrade.php', ['--is-pending'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except Exception as e:
+            logging.debug('Could not check whether %s needs upgrading: %s' % (M.get('identifier'), e))
+            return None
+        # The script exits with 2 when an upgrade is pending.
+        return {0: False, 2: True}.get(r)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import logging
+import os
+import selectors
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, List, Optional
+
+# The size of the chunks read from the output of the processes.
+CHUNK_SIZE = 65536
+
+
+class RotatingLog(object):
+    """Log file which is rotated when it exceeds a size, keeping a number of backups"""
+
+    _file = None
+    _size = 0
+
+    def __init__(self, path, maxBytes=10485760, backups=3):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.backups = backups
+        self._open()
+
+    def close(self):
+        self._file.close()
+
+    def write(self, data: bytes):
+        if self.maxBytes and self._size + len(data) > self.maxBytes and self._size > 0:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+
+    def _open(self):
+        self._file = open(self.path, 'ab')
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists('%s.%d' % (self.path, i)):
+                os.replace('%s.%d' % (self.path, i), '%s.%d' % (self.path, i + 1))
+        if self.backups > 0:
+            os.replace(self.path, '%s.1' % self.path)
+        else:
+            os.remove(self.path)
+        self._open()
+
+
+class SupervisedProcess(object):
+    """A process started by the supervisor"""
+
+    def __init__(self, cmd, proc: subprocess.Popen, log: Optional[RotatingLog], echo: bool, probe: Optional[Callable[[], bool]]):
+        self.cmd = cmd
+        self.log = log
+        self.echo = echo
+        self.probe = probe
+        self.started = time.monotonic()
+        self._drained = threading.Event()
+        self._proc = proc
+        if log is None and not echo:
+            self._drained.set()
+
+    @property
+    def pid(self) -> int:
+        return self._proc.pid
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._proc.poll()
+
+    def getStatus(self) -> dict:
+        """Return the health of the process
+
+        The process is healthy when it is running, and when its probe, if any, succeeds.
+        """
+        alive = self.isAlive()
+        return {
+            'pid': self.pid,
+            'alive': alive,
+            'healthy': alive and (self.probe is None or bool(self.probe())),
+            'uptime': self.getUptime(),
+            'returncode': self.returncode,
+            'log': self.log.path if self.log else None,
+        }
+
+    def getUptime(self) -> float:
+        """Return the number of seconds since the process was started"""
+        return time.monotonic() - self.started
+
+    def isAlive(self) -> bool:
+        return self._proc.poll() is None
+
+    def stop(self, timeout: float = 10) -> Optional[int]:
+        """Stop the process, killing it when it does not terminate within the timeout"""
+        if self.isAlive():
+            logging.debug('Terminating process %d' % self.pid)
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                logging.debug('Killing process %d' % self.pid)
+                self._proc.kill()
+        return self.wait()
+
+    def wait(self, timeout: Optional[float] = None) -> int:
+        """Wait for the process to exit, and for its output to be written"""
+        returncode = self._proc.wait(timeout)
+        self._drained.wait(timeout)
+        return returncode
+
+
+class Supervisor(object):
+    """Supervises long running helper processes
+
+    The output of the processes is read by a single thread, which waits on all of them at once
+    and writes what they output by large chunks to their log file. Reading their output prevents
+    them from blocking once the pipe is full.
+    """
+
+    _lock = None
+    _processes = None
+    _selector = None
+    _thread = None
+    _wakeup = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes = []
+
+    def start(self, cmd, logPath: Optional[str] = None, echo: bool = False, probe: Optional[Callable[[], bool]] = None,
+              popen: Callable[..., subprocess.Popen] = subprocess.Popen, **kwargs) -> SupervisedProcess:
+        """Start a process
+
+        Its output is written to the log file when logPath is set, and to the standard output when
+        echo is set. Without either, the process writes directly to the standard output. The probe
+        tells whether the process is healthy, and popen can be replaced by the one of a container.
+        """
+        if type(cmd) != list:
+            cmd = shlex.split(str(cmd))
+        logging.debug(' '.join(cmd))
+
+        drain = bool(logPath or echo)
+        if drain:
+            kwargs['stdout'] = subprocess.PIPE
+            kwargs['stderr'] = subprocess.STDOUT
+        proc = popen(cmd, stdin=subprocess.DEVNULL, **kwargs)
+
+        process = SupervisedProcess(cmd, proc, RotatingLog(logPath) if logPath else None, echo, probe)
+        with self._lock:
+            self._processes.append(process)
+        if drain:
+            self._register(process)
+        return process
+
+    def getProcesses(self) -> List[SupervisedProcess]:
+        with self._lock:
+            return list(self._processes)
+
+    def stopAll(self, timeout: float = 10):
+        """Stop all the processes, they are given the timeout together to terminate"""
+        processes = [p for p in self.getProcesses() if p.isAlive()]
+        for process in processes:
+            process._proc.terminate()
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.stop(max(0, deadline - time.monotonic()))
+
+    def _drain(self):
+        """Read the output of the processes as it comes"""
+        while True:
+            for (key, events) in self._selector.select():
+                if key.data is None:
+                    os.read(key.fd, CHUNK_SIZE)
+                    continue
+
+                process = key.data
+                data = os.read(key.fd, CHUNK_SIZE)
+                if not data:
+                    self._selector.unregister(key.fd)
+                    process._proc.stdout.close()
+                    if process.log:
+                        process.log.close()
+                    process._drained.set()
+                    continue
+
+                if process.log:
+                    process.log.write(data)
+                if process.echo:
+                    sys.stdout.buffer.write(data)
+                    sys.stdout.flush()
+
+    def _register(self, process: SupervisedProcess):
+        with self._lock:
+            if not self._thread:
+                self._selector = selectors.DefaultSelector()
+                (readfd, self._wakeup) = os.pipe()
+                self._selector.register(readfd, selectors.EVENT_READ, None)
+                self._thread = threading.Thread(target=self._drain, daemon=True)
+                self._thread.start()
+            self._selector.register(process._proc.stdout.fileno(), selectors.EVENT_READ, process)
+
+        # Interrupt the current wait so that the new process is considered.
+        os.write(self._wakeup, b'.')
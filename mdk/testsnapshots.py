@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Moodle Development Kit
+
+Copyright (c) 2026 Frédéric Massart
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+http://github.com/FMCorz/mdk
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from .db import dump_database, restore_database
+
+
+class TestSnapshots(object):
+    """Snapshots of a test environment of an instance, restored rather than initialising it again
+
+    A snapshot holds the tables of the environment and its data root as they were right after
+    it was initialised, it is identified by the fingerprint of what the environment was initialised
+    from. When the code goes back to that state, for instance when switching branches, restoring
+    the snapshot takes seconds where initialising takes minutes.
+
+    The tables are copied to a database named after the snapshot when the engine supports it,
+    they are dumped to a file otherwise. The data root is copied beside itself. The snapshots
+    which were the least recently used are removed when there are more than the limit.
+    """
+
+    _M = None
+    _directory = None
+    _index = None
+
+    def __init__(self, M, kind: str, prefix: str, dataroot: Path, directory: str, keep: int = 3):
+        """
+        :param kind: The name of the environment, e.g. 'phpunit'.
+        :param prefix: The prefix of the tables of the environment.
+        :param dataroot: The data root of the environment, in the container.
+        :param directory: The directory in which the index and the dumps are kept.
+        :param keep: The number of snapshots to keep.
+        """
+        self._M = M
+        self.kind = kind
+        self.prefix = prefix
+        self.dataroot = dataroot
+        self.keep = keep
+        self._directory = directory
+
+    def getKey(self, fingerprint: Dict[str, str]) -> str:
+        """Return the key of the snapshot of an environment initialised from the fingerprint
+
+        Only the versions of the fingerprint determine the content of the environment.
+        """
+        values = [self._M.get('dbname'), self.kind, self.prefix, fingerprint.get('versions', '')]
+        return hashlib.sha1('\n'.join(values).encode('utf-8')).hexdigest()[:16]
+
+    def getSnapshots(self) -> Dict[str, dict]:
+        """Return the snapshots, keyed by their key"""
+        if self._index is None:
+            self._index = {}
+            try:
+                with open(self._getIndexPath(), 'r') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                pass
+        return self._index
+
+    def delete(self, key: str):
+        """Delete a snapshot"""
+        snapshot = self.getSnapshots().pop(key, None)
+        self._saveIndex()
+        if not snapshot:
+            return
+
+        logging.debug('Deleting the snapshot %s of the %s environment' % (key, self.kind))
+        if snapshot.get('method') == 'native':
+            dbo = self._M.dbo()
+            if dbo.dbexists(self._getDbName(key)):
+                dbo.dropdb(self._getDbName(key))
+        elif os.path.isfile(self._getDumpPath(key)):
+            os.remove(self._getDumpPath(key))
+        self._M.container.rmtree(self._getDatarootPath(key))
+
+    def prune(self, keep: Optional[int] = None):
+        """Delete the least recently used snapshots beyond the number to keep"""
+        keep = self.keep if keep is None else keep
+        snapshots = sorted(self.getSnapshots().items(), key=lambda item: item[1].get('used', 0), reverse=True)
+        for key, snapshot in snapshots[keep:]:
+            self.delete(key)
+
+    def restore(self, key: str) -> bool:
+        """Restore a snapshot, and return whether it was"""
+        snapshot = self.getSnapshots().get(key)
+        if not snapshot:
+            return False
+
+        logging.info('Restoring the snapshot of the %s environment' % (self.kind))
+        started = time.monotonic()
+        dbo = self._M.dbo()
+        dbname = self._M.get('dbname')
+        try:
+            if snapshot.get('method') == 'native':
+                dbo.restoresnapshot(self._getDbName(key), dbname, self.prefix)
+            else:
+                dbo.droptables(dbname, self.prefix)
+                restore_database(dbo, dbname, self._getDumpPath(key))
+
+            container = self._M.container
+            container.rmtree(self.dataroot)
+            r, _, err = container.exec(['cp', '-a', self._getDatarootPath(key).as_posix(), self.dataroot.as_posix()])
+            if r != 0:
+                raise Exception('Could not copy the data root: %s' % err)
+        except Exception as e:
+            logging.warning('Could not restore the snapshot %s of the %s environment: %s' % (key, self.kind, e))
+            self.delete(key)
+            return False
+
+        snapshot['used'] = time.time()
+        self._saveIndex()
+        logging.info('Snapshot restored in %.1f seconds' % (time.monotonic() - started))
+        return True
+
+    def save(self, key: str) -> bool:
+        """Take a snapshot of the environment, and return whether it was"""
+        if key in self.getSnapshots():
+            self.delete(key)
+
+        logging.info('Taking a snapshot of the %s environment' % (self.kind))
+        started = time.monotonic()
+        dbo = self._M.dbo()
+        dbname = self._M.get('dbname')
+        snapshot = {'created': time.time(), 'used': time.time(), 'method': 'native'}
+        try:
+            try:
+                if dbo.dbexists(self._getDbName(key)):
+                    dbo.dropdb(self._getDbName(key))
+                dbo.snapshotdb(dbname, self._getDbName(key), self.prefix)
+            except NotImplementedError:
+                snapshot['method'] = 'dump'
+                dump_database(dbo, dbname, self._getDumpPath(key), prefix=self.prefix)
+
+            container = self._M.container
+            target = self._getDatarootPath(key)
+            container.rmtree(target)
+            if not container.isdir(target.parent):
+                container.mkdir(target.parent, 0o777)
+            r, _, err = container.exec(['cp', '-a', self.dataroot.as_posix(), target.as_posix()])
+            if r != 0:
+                raise Exception('Could not copy the data root: %s' % err)
+        except NotImplementedError:
+            logging.debug('The database does not support snapshots')
+            return False
+        except Exception as e:
+            logging.warning('Could not take a snapshot of the %s environment: %s' % (self.kind, e))
+            self.getSnapshots()[key] = snapshot
+            self.delete(key)
+            return False
+
+        self.getSnapshots()[key] = snapshot
+        self._saveIndex()
+        logging.info('Snapshot taken in %.1f seconds' % (time.monotonic() - started))
+        self.prune()
+        return True
+
+    def _getDatarootPath(self, key: str) -> Path:
+        return self.dataroot.with_name(self.dataroot.name + '_snapshots') / key
+
+    def _getDbName(self, key: str) -> str:
+        return 'mdksnap_%s' % key
+
+    def _getDumpPath(self, key: str) -> str:
+        return os.path.join(self._directory, '%s_%s.dump' % (self.kind, key))
+
+    def _getIndexPath(self) -> str:
+        return os.path.join(self._directory, '%s.json' % self.kind)
+
+    def _saveIndex(self):
+        try:
+            with open(self._getIndexPath(), 'w') as f:
+                json.dump(self.getSnapshots(), f, indent=2, sort_keys=True)
+        except OSError as e:
+            logging.warning('Could not save the index of the snapshots: %s' % e)
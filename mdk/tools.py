@@ -24,7 +24,6 @@ http://github.com/FMCorz/mdk
 from pathlib import Path
 import sys
 import os
-import signal
 import subprocess
 import shlex
 import re
@@ -181,7 +180,7 @@ def parseBranch(branch):
     return parsed
 
 
-def process(cmd, cwd=None, stdout=subprocess.PIPE, stderr=subprocess.PIPE, addtoenv=None):
+def process(cmd, cwd=None, stdout=subprocess.PIPE, stderr=subprocess.PIPE, addtoenv=None, stdin=None):
     if type(cmd) != list:
         cmd = shlex.split(str(cmd))
     logging.debug(' '.join(cmd))
@@ -192,7 +191,7 @@ def process(cmd, cwd=None, stdout=subprocess.PIPE, stderr=subprocess.PIPE, addto
         env.update(addtoenv)
 
     try:
-        proc = subprocess.Popen(cmd, cwd=cwd, stdout=stdout, stderr=stderr, encoding='utf-8', env=env)
+        proc = subprocess.Popen(cmd, cwd=cwd, stdin=stdin, stdout=stdout, stderr=stderr, encoding='utf-8', env=env)
         (out, err) = proc.communicate()
     except KeyboardInterrupt as e:
         proc.kill()
@@ -225,6 +224,46 @@ def downloadProcessHook(count, size, total):
     sys.stderr.flush()
 
 
+def format_size(size):
+    """Return a number of bytes in a human readable form"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(size) < 1024 or unit == 'GB':
+            break
+        size /= 1024.0
+    return ('%d %s' if unit == 'B' else '%.1f %s') % (size, unit)
+
+
+def distribute_by_duration(durations, count):
+    """Distribute items between buckets so that the durations of the buckets are balanced
+
+    The items, the keys of durations, are given from the longest to the shortest to the bucket
+    with the least to do. Returns the buckets, and the total duration of each bucket.
+    """
+    buckets = [[] for i in range(count)]
+    loads = [0.0] * count
+    for item in sorted(durations.keys(), key=lambda item: (-durations[item], item)):
+        i = loads.index(min(loads))
+        loads[i] += durations[item]
+        buckets[i].append(item)
+    return (buckets, loads)
+
+
+def get_init_action(previous, current, installKeys):
+    """Compare the fingerprints of what a test environment is initialised from
+
+    Returns 'install' when the environment must be initialised again, because there is no previous
+    fingerprint or one of installKeys differs, 'config' when only its configuration must be rebuilt
+    because another key differs, or None when nothing changed.
+    """
+    if not previous:
+        return 'install'
+    elif any(previous.get(key) != current.get(key) for key in installKeys):
+        return 'install'
+    elif previous != current:
+        return 'config'
+    return None
+
+
 def get_absolute_path(path: Path, parent: Path):
     """Make a path absolute using parent if not absolute yet."""
     if not path.is_absolute():
@@ -280,36 +319,85 @@ def version_options():
     return opts
 
 
-class ProcessInThread(threading.Thread):
-    """Executes a process in a separate thread"""
-
-    cmd = None
-    cwd = None
-    stdout = None
-    stderr = None
-    _kill = False
-    _pid = None
-
-    def __init__(self, cmd, cwd=None, stdout=subprocess.PIPE, stderr=subprocess.PIPE):
-        threading.Thread.__init__(self)
-        if type(cmd) != 'list':
-            cmd = shlex.split(str(cmd))
-        self.cmd = cmd
-        self.cwd = cwd
-        self.stdout = stdout
-        self.stderr = stderr
-
-    def kill(self):
-        os.kill(self._pid, signal.SIGKILL)
-
-    def run(self):
-        logging.debug(' '.join(self.cmd))
-        proc = subprocess.Popen(self.cmd, cwd=self.cwd, stdout=self.stdout, stderr=self.stderr)
-        self._pid = proc.pid
-        while True:
-            if proc.poll():
-                break
+class ParallelJobs(object):
+    """Executes jobs concurrently
+
+    When more than one job is allowed, the log records and the process output of each job
+    are buffered in a temporary file, and printed at once when the job completes. This
+    prevents the output of concurrent jobs from being interleaved.
+    """
+
+    _jobs = 1
+    _locks = None
+    _lockslock = None
+
+    def __init__(self, jobs=1):
+        self._jobs = max(1, int(jobs or 1))
+        self._locks = {}
+        self._lockslock = threading.Lock()
+
+    @property
+    def jobs(self):
+        return self._jobs
+
+    def lock(self, key):
+        """Return the lock associated with a key, to prevent jobs from doing something at the same time"""
+        with self._lockslock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def run(self, fn, items):
+        """Call fn(item, logger, stdio) for each item, and return the results in order
+
+        The logger must be used instead of the logging module, and stdio contains the keyword
+        arguments stdout and stderr to pass to functions starting a process. When a job raises
+        an exception, the exception is returned as its result.
+        """
+        if self._jobs <= 1 or len(items) <= 1:
+            return [self._call(fn, item, logging.getLogger(), {'stdout': None, 'stderr': None}) for item in items]
+
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        results = [None] * len(items)
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            futures = {executor.submit(self._runBuffered, fn, item): i for i, item in enumerate(items)}
+            for future in as_completed(futures):
+                result, output = future.result()
+                results[futures[future]] = result
+                sys.stdout.write(output)
+                sys.stdout.flush()
+        return results
+
+    def _call(self, fn, item, logger, stdio):
+        try:
+            return fn(item, logger, stdio)
+        except Exception as e:
+            logger.warning('Unexpected error: %s' % e)
+            return e
+
+    def _runBuffered(self, fn, item):
+        with tempfile.TemporaryFile(mode='a+', encoding='utf-8') as output:
+            handler = _FileLogHandler(output)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger = logging.Logger('mdk.jobs', level=logging.getLogger().getEffectiveLevel())
+            logger.addHandler(handler)
+
+            result = self._call(fn, item, logger, {'stdout': output, 'stderr': subprocess.STDOUT})
+
+            output.flush()
+            output.seek(0)
+            return (result, output.read())
+
+
+class _FileLogHandler(logging.Handler):
+    """Log handler writing to a file which is shared with processes"""
+
+    def __init__(self, f):
+        logging.Handler.__init__(self)
+        self._file = f
 
-            # Reading the output seems to prevent the process to hang.
-            if self.stdout == subprocess.PIPE:
-                proc.stdout.read(1)
+    def emit(self, record):
+        self._file.write(self.format(record) + '\n')
+        # Flush immediately as processes write to the same file.
+        self._file.flush()
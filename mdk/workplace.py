@@ -21,15 +21,20 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 http://github.com/FMCorz/mdk
 """
 
+import json
 import os
 from pathlib import Path
 import shutil
 import logging
+import tempfile
+import time
 from typing import Optional
 
-from .tools import mkdir, process, stableBranch
+from .tools import ParallelJobs, mkdir, process, stableBranch
 from .exceptions import CreateException
 from .config import Conf
+from .index import InstanceIndex
+from .pool import RepositoryPool
 from . import git
 from . import moodle
 
@@ -52,6 +57,8 @@ class Workplace(object):
     """The path to the web accessible directory"""
     www = None
 
+    _index = None
+
     def __init__(self, path=None, wwwDir=None, dataDir=None, extraDir=None, mdkDir=None):
         if path == None:
             path = C.get('dirs.storage')
@@ -109,9 +116,20 @@ class Workplace(object):
                 logging.info('Have a break, this operation is slow...')
                 process('%s clone --mirror %s %s' % (C.get('git'), C.get('remotes.integration'), cacheIntegration))
 
-    def create(self, name=None, version='main', integration=False, useCacheAsRemote=False):
+    def cloneCachedRepository(self, branch, integration, dest):
+        """Clone a branch of the cached repository"""
+        cloneAsShared = C.get('useCacheAsUpstreamRemote') and C.get('useCacheAsSharedClone')
+        repository = self.getCachedRemote(integration)
+        process(
+            f'{C.get("git")} clone --branch {branch} --single-branch '
+            f'{"--shared" if cloneAsShared else ""} {repository} {dest}'
+        )
+
+    def create(self, name=None, version='main', integration=False, useCacheAsRemote=False, forceRefresh=False, usePool=True,
+               updateCache=True):
         """Creates a new instance of Moodle.
-        The parameter useCacheAsRemote has been deprecated.
+        The parameter useCacheAsRemote has been deprecated. When updateCache is False, the cached
+        repositories are expected to have been checked and updated beforehand.
         """
         if name == None:
             name = self.generateInstanceName(version, integration=integration)
@@ -126,15 +144,15 @@ class Workplace(object):
         linkDir = os.path.join(self.www, name)
         extraLinkDir = os.path.join(self.getMdkWebDir(), name)
 
-        # Check the cached clones and create them if necessary.
-        self.checkCachedClones(not integration, integration)
-        # Update the cached clones.
-        self.updateCachedClones(stable=not integration, integration=integration, verbose=False)
+        if updateCache:
+            # Check the cached clones and create them if necessary.
+            self.checkCachedClones(not integration, integration)
+            # Update the cached clones.
+            self.updateCachedClones(stable=not integration, integration=integration, verbose=False, force=forceRefresh)
 
         branch = stableBranch(version, git.Git(self.getCachedRemote(integration), C.get('git')))
 
         useCacheAsUpstream = C.get('useCacheAsUpstreamRemote')
-        cloneAsShared = useCacheAsUpstream and C.get('useCacheAsSharedClone')
 
         if self.isMoodle(name):
             raise CreateException('The Moodle instance %s already exists' % name)
@@ -146,14 +164,16 @@ class Workplace(object):
         mkdir(dataDir, 0o777)
         mkdir(extraDir, 0o777)
 
-        repository = self.getCachedRemote(integration)
-
-        # Clone the instances
-        logging.info('Cloning repository...')
-        process(
-            f'{C.get("git")} clone --branch {branch} --single-branch '
-            f'{"--shared" if cloneAsShared else ""} {repository} {sourceDir}'
-        )
+        # Claim a repository from the pool, or clone the instance.
+        pool = self.getPool()
+        claimed = usePool and pool.claim(branch, integration, sourceDir)
+        if claimed:
+            logging.info('Using a repository from the pool...')
+        else:
+            logging.info('Cloning repository...')
+            self.cloneCachedRepository(branch, integration, sourceDir)
+        if claimed and C.get('pool.refillInBackground'):
+            pool.refillInBackground()
 
         # Symbolic link
         if os.path.islink(linkDir):
@@ -178,23 +198,7 @@ class Workplace(object):
                 os.symlink(dataDir, linkDataDir)
 
         logging.info('Checking out branch...')
-        repo = git.Git(sourceDir, C.get('git'))
-
-        # Removing the default remote origin coming from the clone
-        repo.delRemote('origin')
-
-        # Setting up the correct remote names
-        repo.setRemote(C.get('myRemote'), C.get('remotes.mine'))
-        repo.setRemote(C.get('upstreamRemote'), repository)
-
-        # Creating, fetch, pulling branches
-        repo.fetch(C.get('upstreamRemote'))
-        track = '%s/%s' % (C.get('upstreamRemote'), branch)
-        if not repo.hasBranch(branch) and not repo.createBranch(branch, track):
-            logging.error('Could not create branch %s tracking %s' % (branch, track))
-        else:
-            repo.checkout(branch)
-        repo.pull(remote=C.get('upstreamRemote'))
+        repo = self.setUpRepository(sourceDir, branch, integration)
 
         # Fixing up remote URLs if need be, this is done after pulling the cache one because we
         # do not want to contact the real origin server from here, it is slow and pointless.
@@ -204,6 +208,7 @@ class Workplace(object):
                 repo.setRemote(C.get('upstreamRemote'), realupstream)
 
         M = self.get(name)
+        self.getIndex().refresh(name)
         return M
 
     def delete(self, name):
@@ -212,6 +217,9 @@ class Workplace(object):
         # Instantiating the object also checks if it exists
         M = self.get(name)
 
+        # Delete the snapshots, their databases are not removed with the extra directory.
+        self.deleteSnapshots(M)
+
         # Delete DB.
         dbname = M.get('dbname')
         if dbname:
@@ -237,6 +245,36 @@ class Workplace(object):
 
         # Deleting the whole thing
         shutil.rmtree(os.path.join(self.path, name))
+        self.getIndex().remove(name)
+
+    def deleteSnapshots(self, M):
+        """Delete the snapshots of an instance, and of its test environments"""
+        from .snapshot import InstanceSnapshots
+        from .testsnapshots import TestSnapshots
+        directory = self.getExtraDir(M.get('identifier'), 'snapshots')
+
+        instanceSnapshots = InstanceSnapshots(self, M)
+        for snapshot in instanceSnapshots.list():
+            try:
+                instanceSnapshots.delete(snapshot['name'])
+            except Exception as e:
+                logging.warning('Could not delete the snapshot %s: %s' % (snapshot['name'], e))
+
+        try:
+            kinds = [
+                ('phpunit', M.get('phpunit_prefix') or 'phpu_', M.container.phpunit_dataroot),
+                ('behat', M.get('behat_prefix') or 'zbehat_', M.container.behat_dataroot),
+            ]
+        except Exception as e:
+            logging.warning('Could not delete the snapshots of the test environments: %s' % e)
+            kinds = []
+        for kind, prefix, dataroot in kinds:
+            snapshots = TestSnapshots(M, kind, prefix, dataroot, directory)
+            for key in list(snapshots.getSnapshots().keys()):
+                try:
+                    snapshots.delete(key)
+                except Exception as e:
+                    logging.warning('Could not delete the snapshot %s of the %s environment: %s' % (key, kind, e))
 
     def generateInstanceName(self, version, integration=False, suffix='', identifier=None):
         """Creates a name (identifier) from arguments"""
@@ -315,6 +353,12 @@ class Workplace(object):
             mkdir(path, 0o777)
         return path
 
+    def getIndex(self) -> InstanceIndex:
+        """Return the index of the instances"""
+        if not self._index:
+            self._index = InstanceIndex(self, os.path.join(self.cache, 'instances.json'))
+        return self._index
+
     def getMdkWebDir(self):
         """Return (and create) the special MDK web directory."""
         mdkExtra = os.path.join(self.www, self.mdkDir)
@@ -345,6 +389,10 @@ class Workplace(object):
         else:
             return base
 
+    def getPool(self) -> RepositoryPool:
+        """Return the pool of repositories prepared for the creation of instances"""
+        return RepositoryPool(self)
+
     def getUrl(self, name, extra=None):
         """Return the URL to an instance, or to its extra directory if extra is passed"""
         base = '%s://%s' % (C.get('scheme'), C.get('host'))
@@ -378,17 +426,12 @@ class Workplace(object):
 
     def list(self, integration=None, stable=None):
         """Return the list of Moodle instances"""
-        dirs = os.listdir(self.path)
         names = []
-        for d in dirs:
-            if d == '.' or d == '..': continue
-            if not os.path.isdir(os.path.join(self.path, d)): continue
-            if not self.isMoodle(d): continue
+        for name, entry in sorted(self.getIndex().entries().items()):
             if integration != None or stable != None:
-                M = self.get(d)
-                if not integration and M.isIntegration(): continue
-                if not stable and M.isStable(): continue
-            names.append(d)
+                if not integration and entry['integration']: continue
+                if not stable and not entry['integration']: continue
+            names.append(name)
         return names
 
     def resolve(self, name=None, path=None, raise_exception=False) -> Optional[moodle.Moodle]:
@@ -454,8 +497,37 @@ class Workplace(object):
                 logging.info('Could not find instance called %s' % name)
         return result
 
-    def updateCachedClones(self, integration=True, stable=True, verbose=True):
-        """Update the cached clone of the repositories"""
+    def setUpRepository(self, path, branch, integration):
+        """Set up the remotes of a repository cloned from the cache, and check out its branch
+
+        This can be called again on a repository which was previously set up, to update it.
+        """
+        repository = self.getCachedRemote(integration)
+        repo = git.Git(path, C.get('git'))
+
+        # Removing the default remote origin coming from the clone
+        repo.delRemote('origin')
+
+        # Setting up the correct remote names
+        repo.setRemote(C.get('myRemote'), C.get('remotes.mine'))
+        repo.setRemote(C.get('upstreamRemote'), repository)
+
+        # Creating, fetch, pulling branches
+        repo.fetch(C.get('upstreamRemote'))
+        track = '%s/%s' % (C.get('upstreamRemote'), branch)
+        if not repo.hasBranch(branch) and not repo.createBranch(branch, track):
+            logging.error('Could not create branch %s tracking %s' % (branch, track))
+        else:
+            repo.checkout(branch)
+        repo.pull(remote=C.get('upstreamRemote'))
+        return repo
+
+    def updateCachedClones(self, integration=True, stable=True, verbose=True, force=False):
+        """Update the cached clone of the repositories
+
+        The repositories are fetched at the same time. Those which were fetched less than
+        cachedClonesFreshness minutes ago are skipped, unless force is set.
+        """
 
         caches = []
 
@@ -464,17 +536,60 @@ class Workplace(object):
         if stable:
             caches.append(os.path.join(self.cache, 'moodle.git'))
 
-        for cache in caches:
-            if not os.path.isdir(cache):
-                continue
+        caches = [cache for cache in caches if os.path.isdir(cache)]
+        fetchTimes = self._readFetchTimes()
 
-            repo = git.Git(cache, C.get('git'))
+        freshness = (C.get('cachedClonesFreshness') or 0) * 60
+        if not force and freshness > 0:
+            now = time.time()
+            for cache in list(caches):
+                lastFetch = fetchTimes.get(os.path.basename(cache))
+                if lastFetch and now - lastFetch < freshness:
+                    logging.debug('Skipping cached repository %s, fetched %d seconds ago', os.path.basename(cache),
+                                  now - lastFetch)
+                    caches.remove(cache)
+
+        if not caches:
+            return True
 
+        def fetch(cache, logger, stdio):
+            repo = git.Git(cache, C.get('git'))
             if verbose:
-                logging.info('Fetching cached repository %s...', os.path.basename(cache))
+                logger.info('Fetching cached repository %s...', os.path.basename(cache))
             else:
-                logging.debug('Fetching cached repository %s...', os.path.basename(cache))
-            if not repo.fetch():
+                logger.debug('Fetching cached repository %s...', os.path.basename(cache))
+            return repo.fetch(options=C.get('cachedClonesFetchOptions') or '')
+
+        start = time.time()
+        results = ParallelJobs(len(caches)).run(fetch, caches)
+
+        # Record when the repositories were fetched, before reporting any failure.
+        for cache, result in zip(caches, results):
+            if result is True:
+                fetchTimes[os.path.basename(cache)] = start
+        self._writeFetchTimes(fetchTimes)
+
+        for cache, result in zip(caches, results):
+            if result is not True:
                 raise Exception('Could not fetch in repository %s' % (cache))
 
         return True
+
+    def _readFetchTimes(self):
+        """Return the time at which each of the cached repositories was last fetched"""
+        try:
+            with open(os.path.join(self.cache, 'fetched.json'), 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _writeFetchTimes(self, fetchTimes):
+        """Save the time at which each of the cached repositories was last fetched"""
+        try:
+            fd, tmppath = tempfile.mkstemp(prefix='.fetched', dir=self.cache)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(fetchTimes, f)
+            os.replace(tmppath, os.path.join(self.cache, 'fetched.json'))
+        except OSError as e:
+            logging.debug('Could not save the fetch times of the cached repositories: %s' % e)